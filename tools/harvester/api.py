@@ -1,70 +1,237 @@
-"""4chan API client – rate-limited, retrying HTTP fetcher."""
+"""4chan API client – rate-limited, retrying HTTP fetcher.
+
+httpx is imported, and its client (connection pool, TLS context) built, on
+the first request, so constructing a FourChanAPI costs nothing.
+"""
 
 from __future__ import annotations
 
+import random
+import threading
 import time
 import logging
-from typing import Any
-
-import httpx
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, Protocol
+from urllib.parse import urlsplit
 
 from .config import FourChanConfig
+from .records import CatalogPage, Thread, decode
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger("harvester.api")
 
 
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateBudget(Protocol):
+    """Request pacing shared beyond this process (see jobs.SharedRateBudget)."""
+
+    def reserve(self, host: str) -> float:
+        """Claim the next request slot for *host*; returns seconds to wait."""
+        ...
+
+
+@dataclass
+class HostState:
+    """Adaptive request state for a single host."""
+    limit: float = 1.0            # AIMD concurrency window
+    inflight: int = 0
+    last_start: float = 0.0       # monotonic time of the last request start
+    cooldown_until: float = 0.0   # no new requests before this (backoff / Retry-After)
+    failures: int = 0             # consecutive 429/5xx/transport failures
+    open_until: float = 0.0       # circuit open until this time (0 = closed)
+    probing: bool = False         # half-open probe in flight
+    latency: float = 0.0          # EWMA of response latency
+
+
+class AdaptiveController:
+    """Per-host AIMD concurrency, jittered backoff and circuit breaking.
+
+    Thread-safe.  A host that is backing off or failing only blocks callers
+    waiting on that host; requests to other hosts proceed, and requests to a
+    host with an open circuit fail fast with CircuitOpenError.
+    """
+
+    def __init__(self, cfg: FourChanConfig) -> None:
+        self.cfg = cfg
+        self._cond = threading.Condition()
+        self._hosts: dict[str, HostState] = {}
+
+    def state(self, host: str) -> HostState:
+        with self._cond:
+            return self._hosts.setdefault(host, HostState())
+
+    def acquire(self, host: str) -> None:
+        """Block until a request to *host* may start."""
+        with self._cond:
+            st = self._hosts.setdefault(host, HostState())
+            while True:
+                now = time.monotonic()
+                half_open = False
+                if st.open_until:
+                    if now < st.open_until or st.probing:
+                        raise CircuitOpenError(f"circuit open for {host}")
+                    half_open = True  # let exactly one probe through
+                wait = max(st.cooldown_until, st.last_start + self.cfg.request_delay) - now
+                if wait <= 0 and st.inflight < max(int(st.limit), 1):
+                    st.inflight += 1
+                    st.last_start = now
+                    st.probing = half_open
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, host: str, latency: float, *, ok: bool, retry_after: float | None = None) -> None:
+        """Record a finished request and adapt the host's window."""
+        with self._cond:
+            st = self._hosts.setdefault(host, HostState())
+            st.inflight = max(st.inflight - 1, 0)
+            st.latency = latency if not st.latency else 0.8 * st.latency + 0.2 * latency
+            now = time.monotonic()
+            if ok:
+                st.failures = 0
+                st.open_until = 0.0
+                st.probing = False
+                if latency <= self.cfg.latency_target:
+                    st.limit = min(st.limit + 1.0 / st.limit, float(self.cfg.max_concurrency))
+                else:
+                    st.limit = max(st.limit * 0.5, 1.0)
+            else:
+                st.failures += 1
+                st.limit = max(st.limit * 0.5, 1.0)
+                if retry_after is not None:
+                    delay = min(retry_after, self.cfg.backoff_max)
+                else:
+                    ceiling = min(self.cfg.backoff_base * 2 ** (st.failures - 1), self.cfg.backoff_max)
+                    delay = random.uniform(ceiling / 2, ceiling)
+                st.cooldown_until = max(st.cooldown_until, now + delay)
+                if st.probing or st.failures >= self.cfg.breaker_threshold:
+                    if not st.open_until or st.probing:
+                        logger.warning("Circuit opened for %s after %d failures", host, st.failures)
+                    st.open_until = now + self.cfg.breaker_reset
+                    st.probing = False
+            self._cond.notify_all()
+
+    def cancel(self, host: str) -> None:
+        """Give back a slot whose request never got a response, without adapting."""
+        with self._cond:
+            st = self._hosts.setdefault(host, HostState())
+            st.inflight = max(st.inflight - 1, 0)
+            st.probing = False
+            self._cond.notify_all()
+
+
 class FourChanAPI:
     """Thin wrapper around the 4chan JSON API with rate limiting."""
 
-    def __init__(self, cfg: FourChanConfig | None = None) -> None:
+    def __init__(self, cfg: FourChanConfig | None = None, *, budget: RateBudget | None = None) -> None:
         self.cfg = cfg or FourChanConfig()
-        self._last_request: float = 0.0
-        self._client = httpx.Client(
-            timeout=self.cfg.timeout,
-            headers={"User-Agent": "ashchan-harvester/1.0 (+https://github.com/ashchane/ashchan)"},
-            follow_redirects=True,
-        )
-
-    # ── rate limiting ────────────────────────────────────────────
-    def _throttle(self) -> None:
-        elapsed = time.monotonic() - self._last_request
-        if elapsed < self.cfg.request_delay:
-            time.sleep(self.cfg.request_delay - elapsed)
-        self._last_request = time.monotonic()
+        self.controller = AdaptiveController(self.cfg)
+        # Optional cross-process budget, consulted after the local controller
+        self.budget = budget
+        self._http: httpx.Client | None = None
+        self._http_lock = threading.Lock()
 
-    def _get_json(self, url: str) -> Any:
+    @property
+    def _client(self) -> httpx.Client:
+        """The httpx client, created on first use."""
+        if self._http is None:
+            with self._http_lock:
+                if self._http is None:
+                    import httpx
+
+                    self._http = httpx.Client(
+                        http2=self._http2(),
+                        timeout=self.cfg.timeout,
+                        headers={"User-Agent": "ashchan-harvester/1.0 (+https://github.com/ashchane/ashchan)"},
+                        follow_redirects=True,
+                        limits=httpx.Limits(max_connections=self.cfg.max_concurrency * 4),
+                    )
+        return self._http
+
+    def _http2(self) -> bool:
+        if not self.cfg.http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            return False
+        return True
+
+    # ── adaptive request loop ────────────────────────────────────
+
+    def _request(self, url: str) -> httpx.Response | None:
+        """GET *url* with per-host pacing, retries and circuit breaking.
+
+        Returns None on 404.  429 and 5xx responses and transport errors are
+        retried after the host's backoff (honouring Retry-After); other 4xx
+        errors are raised immediately.
+        """
+        import httpx
+
+        host = urlsplit(url).hostname or ""
         for attempt in range(1, self.cfg.max_retries + 1):
-            self._throttle()
+            self.controller.acquire(host)
             try:
+                if self.budget is not None:
+                    wait = self.budget.reserve(host)
+                    if wait > 0:
+                        time.sleep(wait)
+                start = time.monotonic()
                 resp = self._client.get(url)
-                if resp.status_code == 404:
-                    logger.warning("404: %s", url)
-                    return None
-                resp.raise_for_status()
-                return resp.json()
-            except (httpx.HTTPStatusError, httpx.TransportError) as exc:
+            except httpx.TransportError as exc:
+                self.controller.release(host, time.monotonic() - start, ok=False)
                 logger.warning("Attempt %d/%d failed for %s: %s", attempt, self.cfg.max_retries, url, exc)
                 if attempt == self.cfg.max_retries:
                     raise
-                time.sleep(2 ** attempt)
+                continue
+            except BaseException:
+                # Not the host's fault (redirect loop, bad URL, interrupt): free the slot as is
+                self.controller.cancel(host)
+                raise
+            latency = time.monotonic() - start
+            if resp.status_code == 429 or resp.status_code >= 500:
+                retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+                self.controller.release(host, latency, ok=False, retry_after=retry_after)
+                logger.warning(
+                    "Attempt %d/%d failed for %s: HTTP %d", attempt, self.cfg.max_retries, url, resp.status_code
+                )
+                if attempt == self.cfg.max_retries:
+                    resp.raise_for_status()
+                continue
+            self.controller.release(host, latency, ok=True)
+            if resp.status_code == 404:
+                logger.warning("404: %s", url)
+                return None
+            resp.raise_for_status()
+            return resp
         return None  # unreachable but keeps mypy happy
 
+    def _get_json(self, url: str) -> Any:
+        resp = self._request(url)
+        return resp.json() if resp is not None else None
+
     def _get_bytes(self, url: str) -> bytes | None:
-        for attempt in range(1, self.cfg.max_retries + 1):
-            self._throttle()
-            try:
-                resp = self._client.get(url)
-                if resp.status_code == 404:
-                    logger.warning("404: %s", url)
-                    return None
-                resp.raise_for_status()
-                return resp.content
-            except (httpx.HTTPStatusError, httpx.TransportError) as exc:
-                logger.warning("Attempt %d/%d failed for %s: %s", attempt, self.cfg.max_retries, url, exc)
-                if attempt == self.cfg.max_retries:
-                    raise
-                time.sleep(2 ** attempt)
-        return None
+        resp = self._request(url)
+        return resp.content if resp is not None else None
 
     # ── public API ───────────────────────────────────────────────
 
@@ -73,19 +240,20 @@ class FourChanAPI:
         data = self._get_json(f"{self.cfg.api_base}/boards.json")
         return data.get("boards", []) if data else []
 
-    def get_catalog(self, board: str) -> list[dict]:
+    def get_catalog(self, board: str) -> list[CatalogPage]:
         """Fetch the catalog for a board (pages with threads)."""
-        data = self._get_json(f"{self.cfg.api_base}/{board}/catalog.json")
-        return data if data else []
+        data = self._get_bytes(f"{self.cfg.api_base}/{board}/catalog.json")
+        return decode(data, list[CatalogPage]) if data else []
 
     def get_thread_list(self, board: str) -> list[dict]:
         """Fetch threads.json for a board (lightweight thread list)."""
         data = self._get_json(f"{self.cfg.api_base}/{board}/threads.json")
         return data if data else []
 
-    def get_thread(self, board: str, thread_no: int) -> dict | None:
+    def get_thread(self, board: str, thread_no: int) -> Thread | None:
         """Fetch a full thread (OP + all replies)."""
-        return self._get_json(f"{self.cfg.api_base}/{board}/thread/{thread_no}.json")
+        data = self._get_bytes(f"{self.cfg.api_base}/{board}/thread/{thread_no}.json")
+        return decode(data, Thread) if data else None
 
     def get_archive(self, board: str) -> list[int]:
         """Fetch the archive list for a board."""
@@ -103,7 +271,8 @@ class FourChanAPI:
         return self._get_bytes(url)
 
     def close(self) -> None:
-        self._client.close()
+        if self._http is not None:
+            self._http.close()
 
     def __enter__(self) -> FourChanAPI:
         return self
@@ -0,0 +1,165 @@
+"""Varnish cache invalidation – purge and re-warm pages touched by imports.
+
+The harvester writes to Postgres directly, so none of the gateway's domain
+events fire and Varnish (config/varnish/default.vcl) would keep serving
+stale board and thread pages until their TTL runs out.  CacheInvalidator
+collects the boards and threads each transaction touched and, once it
+commits, sends PURGEs for the exact pages plus BANs for the board's API
+prefixes, then optionally GETs the most important pages so the first
+visitors hit a warm cache instead of all missing onto the origin at once.
+
+Commits are coalesced for ``batch_interval`` seconds and every request is
+paced to ``rate`` per second, so a bulk import becomes a steady trickle of
+invalidations rather than one burst per thread.  Failures are logged and
+never interrupt a harvest.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from .config import CacheConfig
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger("harvester.cache")
+
+# Board-level API prefixes banned whenever a board changes
+_API_BAN_PATTERNS = ("^/api/v1/4chan/{board}/", "^/api/v1/boards/{board}/")
+
+
+class CacheInvalidator:
+    """Collect touched pages per transaction and invalidate them after commit."""
+
+    def __init__(self, cfg: CacheConfig | None = None) -> None:
+        self.cfg = cfg or CacheConfig.from_env()
+        self.enabled = bool(self.cfg.varnish_url)
+        self.stats = {"purged": 0, "banned": 0, "warmed": 0, "failed": 0}
+        # Touched in the open transaction / committed but not yet sent;
+        # both map (board, thread_no) → posts written, thread_no 0 = board only
+        self._pending: Counter[tuple[str, int]] = Counter()
+        self._ready: Counter[tuple[str, int]] = Counter()
+        self._last_send = 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+        self._http: httpx.Client | None = None
+
+    @property
+    def _client(self) -> httpx.Client:
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.Client(
+                timeout=self.cfg.timeout,
+                headers={"User-Agent": "ashchan-harvester/1.0 (cache)"},
+            )
+        return self._http
+
+    # ── transaction hooks ────────────────────────────────────────
+
+    def touch(self, board: str, thread_no: int = 0, posts: int = 1) -> None:
+        """Record that the open transaction changed *board* (and *thread_no*)."""
+        if self.enabled:
+            with self._lock:
+                self._pending[(board, thread_no)] += posts
+
+    def committed(self) -> None:
+        """The open transaction committed; send its pages once the batch window has passed."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ready.update(self._pending)
+            self._pending.clear()
+        if time.monotonic() - self._last_send >= self.cfg.batch_interval:
+            self.flush()
+
+    def discard(self) -> None:
+        """The open transaction rolled back; nothing it touched changed."""
+        with self._lock:
+            self._pending.clear()
+
+    def mark(self) -> Counter[tuple[str, int]]:
+        """A point to rewind() to when a savepoint is rolled back."""
+        with self._lock:
+            return self._pending.copy()
+
+    def rewind(self, mark: Counter[tuple[str, int]]) -> None:
+        with self._lock:
+            self._pending = mark
+
+    def flush(self) -> None:
+        """Invalidate (and warm) everything committed so far, now."""
+        with self._lock:
+            batch, self._ready = self._ready, Counter()
+        self._last_send = time.monotonic()
+        if not batch:
+            return
+        boards: dict[str, Counter[int]] = {}
+        for (board, thread_no), posts in batch.items():
+            threads = boards.setdefault(board, Counter())
+            if thread_no:
+                threads[thread_no] += posts
+        for board, threads in boards.items():
+            self._invalidate(board, threads)
+        if self.cfg.warm:
+            for board, threads in boards.items():
+                self._warm(board, threads)
+        logger.debug("Cache flush: %d boards, %d threads", len(boards), sum(len(t) for t in boards.values()))
+
+    # ── requests ─────────────────────────────────────────────────
+
+    def _invalidate(self, board: str, threads: Counter[int]) -> None:
+        quoted = re.escape(board)
+        if len(threads) > self.cfg.ban_threshold:
+            # One ban for the whole board is cheaper than hundreds of purges
+            self._send("BAN", "/", {"X-Ban-Board": quoted})
+        else:
+            for path in (f"/{board}/", f"/{board}/catalog"):
+                self._send("PURGE", path)
+            for thread_no in sorted(threads):
+                self._send("PURGE", f"/{board}/thread/{thread_no}")
+        for pattern in _API_BAN_PATTERNS:
+            self._send("BAN", "/", {"X-Ban-Pattern": pattern.format(board=quoted)})
+
+    def _warm(self, board: str, threads: Counter[int]) -> None:
+        paths = [f"/{board}/", f"/{board}/catalog"]
+        paths += [f"/{board}/thread/{no}" for no, _ in threads.most_common(self.cfg.warm_threads)]
+        base = self.cfg.warm_url or self.cfg.varnish_url
+        for path in paths:
+            self._send("GET", path, base=base)
+
+    def _send(self, method: str, path: str, headers: dict[str, str] | None = None, *, base: str | None = None) -> None:
+        self._pace()
+        url = (base or self.cfg.varnish_url).rstrip("/") + path
+        try:
+            resp = self._client.request(method, url, headers=headers)
+        except Exception as exc:
+            logger.warning("%s %s failed: %s", method, url, exc)
+            self.stats["failed"] += 1
+            return
+        if resp.status_code >= 400:
+            logger.warning("%s %s returned %d", method, url, resp.status_code)
+            self.stats["failed"] += 1
+            return
+        self.stats[{"PURGE": "purged", "BAN": "banned", "GET": "warmed"}[method]] += 1
+
+    def _pace(self) -> None:
+        """Sleep until the next request slot (cfg.rate per second)."""
+        now = time.monotonic()
+        if self._next_slot > now:
+            time.sleep(self._next_slot - now)
+            now = self._next_slot
+        self._next_slot = now + 1.0 / self.cfg.rate
+
+    def close(self) -> None:
+        """Send anything still pending and release the HTTP client."""
+        if self.enabled:
+            self.flush()
+        if self._http is not None:
+            self._http.close()
@@ -3,20 +3,26 @@
 from __future__ import annotations
 
 import logging
+import re
 import sys
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
 
 import click
 from rich.console import Console
-from rich.logging import RichHandler
 from rich.table import Table
 
-from .config import HarvesterConfig, DatabaseConfig, DiskConfig, S3Config, FourChanConfig
-from .harvester import Harvester
+from .config import DEFAULT_THUMBNAILS, CacheConfig, DownloadConfig, EventsConfig, HarvesterConfig, DatabaseConfig, DiskConfig, MemoryConfig, S3Config, FourChanConfig, ThumbnailSpec
+
+if TYPE_CHECKING:
+    from .db import Database
 
 console = Console()
 
 
 def _setup_logging(verbose: bool) -> None:
+    from rich.logging import RichHandler
+
     level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(
         level=level,
@@ -33,6 +39,13 @@ def _setup_logging(verbose: bool) -> None:
     logging.getLogger("s3transfer").setLevel(logging.WARNING)
 
 
+def _parse_thumbs(ctx: click.Context, param: click.Parameter, value: str) -> tuple[ThumbnailSpec, ...]:
+    try:
+        return ThumbnailSpec.parse_list(value)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc)) from exc
+
+
 def _print_stats(stats: dict) -> None:
     table = Table(title="Harvest Summary", show_header=True, header_style="bold cyan")
     table.add_column("Metric", style="bold")
@@ -42,6 +55,47 @@ def _print_stats(stats: dict) -> None:
     console.print(table)
 
 
+def _utc(dt: datetime | None) -> datetime | None:
+    """click.DateTime values are naive; the CLI treats them as UTC."""
+    return dt.replace(tzinfo=timezone.utc) if dt else None
+
+
+def _warn_missing_indexes(db: Database, *names: str, command: str = "harvester indexes") -> None:
+    for name in db.missing_core_indexes(names):
+        console.print(f"[yellow]Index {name} is missing; run `{command}` to speed this up[/yellow]")
+    db.commit()
+
+
+class _WindowTime(click.ParamType):
+    """A UTC time: an absolute date/time, or a duration such as ``48h`` meaning that long ago."""
+
+    name = "time"
+    _AGO = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+    _UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+    def convert(self, value: object, param: click.Parameter | None, ctx: click.Context | None) -> datetime:
+        if isinstance(value, datetime):
+            return value
+        m = self._AGO.match(str(value).strip())
+        if m:
+            return datetime.now(timezone.utc) - timedelta(seconds=float(m.group(1)) * self._UNITS[m.group(2)])
+        return _utc(click.DateTime().convert(value, param, ctx))  # type: ignore[return-value]
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1000:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1000
+    return f"{n:.1f} TB"
+
+
+def _fmt_duration(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{secs:02d}s"
+
+
 @click.group()
 @click.option("--db-host", envvar="DB_HOST", default="localhost", help="PostgreSQL host")
 @click.option("--db-port", envvar="DB_PORT", default=5432, type=int, help="PostgreSQL port")
@@ -55,6 +109,28 @@ def _print_stats(stats: dict) -> None:
 @click.option("--storage", type=click.Choice(["disk", "s3"]), default="disk", help="Storage driver (default: disk)")
 @click.option("--media-path", envvar="MEDIA_PATH", default="/workspaces/ashchan/data/media", help="Local disk media path (for --storage disk)")
 @click.option("--media-url-prefix", envvar="MEDIA_URL_PREFIX", default="http://minio:9000/ashchan", help="URL prefix for media_url in DB")
+@click.option("--phash-reuse/--no-phash-reuse", envvar="PHASH_REUSE", default=False, help="Reuse stored media for near-identical images")
+@click.option("--phash-distance", envvar="PHASH_DISTANCE", default=3, type=int, help="Max pHash Hamming distance for --phash-reuse")
+@click.option("--thumbs", envvar="THUMBNAILS", default=DEFAULT_THUMBNAILS, callback=_parse_thumbs, help="Thumbnail variants as name:size:format:quality,...")
+@click.option("--thumb-optimize/--no-thumb-optimize", envvar="THUMB_OPTIMIZE", default=True, help="Extra encoder passes for smaller thumbnails")
+@click.option("--thumb-progressive/--no-thumb-progressive", envvar="THUMB_PROGRESSIVE", default=True, help="Progressive JPEG thumbnails")
+@click.option("--varnish-url", envvar="VARNISH_URL", default="", help="Varnish to PURGE/BAN after each commit (empty = off)")
+@click.option("--warm/--no-warm", envvar="VARNISH_WARM", default=False, help="GET touched board/thread pages after invalidating")
+@click.option("--warm-url", envvar="VARNISH_WARM_URL", default="", help="Base URL for warm-up GETs (default: --varnish-url)")
+@click.option("--warm-threads", default=5, type=int, help="Thread pages warmed per board, most-updated first")
+@click.option("--purge-rate", default=20.0, type=float, help="Max cache requests per second (purges + warm-ups)")
+@click.option("--events/--no-events", envvar="HARVESTER_EVENTS", default=False, help="Publish domain events to the Redis event bus")
+@click.option("--redis-host", envvar="REDIS_HOST", default="localhost", help="Event bus Redis host")
+@click.option("--redis-port", envvar="REDIS_PORT", default=6379, type=int, help="Event bus Redis port")
+@click.option("--redis-password", envvar="REDIS_AUTH", default=None, help="Event bus Redis password")
+@click.option("--events-db", envvar="EVENTS_REDIS_DB", default=6, type=int, help="Event bus Redis database")
+@click.option("--async-media/--no-async-media", envvar="HARVESTER_ASYNC_MEDIA", default=False, help="Commit posts first and download their media in the background")
+@click.option("--media-workers", default=4, type=int, help="Background media download threads")
+@click.option("--media-rate", envvar="MEDIA_RATE", default=0.0, type=float, help="Background media bandwidth cap in MB/s (0 = unlimited)")
+@click.option("--media-host-rate", envvar="MEDIA_HOST_RATE", default=0.0, type=float, help="Background media bandwidth cap per host in MB/s (0 = unlimited)")
+@click.option("--http2/--no-http2", envvar="HARVESTER_HTTP2", default=False, help="Use HTTP/2 to 4chan (needs h2)")
+@click.option("--memory-budget", envvar="HARVESTER_MEMORY_MB", default=0.0, type=float, help="Process RSS budget in MB (0 = 80% of the cgroup limit or RAM)")
+@click.option("--spill-dir", envvar="HARVESTER_SPILL_DIR", default=None, help="Where media is spilled under memory pressure (default: system temp)")
 @click.option("-v", "--verbose", is_flag=True, help="Enable debug logging")
 @click.pass_context
 def cli(ctx: click.Context, **kwargs: object) -> None:
@@ -66,6 +142,36 @@ def cli(ctx: click.Context, **kwargs: object) -> None:
     _setup_logging(bool(kwargs.pop("verbose")))
     ctx.ensure_object(dict)
     ctx.obj["storage_driver"] = kwargs.pop("storage")
+    ctx.obj["phash_reuse"] = kwargs.pop("phash_reuse")
+    ctx.obj["phash_distance"] = kwargs.pop("phash_distance")
+    ctx.obj["thumbs"] = kwargs.pop("thumbs")
+    ctx.obj["thumb_optimize"] = kwargs.pop("thumb_optimize")
+    ctx.obj["thumb_progressive"] = kwargs.pop("thumb_progressive")
+    ctx.obj["cache_cfg"] = CacheConfig(
+        varnish_url=kwargs.pop("varnish_url"),  # type: ignore[arg-type]
+        warm=kwargs.pop("warm"),  # type: ignore[arg-type]
+        warm_url=kwargs.pop("warm_url"),  # type: ignore[arg-type]
+        warm_threads=kwargs.pop("warm_threads"),  # type: ignore[arg-type]
+        rate=kwargs.pop("purge_rate"),  # type: ignore[arg-type]
+    )
+    ctx.obj["events_cfg"] = EventsConfig(
+        enabled=kwargs.pop("events"),  # type: ignore[arg-type]
+        host=kwargs.pop("redis_host"),  # type: ignore[arg-type]
+        port=kwargs.pop("redis_port"),  # type: ignore[arg-type]
+        password=kwargs.pop("redis_password"),  # type: ignore[arg-type]
+        db=kwargs.pop("events_db"),  # type: ignore[arg-type]
+    )
+    ctx.obj["downloads_cfg"] = DownloadConfig(
+        enabled=kwargs.pop("async_media"),  # type: ignore[arg-type]
+        workers=kwargs.pop("media_workers"),  # type: ignore[arg-type]
+        rate=kwargs.pop("media_rate") * 1e6,  # type: ignore[operator]
+        host_rate=kwargs.pop("media_host_rate") * 1e6,  # type: ignore[operator]
+    )
+    ctx.obj["memory_cfg"] = MemoryConfig(
+        budget=int(kwargs.pop("memory_budget") * 1e6),  # type: ignore[operator]
+        spill_dir=kwargs.pop("spill_dir"),  # type: ignore[arg-type]
+    )
+    ctx.obj["fourchan_cfg"] = FourChanConfig(http2=kwargs.pop("http2"))  # type: ignore[arg-type]
     ctx.obj["db_cfg"] = DatabaseConfig(
         host=kwargs["db_host"],  # type: ignore[arg-type]
         port=kwargs["db_port"],  # type: ignore[arg-type]
@@ -85,14 +191,27 @@ def cli(ctx: click.Context, **kwargs: object) -> None:
     )
 
 
-def _make_config(ctx: click.Context, *, images: bool = True, thumbs: bool = True, dry_run: bool = False) -> HarvesterConfig:
+def _make_config(
+    ctx: click.Context, *, images: bool = True, thumbs: bool = True, media_jobs: bool = False, dry_run: bool = False
+) -> HarvesterConfig:
     return HarvesterConfig(
         db=ctx.obj["db_cfg"],
         s3=ctx.obj["s3_cfg"],
         disk=ctx.obj["disk_cfg"],
+        cache=ctx.obj["cache_cfg"],
+        events=ctx.obj["events_cfg"],
+        downloads=ctx.obj["downloads_cfg"],
+        memory=ctx.obj["memory_cfg"],
+        fourchan=ctx.obj["fourchan_cfg"],
         storage_driver=ctx.obj["storage_driver"],
         download_images=images,
         generate_thumbnails=thumbs,
+        thumbnail_specs=ctx.obj["thumbs"],
+        thumbnail_optimize=ctx.obj["thumb_optimize"],
+        thumbnail_progressive=ctx.obj["thumb_progressive"],
+        phash_reuse=ctx.obj["phash_reuse"],
+        phash_max_distance=ctx.obj["phash_distance"],
+        media_jobs=media_jobs,
         dry_run=dry_run,
     )
 
@@ -112,6 +231,8 @@ def thread(ctx: click.Context, board: str, thread_no: int, no_images: bool, no_t
 
     Example: harvester thread g 12345678
     """
+    from .harvester import Harvester
+
     cfg = _make_config(ctx, images=not no_images, thumbs=not no_thumbs, dry_run=dry_run)
     with Harvester(cfg) as h:
         console.print(f"[bold]Harvesting [cyan]/{board}/{thread_no}[/cyan]...[/bold]")
@@ -130,10 +251,15 @@ def thread(ctx: click.Context, board: str, thread_no: int, no_images: bool, no_t
 @click.option("--dry-run", is_flag=True, help="Fetch & display data without writing to DB")
 @click.pass_context
 def catalog(ctx: click.Context, board: str, no_images: bool, dry_run: bool) -> None:
-    """Harvest the catalog for a board (OPs only).
+    """Harvest a board's catalog (OPs + last replies of every thread).
+
+    Existing threads are refreshed; threads still missing replies are
+    recorded so `harvester gaps` can fetch them in full later.
 
     Example: harvester catalog g
     """
+    from .harvester import Harvester
+
     cfg = _make_config(ctx, images=not no_images, dry_run=dry_run)
     with Harvester(cfg) as h:
         console.print(f"[bold]Harvesting catalog for [cyan]/{board}/[/cyan]...[/bold]")
@@ -142,23 +268,57 @@ def catalog(ctx: click.Context, board: str, no_images: bool, dry_run: bool) -> N
         _print_stats(h.stats)
 
 
+@cli.command()
+@click.argument("board")
+@click.option("--limit", default=0, type=int, help="Max threads to fetch (0 = all)")
+@click.option("--no-images", is_flag=True, help="Skip image downloads")
+@click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
+@click.pass_context
+def gaps(ctx: click.Context, board: str, limit: int, no_images: bool, no_thumbs: bool) -> None:
+    """Fully fetch threads that catalog harvests left incomplete.
+
+    Example: harvester gaps g --limit 50
+    """
+    from .harvester import Harvester
+
+    cfg = _make_config(ctx, images=not no_images, thumbs=not no_thumbs)
+    with Harvester(cfg) as h:
+        console.print(f"[bold]Filling thread gaps for [cyan]/{board}/[/cyan]...[/bold]")
+        count = h.harvest_gaps(board, limit=limit)
+        console.print(f"[green]✓[/green] Completed {count} threads from /{board}/")
+        _print_stats(h.stats)
+
+
 @cli.command()
 @click.argument("board")
 @click.option("--archive/--no-archive", default=False, help="Include archived threads")
 @click.option("--limit", default=0, type=int, help="Max threads to harvest (0 = all)")
+@click.option("--since", type=_WindowTime(), default=None, help="Only threads created at or after this time (UTC, or e.g. 48h ago)")
+@click.option("--until", type=_WindowTime(), default=None, help="Only threads created before this time (UTC, or e.g. 1d ago)")
 @click.option("--no-images", is_flag=True, help="Skip image downloads")
 @click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
 @click.option("--dry-run", is_flag=True, help="Fetch & display data without writing to DB")
+@click.option("--plan", "plan_path", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Harvest the work list of a plan saved by 'plan --save'")
 @click.pass_context
-def board(ctx: click.Context, board: str, archive: bool, limit: int, no_images: bool, no_thumbs: bool, dry_run: bool) -> None:
+def board(
+    ctx: click.Context, board: str, archive: bool, limit: int, since: datetime | None, until: datetime | None,
+    no_images: bool, no_thumbs: bool, dry_run: bool, plan_path: str | None,
+) -> None:
     """Harvest an entire board (all threads + full content).
 
     Example: harvester board g --limit 10
     """
+    from .harvester import Harvester
+    from .planner import HarvestPlan
+
+    thread_nos = HarvestPlan.load(plan_path).work_list(board) if plan_path else None
     cfg = _make_config(ctx, images=not no_images, thumbs=not no_thumbs, dry_run=dry_run)
     with Harvester(cfg) as h:
         console.print(f"[bold]Harvesting board [cyan]/{board}/[/cyan]...[/bold]")
-        count = h.harvest_board(board, include_archive=archive, limit=limit)
+        count = h.harvest_board(
+            board, include_archive=archive, limit=limit, since=since, until=until, thread_nos=thread_nos,
+        )
         console.print(f"[green]✓[/green] Imported {count} threads from /{board}/")
         _print_stats(h.stats)
 
@@ -167,23 +327,594 @@ def board(ctx: click.Context, board: str, archive: bool, limit: int, no_images:
 @click.argument("boards", nargs=-1, required=True)
 @click.option("--archive/--no-archive", default=False, help="Include archived threads")
 @click.option("--limit", default=0, type=int, help="Max threads per board (0 = all)")
+@click.option("--since", type=_WindowTime(), default=None, help="Only threads created at or after this time (UTC, or e.g. 48h ago)")
+@click.option("--until", type=_WindowTime(), default=None, help="Only threads created before this time (UTC, or e.g. 1d ago)")
 @click.option("--no-images", is_flag=True, help="Skip image downloads")
 @click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
+@click.option("--plan", "plan_path", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Harvest the work lists of a plan saved by 'plan --save'")
 @click.pass_context
-def multi(ctx: click.Context, boards: tuple[str, ...], archive: bool, limit: int, no_images: bool, no_thumbs: bool) -> None:
+def multi(
+    ctx: click.Context, boards: tuple[str, ...], archive: bool, limit: int, since: datetime | None,
+    until: datetime | None, no_images: bool, no_thumbs: bool, plan_path: str | None,
+) -> None:
     """Harvest multiple boards.
 
     Example: harvester multi g a v --limit 5
     """
+    from .harvester import Harvester
+    from .planner import HarvestPlan
+
+    plan = HarvestPlan.load(plan_path) if plan_path else None
     cfg = _make_config(ctx, images=not no_images, thumbs=not no_thumbs)
     with Harvester(cfg) as h:
         console.print(f"[bold]Harvesting {len(boards)} boards: {', '.join(f'/{b}/' for b in boards)}[/bold]")
-        results = h.harvest_boards(list(boards), include_archive=archive, limit=limit)
+        results = h.harvest_boards(
+            list(boards), plan=plan, include_archive=archive, limit=limit, since=since, until=until,
+        )
         for slug, count in results.items():
             console.print(f"  /{slug}/: {count} threads")
         _print_stats(h.stats)
 
 
+@cli.command()
+@click.argument("boards", nargs=-1, required=True)
+@click.option("--archive/--no-archive", default=False, help="Include archived threads")
+@click.option("--limit", default=0, type=int, help="Max threads per board (0 = all)")
+@click.option("--since", type=_WindowTime(), default=None, help="Only threads created at or after this time (UTC, or e.g. 48h ago)")
+@click.option("--until", type=_WindowTime(), default=None, help="Only threads created before this time (UTC, or e.g. 1d ago)")
+@click.option("--no-images", is_flag=True, help="Plan without image downloads")
+@click.option("--no-thumbs", is_flag=True, help="Plan without thumbnail generation")
+@click.option("--bandwidth", default=10.0, type=float, help="Assumed download rate in MB/s")
+@click.option("--save", "save_path", type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Write the plan to FILE for 'board/multi --plan'")
+@click.pass_context
+def plan(
+    ctx: click.Context, boards: tuple[str, ...], archive: bool, limit: int, since: datetime | None,
+    until: datetime | None, no_images: bool, no_thumbs: bool, bandwidth: float, save_path: str | None,
+) -> None:
+    """Estimate requests, bytes and time for harvesting BOARDS.
+
+    Example: harvester plan g v --archive --save nightly.json
+    """
+    from .harvester import Harvester
+    from .planner import HarvestPlanner
+
+    cfg = _make_config(ctx, images=not no_images, thumbs=not no_thumbs)
+    with Harvester(cfg) as h:
+        _warn_missing_indexes(h.db, "idx_harvester_posts_media_hash")
+        console.print(f"[bold]Planning {', '.join(f'/{b}/' for b in boards)}...[/bold]")
+        result = HarvestPlanner(
+            h, include_archive=archive, limit=limit, since=since, until=until,
+        ).plan(list(boards), bandwidth=bandwidth * 1e6)
+
+    table = Table(title="Harvest Plan", show_header=True, header_style="bold cyan")
+    for col in ("Board", "Threads", "Skipped", "Requests", "Download", "Storage growth", "Time"):
+        table.add_column(col, justify="left" if col == "Board" else "right")
+    rows = [(f"/{bp.board}/", bp) for bp in result.boards]
+    if len(rows) > 1:
+        rows.append(("Total", result.total()))
+    for label, bp in rows:
+        table.add_row(
+            label, f"{len(bp.threads)} ({bp.archived} archived)", str(bp.skipped), str(bp.requests),
+            _fmt_bytes(bp.download_bytes), _fmt_bytes(bp.new_bytes), _fmt_duration(result.seconds(bp)),
+        )
+    console.print(table)
+    estimated = result.total().estimated_bytes
+    if estimated:
+        console.print(f"[dim]{_fmt_bytes(estimated)} of the download is extrapolated from catalog averages[/dim]")
+    if save_path:
+        result.save(save_path)
+        console.print(f"[green]✓[/green] Saved plan to {save_path}")
+
+
+@cli.command()
+@click.argument("board")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--media-dir", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Local directory holding <tim><ext> media files (omit to skip images)")
+@click.option("--batch", "batch_size", default=100, type=int, help="Threads per database commit")
+@click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
+@click.pass_context
+def replay(ctx: click.Context, board: str, paths: tuple[str, ...], media_dir: str | None, batch_size: int, no_thumbs: bool) -> None:
+    """Import thread JSON from local dumps without touching the 4chan API.
+
+    PATHS may be .json/.jsonl files (optionally .gz/.bz2/.xz), tarballs,
+    or directories that are searched recursively.
+
+    Example: harvester replay g dumps/g/ --media-dir dumps/g/images
+    """
+    from .harvester import Harvester
+    from .replay import LocalMediaSource, iter_threads
+
+    cfg = _make_config(ctx, images=media_dir is not None, thumbs=not no_thumbs)
+    source = LocalMediaSource(media_dir) if media_dir else None
+    with Harvester(cfg, media_source=source) as h:
+        console.print(f"[bold]Replaying {len(paths)} source(s) into [cyan]/{board}/[/cyan]...[/bold]")
+        count = h.replay_threads(board, iter_threads(list(paths)), batch_size=batch_size)
+        console.print(f"[green]✓[/green] Replayed {count} threads into /{board}/")
+        _print_stats(h.stats)
+
+
+@cli.command(name="retry-media")
+@click.option("--batch", "batch_size", default=50, type=int, help="Queue entries per transaction")
+@click.option("--limit", default=0, type=int, help="Max entries to process (0 = all due)")
+@click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
+@click.pass_context
+def retry_media(ctx: click.Context, batch_size: int, limit: int, no_thumbs: bool) -> None:
+    """Retry failed media downloads/uploads and back-fill their posts.
+
+    Example: harvester retry-media --batch 100
+    """
+    from .harvester import Harvester
+
+    cfg = _make_config(ctx, thumbs=not no_thumbs)
+    with Harvester(cfg) as h:
+        console.print("[bold]Draining media retry queue...[/bold]")
+        count = h.retry_media(batch_size=batch_size, limit=limit)
+        console.print(f"[green]✓[/green] Back-filled media for {count} posts")
+        _print_stats(h.stats)
+
+
+@cli.command(name="retry-posts")
+@click.option("--batch", "batch_size", default=50, type=int, help="Quarantined posts per transaction")
+@click.option("--limit", default=0, type=int, help="Max posts to process (0 = all due)")
+@click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
+@click.pass_context
+def retry_posts(ctx: click.Context, batch_size: int, limit: int, no_thumbs: bool) -> None:
+    """Re-import posts quarantined during earlier harvests.
+
+    Example: harvester retry-posts --batch 100
+    """
+    from .harvester import Harvester
+
+    cfg = _make_config(ctx, thumbs=not no_thumbs)
+    with Harvester(cfg) as h:
+        console.print("[bold]Draining post quarantine...[/bold]")
+        count = h.retry_posts(batch_size=batch_size, limit=limit)
+        console.print(f"[green]✓[/green] Imported {count} quarantined posts")
+        _print_stats(h.stats)
+
+
+@cli.command()
+@click.argument("boards", nargs=-1, required=True)
+@click.option("--archive", is_flag=True, help="Also queue archived threads")
+@click.option("--limit", default=0, type=int, help="Max threads per board per refresh (0 = all)")
+@click.option("--every", default=0.0, type=float, help="Re-plan each board every N seconds (0 = once)")
+@click.pass_context
+def enqueue(ctx: click.Context, boards: tuple[str, ...], archive: bool, limit: int, every: float) -> None:
+    """Queue board refresh jobs for worker processes.
+
+    A refresh plans the board like `board` does and queues one job per thread.
+
+    Example: harvester enqueue g a v --archive
+    """
+    from .db import Database
+    from .jobs import JOB_REFRESH, REFRESH_PRIORITY
+
+    payload = {"archive": archive, "limit": limit, "every": every}
+    with Database(ctx.obj["db_cfg"]) as db:
+        for slug in boards:
+            added = db.enqueue_jobs(JOB_REFRESH, slug, [("", payload, REFRESH_PRIORITY)])
+            db.commit()
+            state = "[green]queued[/green]" if added else "[yellow]already queued[/yellow]"
+            console.print(f"/{slug}/ refresh {state}")
+
+
+@cli.command()
+@click.option("--id", "worker_id", default=None, help="Worker name (default: host:pid)")
+@click.option("--kinds", default="thread,media,refresh", help="Job kinds to run, comma-separated")
+@click.option("--egress", envvar="HARVESTER_EGRESS", default=None, help="Rate budget key (default: detected egress IP)")
+@click.option("--lease", default=300.0, type=float, help="Job lease in seconds (heartbeats renew it)")
+@click.option("--poll", default=5.0, type=float, help="Seconds to wait when the queue is empty")
+@click.option("--max-jobs", default=0, type=int, help="Stop after N jobs (0 = unlimited)")
+@click.option("--max-attempts", default=5, type=int, help="Attempts before a job is marked failed")
+@click.option("--exit-when-idle", is_flag=True, help="Stop when no job is due")
+@click.option("--inline-media", is_flag=True, help="Fetch media inside thread jobs instead of queueing media jobs")
+@click.option("--no-images", is_flag=True, help="Skip image downloads")
+@click.option("--no-thumbs", is_flag=True, help="Skip thumbnail generation")
+@click.pass_context
+def worker(
+    ctx: click.Context, worker_id: str | None, kinds: str, egress: str | None, lease: float, poll: float,
+    max_jobs: int, max_attempts: int, exit_when_idle: bool, inline_media: bool, no_images: bool, no_thumbs: bool,
+) -> None:
+    """Run jobs from the shared queue (see `enqueue`).
+
+    Start any number of workers, on one box or many, against the same
+    database; each thread is imported exactly once.
+
+    Example: harvester worker --exit-when-idle
+    """
+    import signal
+
+    from .harvester import Harvester
+    from .jobs import JOB_KINDS, Worker
+
+    kind_list = [k.strip() for k in kinds.split(",") if k.strip()]
+    unknown = set(kind_list) - set(JOB_KINDS)
+    if unknown:
+        raise click.BadParameter(f"unknown job kinds: {', '.join(sorted(unknown))}", param_hint="--kinds")
+    cfg = _make_config(ctx, images=not no_images, thumbs=not no_thumbs, media_jobs=not inline_media)
+    with Harvester(cfg) as h:
+        w = Worker(
+            h, worker_id=worker_id, kinds=kind_list, egress=egress,
+            lease_seconds=lease, poll_interval=poll, max_attempts=max_attempts,
+        )
+        signal.signal(signal.SIGTERM, lambda *_: w.stop())
+        try:
+            w.run(max_jobs=max_jobs, exit_when_idle=exit_when_idle)
+        except KeyboardInterrupt:
+            console.print("[yellow]Interrupted[/yellow]")
+        finally:
+            w.close()
+        _print_stats({**w.stats, **h.stats})
+
+
+@cli.command()
+@click.option("--purge", "purge_days", default=None, type=float, help="Delete done/failed jobs older than N days")
+@click.pass_context
+def jobs(ctx: click.Context, purge_days: float | None) -> None:
+    """Show the shared job queue.
+
+    Example: harvester jobs --purge 7
+    """
+    from .db import Database
+
+    with Database(ctx.obj["db_cfg"]) as db:
+        if purge_days is not None:
+            deleted = db.purge_jobs(purge_days)
+            db.commit()
+            console.print(f"[green]✓[/green] Purged {deleted} finished jobs")
+        rows = db.job_summary()
+    table = Table(title="Job Queue", show_header=True, header_style="bold cyan")
+    table.add_column("Kind", style="bold")
+    table.add_column("State")
+    table.add_column("Jobs", justify="right")
+    table.add_column("Next Run")
+    for r in rows:
+        next_run = f"{r['next_run']:%Y-%m-%d %H:%M:%S}" if r["state"] == "pending" and r["next_run"] else ""
+        table.add_row(r["kind"], r["state"], str(r["jobs"]), next_run)
+    console.print(table)
+
+
+@cli.command()
+@click.option("--publish", is_flag=True, help="Relay every pending event to the event bus now")
+@click.pass_context
+def events(ctx: click.Context, publish: bool) -> None:
+    """Show events waiting in the outbox, optionally publishing them.
+
+    Example: harvester --events events --publish
+    """
+    from .db import Database
+    from .events import EventOutbox
+
+    with Database(ctx.obj["db_cfg"]) as db:
+        if publish:
+            if not ctx.obj["events_cfg"].enabled:
+                console.print("[red]✗[/red] Event publishing is off (use --events or HARVESTER_EVENTS=true)")
+                sys.exit(1)
+            outbox = EventOutbox(db, ctx.obj["events_cfg"])
+            try:
+                sent = outbox.publish(force=True)
+            finally:
+                outbox.close()
+            console.print(f"[green]✓[/green] Published {sent} events")
+        rows = db.outbox_summary()
+    table = Table(title="Event Outbox", show_header=True, header_style="bold cyan")
+    table.add_column("Type", style="bold")
+    table.add_column("Pending", justify="right")
+    table.add_column("Oldest")
+    for r in rows:
+        table.add_row(r["event_type"], str(r["events"]), f"{r['oldest']:%Y-%m-%d %H:%M:%S}")
+    console.print(table)
+
+
+@cli.command(name="phash-backfill")
+@click.option("--batch", "batch_size", default=200, type=int, help="Media objects per transaction")
+@click.option("--limit", default=0, type=int, help="Max media objects to scan (0 = all)")
+@click.pass_context
+def phash_backfill(ctx: click.Context, batch_size: int, limit: int) -> None:
+    """Compute perceptual hashes for stored images that lack one.
+
+    Example: harvester phash-backfill --batch 500
+    """
+    from .harvester import Harvester
+
+    cfg = _make_config(ctx)
+    with Harvester(cfg) as h:
+        console.print("[bold]Backfilling media_objects.phash...[/bold]")
+        count = h.backfill_phash(batch_size=batch_size, limit=limit)
+        console.print(f"[green]✓[/green] Hashed {count} media objects")
+        _print_stats(h.stats)
+
+
+@cli.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--limit", default=10, type=int, help="Max matches to show")
+@click.pass_context
+def similar(ctx: click.Context, path: str, limit: int) -> None:
+    """List stored media that look like a local image file.
+
+    Example: harvester similar ~/Downloads/repost.jpg
+    """
+    import os
+
+    from .db import Database
+    from .phash import image_phash
+
+    with open(path, "rb") as fh:
+        phash = image_phash(fh.read(), os.path.splitext(path)[1])
+    if not phash:
+        console.print("[red]✗[/red] Could not hash image (is NumPy installed?)")
+        sys.exit(1)
+    with Database(ctx.obj["db_cfg"]) as db:
+        matches = db.find_near_duplicates(phash, ctx.obj["phash_distance"], limit=limit)
+    table = Table(title=f"Near duplicates of {phash}", show_header=True, header_style="bold cyan")
+    table.add_column("Media ID", justify="right")
+    table.add_column("Distance", justify="right")
+    table.add_column("Storage Key")
+    for m in matches:
+        table.add_row(str(m["id"]), str(m["distance"]), m["storage_key"] or "")
+    console.print(table)
+
+
+@cli.command()
+@click.option("--board", "boards", multiple=True, help="Only media posted on this board (repeatable)")
+@click.option("--since", type=click.DateTime(), default=None, help="Only media posted at or after this time (UTC)")
+@click.option("--until", type=click.DateTime(), default=None, help="Only media posted before this time (UTC)")
+@click.option("--mime", default=None, help="Only this MIME type, e.g. image/png or image/*")
+@click.option("--missing", "missing_only", is_flag=True, help="Only media with no thumbnails recorded")
+@click.option("--workers", default=0, type=int, help="Render processes (0 = CPU count)")
+@click.option("--batch", "batch_size", default=100, type=int, help="Media objects per transaction")
+@click.option("--limit", default=0, type=int, help="Max media objects to process (0 = all)")
+@click.option("--checkpoint", default="rethumb", help="Checkpoint name; separate runs resume independently")
+@click.option("--restart", is_flag=True, help="Ignore the saved checkpoint and start from the first media id")
+@click.pass_context
+def rethumb(
+    ctx: click.Context,
+    boards: tuple[str, ...],
+    since: datetime | None,
+    until: datetime | None,
+    mime: str | None,
+    missing_only: bool,
+    workers: int,
+    batch_size: int,
+    limit: int,
+    checkpoint: str,
+    restart: bool,
+) -> None:
+    """Regenerate thumbnails of stored media with the current --thumbs settings.
+
+    Example: harvester --thumbs catalog:250:avif:60 rethumb --board g --mime image/png
+    """
+    from .harvester import Harvester
+    from .rethumb import Rethumber
+
+    cfg = _make_config(ctx)
+    with Harvester(cfg) as h:
+        _warn_missing_indexes(h.db, "idx_harvester_posts_media_id")
+        console.print("[bold]Regenerating thumbnails...[/bold]")
+        count = Rethumber(
+            h, workers=workers or None, batch_size=batch_size, checkpoint=checkpoint, boards=boards,
+            since=_utc(since), until=_utc(until), mime=mime, missing_only=missing_only,
+        ).run(restart=restart, limit=limit)
+        console.print(f"[green]✓[/green] Re-thumbnailed {count} media objects")
+        _print_stats(h.stats)
+
+
+@cli.command()
+@click.option("--workers", default=8, type=int, help="Parallel listing/hashing workers")
+@click.option("--verify", is_flag=True, help="Re-hash originals and compare with hash_sha256")
+@click.option("--repair", is_flag=True, help="Delete old orphans and unlink missing thumbnails")
+@click.option("--grace", "grace_hours", default=24.0, type=float, help="Only delete orphans older than N hours")
+@click.option("--report", "report_path", type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Write each problem as a JSON line to FILE")
+@click.pass_context
+def reconcile(
+    ctx: click.Context, workers: int, verify: bool, repair: bool, grace_hours: float, report_path: str | None,
+) -> None:
+    """Compare stored media with media_objects; report or repair drift.
+
+    Example: harvester reconcile --verify --report drift.jsonl
+    """
+    from .harvester import Harvester
+    from .reconcile import Reconciler
+
+    cfg = _make_config(ctx)
+    report = open(report_path, "w") if report_path else None
+    try:
+        with Harvester(cfg) as h:
+            assert h.storage is not None
+            console.print(f"[bold]Reconciling {cfg.storage_driver} storage with media_objects...[/bold]")
+            stats = Reconciler(
+                h.db, h.storage,
+                workers=workers, verify=verify, repair=repair,
+                grace_seconds=grace_hours * 3600, report=report,
+            ).run()
+    finally:
+        if report is not None:
+            report.close()
+    table = Table(title="Reconciliation", show_header=True, header_style="bold cyan")
+    table.add_column("Metric", style="bold")
+    table.add_column("Count", justify="right")
+    for key, val in stats.items():
+        table.add_row(key.replace("_", " ").capitalize(), str(val))
+    console.print(table)
+    if stats["missing"] or stats["corrupt"]:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument("boards", nargs=-1, required=True)
+@click.option("--older-than", "before", type=_WindowTime(), default=None,
+              help="Prune threads last bumped before this time (UTC, or e.g. 30d ago)")
+@click.option("--keep", type=click.IntRange(min=1), default=None, help="Prune all but the N most recently bumped threads")
+@click.option("--batch", "batch_size", default=50, type=int, help="Threads deleted per transaction")
+@click.option("--pause", default=0.5, type=float, help="Seconds to wait between batches")
+@click.option("--lock-timeout", default=2.0, type=float, help="Give a batch up after waiting this long for a lock")
+@click.option("--dry-run", is_flag=True, help="Count what would be pruned without deleting")
+@click.pass_context
+def prune(
+    ctx: click.Context,
+    boards: tuple[str, ...],
+    before: datetime | None,
+    keep: int | None,
+    batch_size: int,
+    pause: float,
+    lock_timeout: float,
+    dry_run: bool,
+) -> None:
+    """Delete old threads from BOARDS, and media nothing else uses.
+
+    Example: harvester prune g v --older-than 90d --keep 20000
+    """
+    from .harvester import Harvester
+    from .prune import Pruner, RetentionPolicy
+
+    if before is None and keep is None:
+        raise click.UsageError("give --older-than, --keep or both")
+    cfg = _make_config(ctx)
+    policy = RetentionPolicy(before=before, keep=keep)
+    with Harvester(cfg) as h:
+        _warn_missing_indexes(h.db, "idx_harvester_posts_media_id")
+        console.print(f"[bold]{'Counting' if dry_run else 'Pruning'} old threads on {', '.join(boards)}...[/bold]")
+        stats = Pruner(
+            h, batch_size=batch_size, pause=pause, lock_timeout=lock_timeout, dry_run=dry_run,
+        ).run({slug: policy for slug in boards})
+    table = Table(title="Prune (dry run)" if dry_run else "Prune", show_header=True, header_style="bold cyan")
+    table.add_column("Metric", style="bold")
+    table.add_column("Count", justify="right")
+    for key, val in stats.items():
+        table.add_row(key.capitalize(), str(val))
+    console.print(table)
+
+
+@cli.command()
+@click.argument("out_dir", type=click.Path(file_okay=False))
+@click.option("--board", "boards", multiple=True, help="Only this board (repeatable; default: all)")
+@click.option("--since", type=_WindowTime(), default=None, help="Only rows created at or after this time (UTC, or e.g. 30d ago)")
+@click.option("--until", type=_WindowTime(), default=None, help="Only rows created before this time (UTC, or e.g. 1d ago)")
+@click.option("--tables", default="posts,threads,media", help="Tables to export, comma-separated")
+@click.option("--incremental", is_flag=True, help="Only rows new or changed since the last incremental export")
+@click.option("--checkpoint", default="export", help="Watermark name; separate exports track changes independently")
+@click.option("--reset", is_flag=True, help="Forget the watermark first (the next incremental export is full)")
+@click.option("--compression", default="zstd", type=click.Choice(["zstd", "snappy", "gzip", "none"]), help="Parquet compression")
+@click.option("--row-group", "row_group_size", default=65536, type=int, help="Rows per Parquet row group")
+@click.pass_context
+def export(
+    ctx: click.Context,
+    out_dir: str,
+    boards: tuple[str, ...],
+    since: datetime | None,
+    until: datetime | None,
+    tables: str,
+    incremental: bool,
+    checkpoint: str,
+    reset: bool,
+    compression: str,
+    row_group_size: int,
+) -> None:
+    """Export posts, threads and media to Parquet partitioned by board/month.
+
+    Example: harvester export /data/lake --board g --incremental
+    """
+    from .db import EXPORT_INDEXES, Database
+    from .export import Exporter
+    from .governor import MemoryGovernor
+
+    with Database(ctx.obj["db_cfg"]) as db:
+        if incremental:
+            _warn_missing_indexes(db, *EXPORT_INDEXES, command="harvester indexes --export")
+        exporter = Exporter(
+            db, out_dir,
+            tables=[t.strip() for t in tables.split(",") if t.strip()], boards=boards, since=since, until=until,
+            incremental=incremental, checkpoint=checkpoint, row_group_size=row_group_size, compression=compression,
+            governor=MemoryGovernor(ctx.obj["memory_cfg"]),
+        )
+        if reset:
+            exporter.reset()
+        console.print(f"[bold]Exporting to {out_dir}...[/bold]")
+        stats = exporter.run()
+    _print_stats(stats)
+
+
+@cli.command()
+@click.argument("boards", nargs=-1, required=True)
+@click.option("--threads", default=1000, type=int, help="Threads to generate per board")
+@click.option("--seed", default=0, type=int, help="Random seed; the same seed reproduces the same data")
+@click.option("--start", type=click.DateTime(), default="2024-01-01", help="Earliest thread creation time (UTC)")
+@click.option("--days", default=30.0, type=float, help="Spread thread creation over N days")
+@click.option("--replies", "replies_median", default=25.0, type=float, help="Median replies per thread")
+@click.option("--image-ratio", default=0.25, type=float, help="Share of replies with a file")
+@click.option("--media-pool", default=1000, type=int, help="Distinct media objects shared by all posts")
+@click.option("--placeholders", is_flag=True, help="Store generated placeholder images for the media pool")
+@click.option("--workers", default=0, type=int, help="Generator processes (0 = CPU count)")
+@click.option("--chunk", default=500, type=int, help="Threads per transaction")
+@click.pass_context
+def synth(
+    ctx: click.Context,
+    boards: tuple[str, ...],
+    threads: int,
+    seed: int,
+    start: datetime,
+    days: float,
+    replies_median: float,
+    image_ratio: float,
+    media_pool: int,
+    placeholders: bool,
+    workers: int,
+    chunk: int,
+) -> None:
+    """Fill BOARDS with deterministic synthetic threads for load testing.
+
+    Example: harvester synth g v --threads 50000 --seed 7 --placeholders
+    """
+    from .harvester import Harvester
+    from .synth import SynthParams, Synthesizer
+
+    params = SynthParams(
+        seed=seed, threads=threads, start=start.replace(tzinfo=timezone.utc), days=days,
+        replies_median=replies_median, image_ratio=image_ratio, chunk=chunk,
+    )
+    cfg = _make_config(ctx, images=placeholders)
+    with Harvester(cfg) as h:
+        console.print(f"[bold]Generating {threads} threads on /{'/, /'.join(boards)}/...[/bold]")
+        stats = Synthesizer(
+            h, params, media_pool=media_pool, placeholders=placeholders, workers=workers or None,
+        ).run(list(boards))
+        console.print(
+            f"[green]✓[/green] {stats['threads']} threads, {stats['posts']} posts, "
+            f"{stats['images']} images ({stats['media']} distinct media)"
+        )
+
+
+@cli.command()
+@click.option("--export", "for_export", is_flag=True, help="Also the updated_at indexes `export --incremental` needs")
+@click.option("--check", is_flag=True, help="Only report missing indexes; exit 1 if any")
+@click.pass_context
+def indexes(ctx: click.Context, for_export: bool, check: bool) -> None:
+    """Build the harvester's indexes on ashchan tables without blocking writes.
+
+    Run once after install or upgrade; the build uses CREATE INDEX CONCURRENTLY.
+
+    Example: harvester indexes
+    """
+    from .db import CORE_INDEXES, EXPORT_INDEXES, Database
+
+    names = [name for name in CORE_INDEXES if for_export or name not in EXPORT_INDEXES]
+    with Database(ctx.obj["db_cfg"]) as db:
+        missing = db.missing_core_indexes(names)
+        if check:
+            for name in missing:
+                console.print(f"[yellow]missing[/yellow] {name} on {CORE_INDEXES[name]}")
+            if missing:
+                raise SystemExit(1)
+            console.print("[green]✓[/green] All indexes present")
+            return
+        built = db.create_core_indexes(names)
+    console.print(f"[green]✓[/green] Built {len(built)} indexes ({len(names) - len(built)} already present)")
+
+
 @cli.command(name="list-boards")
 @click.pass_context
 def list_boards(ctx: click.Context) -> None:
@@ -224,16 +955,16 @@ def preview(ctx: click.Context, board: str, limit: int) -> None:
 
         count = 0
         for page in catalog_data:
-            for t in page.get("threads", []):
+            for t in page.threads:
                 if count >= limit:
                     break
-                sub = (t.get("sub") or t.get("com", ""))[:40]
-                has_file = "✓" if t.get("tim") else ""
+                sub = (t.sub or t.com or "")[:40]
+                has_file = "✓" if t.tim else ""
                 table.add_row(
-                    str(t["no"]),
+                    str(t.no),
                     sub,
-                    str(t.get("replies", 0)),
-                    str(t.get("images", 0)),
+                    str(t.replies),
+                    str(t.images),
                     has_file,
                 )
                 count += 1
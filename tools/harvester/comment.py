@@ -0,0 +1,244 @@
+"""4chan comment parser – plain text, ashchan HTML and quote targets in one pass.
+
+4chan's ``com`` field is HTML.  Ashchan stores the poster's *source* text in
+``posts.content`` (``>>123`` quotes, ``>greentext``, ``[spoiler]``/``[code]``
+markup – see ContentFormatter in boards-threads-posts) and the rendered form
+in ``posts.content_html``.  parse_comment() produces both from ``com`` with a
+single regex-driven scan, plus the list of quoted post numbers so reply /
+backlink maps can be built at import time.
+
+Run ``python -m harvester.comment [thread.json ...]`` for a throughput benchmark.
+"""
+
+from __future__ import annotations
+
+import html
+import re
+from typing import NamedTuple
+
+# One token per match: a tag (closing flag, name, attributes) or a text run
+_TOKEN = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*)>|([^<]+|<)")
+_CLASS = re.compile(r"""class\s*=\s*["']([^"']*)["']""")
+_HREF = re.compile(r"""href\s*=\s*["']([^"']*)["']""")
+_POST_NO = re.compile(r"#p(\d+)$")
+_QUOTE_NO = re.compile(r"^>>(\d+)")
+_URL = re.compile(r"(https?://[^\s<>\[\]\"']+)", re.IGNORECASE)
+_BOARD_HOST = re.compile(r"^(?:https?:)?//boards\.4chan(?:nel)?\.org")
+
+# Tags rendered as-is (attributes dropped); everything else is unwrapped
+_KEEP_TAGS = frozenset({"b", "i", "u", "strong", "em"})
+
+
+class ParsedComment(NamedTuple):
+    text: str          # ashchan source text for posts.content
+    html: str          # normalized ashchan HTML for posts.content_html
+    quotes: list[int]  # quoted post numbers, first-seen order, no duplicates
+
+
+def _escape(text: str) -> str:
+    # Same output as PHP htmlspecialchars(ENT_QUOTES), which ContentFormatter uses
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("'", "&#039;")
+    )
+
+
+def _linkify(escaped: str) -> str:
+    if "http" not in escaped:
+        return escaped
+    return _URL.sub(r'<a href="\1" target="_blank" rel="noopener noreferrer">\1</a>', escaped)
+
+
+def _normalize_href(href: str) -> str:
+    """Rewrite 4chan board URLs to ashchan-relative paths."""
+    href = html.unescape(href) if "&" in href else href
+    return _BOARD_HOST.sub("", href) or "/"
+
+
+def parse_comment(com: str | None) -> ParsedComment:
+    """Parse a 4chan ``com`` HTML fragment."""
+    if not com:
+        return ParsedComment("", "", [])
+
+    text_out: list[str] = []
+    html_out: list[str] = []
+    quotes: list[int] = []
+    seen: set[int] = set()
+
+    pending: list[str] = []   # unescaped text since the last structural tag
+    closers: list[tuple[str, str]] = []  # (html, text) closers of open tags
+    link_href: str | None = None
+    link_text: list[str] = []
+    skip_depth = 0            # >0 while inside a dropped subtree (catalog "abbr")
+    in_pre = False
+
+    def add_quote(no: int) -> None:
+        if no not in seen:
+            seen.add(no)
+            quotes.append(no)
+
+    def flush() -> None:
+        if pending:
+            chunk = "".join(pending)
+            pending.clear()
+            text_out.append(chunk)
+            html_out.append(_escape(chunk) if in_pre else _linkify(_escape(chunk)))
+
+    for m in _TOKEN.finditer(com):
+        raw = m.group(4)
+        if raw is not None:
+            if skip_depth:
+                continue
+            if "&" in raw:
+                raw = html.unescape(raw)
+            if link_href is not None:
+                link_text.append(raw)
+            else:
+                pending.append(raw)
+            continue
+
+        closing, name, attrs = m.group(1), m.group(2).lower(), m.group(3)
+
+        if skip_depth:
+            if name == "span":
+                skip_depth += -1 if closing else 1
+            continue
+
+        if name == "wbr":
+            continue
+        if name == "br":
+            if link_href is not None:
+                link_text.append("\n")
+            else:
+                flush()
+                text_out.append("\n")
+                html_out.append("<br>")
+            continue
+
+        if name == "a":
+            if not closing:
+                flush()
+                href = _HREF.search(attrs)
+                link_href = _normalize_href(href.group(1)) if href else ""
+                link_text = []
+            elif link_href is not None:
+                label = "".join(link_text)
+                text_out.append(label)
+                qm = _POST_NO.search(link_href)
+                if qm:
+                    add_quote(int(qm.group(1)))
+                if link_href:
+                    html_out.append(f'<a href="{_escape(link_href)}" class="quotelink">{_escape(label)}</a>')
+                else:
+                    html_out.append(_escape(label))
+                link_href = None
+            continue
+
+        flush()
+        if closing:
+            if closers:
+                h, t = closers.pop()
+                html_out.append(h)
+                text_out.append(t)
+                if name == "pre":
+                    in_pre = False
+            continue
+
+        cls = _CLASS.search(attrs)
+        klass = cls.group(1) if cls else ""
+        if name == "span":
+            if klass == "abbr":
+                skip_depth = 1
+            elif klass in ("quote", "deadlink"):
+                html_out.append(f'<span class="{klass}">')
+                closers.append(("</span>", ""))
+                if klass == "deadlink":
+                    # The dead target only appears in the text: ">>123"
+                    rest = com[m.end():m.end() + 40]
+                    qm = _QUOTE_NO.match(html.unescape(rest))
+                    if qm:
+                        add_quote(int(qm.group(1)))
+            else:
+                closers.append(("", ""))
+        elif name == "s":
+            html_out.append("<s>")
+            text_out.append("[spoiler]")
+            closers.append(("</s>", "[/spoiler]"))
+        elif name == "pre":
+            in_pre = True
+            html_out.append('<pre class="prettyprint">')
+            text_out.append("[code]")
+            closers.append(("</pre>", "[/code]"))
+        elif name in _KEEP_TAGS:
+            html_out.append(f"<{name}>")
+            closers.append((f"</{name}>", ""))
+        else:
+            closers.append(("", ""))
+
+    if link_href is not None:
+        pending.extend(link_text)
+    flush()
+    while closers:
+        h, t = closers.pop()
+        html_out.append(h)
+        text_out.append(t)
+    return ParsedComment("".join(text_out), "".join(html_out), quotes)
+
+
+def backlink_map(quotes_by_post: dict[int, list[int]]) -> dict[int, list[int]]:
+    """Invert {post_no: quoted post_nos} into {post_no: post_nos quoting it}.
+
+    Only targets that are keys of *quotes_by_post* (i.e. in the same batch)
+    are included.
+    """
+    backlinks: dict[int, list[int]] = {}
+    for post_no, targets in quotes_by_post.items():
+        for target in targets:
+            if target in quotes_by_post and target != post_no:
+                backlinks.setdefault(target, []).append(post_no)
+    return backlinks
+
+
+# ── benchmark ────────────────────────────────────────────────────
+
+_SAMPLE_COMS = [
+    '<a href="#p100000001" class="quotelink">&gt;&gt;100000001</a><br>'
+    "Have you tried turning it off and on again? It&#039;s the first thing "
+    "anyone should do.<br><span class=\"quote\">&gt;implying</span>",
+    '<span class="quote">&gt;be me</span><br><span class="quote">&gt;write parser</span><br>'
+    "<s>it was fast</s> <a href=\"/g/thread/99999#p100000002\" class=\"quotelink\">&gt;&gt;100000002</a>",
+    '<pre class="prettyprint">def f(x):<br>    return x &lt; 3 &amp;&amp; y</pre><br>'
+    "see https://example.com/some/very<wbr>long/path for details",
+    "<span class=\"deadlink\">&gt;&gt;100000003</span><br>"
+    "<strong style=\"color: red;\">(USER WAS BANNED FOR THIS POST)</strong>",
+]
+
+
+def _bench(paths: list[str], seconds: float = 2.0) -> None:
+    import json
+    import time
+
+    coms: list[str] = []
+    for path in paths:
+        with open(path, "rb") as fh:
+            data = json.load(fh)
+        coms.extend(p.get("com", "") for p in data.get("posts", []))
+    if not coms:
+        coms = _SAMPLE_COMS * 250
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for com in coms:
+            parse_comment(com)
+        n += len(coms)
+    elapsed = time.perf_counter() - start
+    print(f"{n} comments in {elapsed:.2f}s: {n / elapsed:,.0f} posts/s")
+
+
+if __name__ == "__main__":
+    import sys
+
+    _bench(sys.argv[1:])
@@ -54,9 +54,17 @@ class FourChanConfig:
     api_base: str = "https://a.4cdn.org"
     image_base: str = "https://i.4cdn.org"
     thumb_base: str = "https://i.4cdn.org"
-    request_delay: float = 1.1  # seconds between API requests
+    request_delay: float = 1.1  # minimum seconds between requests to the same host
     max_retries: int = 3
     timeout: float = 30.0
+    # Adaptive per-host concurrency (AIMD) and backoff
+    max_concurrency: int = 4        # upper bound on in-flight requests per host
+    latency_target: float = 2.0     # seconds; slower responses shrink the window
+    backoff_base: float = 1.0       # first retry delay when no Retry-After is sent
+    backoff_max: float = 60.0       # cap on backoff and honoured Retry-After
+    breaker_threshold: int = 5      # consecutive failures that open a host's circuit
+    breaker_reset: float = 60.0     # seconds before an open circuit lets a probe through
+    http2: bool = False             # multiplex requests per host over HTTP/2 (needs h2)
 
 
 @dataclass(frozen=True)
@@ -74,14 +82,151 @@ class DiskConfig:
         )
 
 
+@dataclass(frozen=True)
+class CacheConfig:
+    """Varnish invalidation and warm-up after imports (see cache.CacheInvalidator)."""
+    varnish_url: str = ""          # PURGE/BAN endpoint; empty disables invalidation
+    warm: bool = False             # GET the most important touched pages after invalidating
+    warm_url: str = ""             # base URL for warm-up GETs (default: varnish_url)
+    warm_threads: int = 5          # thread pages warmed per board, most-updated first
+    rate: float = 20.0             # requests per second, invalidations and warm-ups combined
+    batch_interval: float = 5.0    # seconds of commits coalesced into one batch
+    ban_threshold: int = 50        # touched threads per board above which the board is banned instead
+    timeout: float = 5.0
+
+    @classmethod
+    def from_env(cls) -> CacheConfig:
+        return cls(
+            varnish_url=os.getenv("VARNISH_URL", ""),
+            warm=os.getenv("VARNISH_WARM", "false").lower() == "true",
+            warm_url=os.getenv("VARNISH_WARM_URL", ""),
+        )
+
+
+@dataclass(frozen=True)
+class EventsConfig:
+    """Redis Streams event bus (same connection settings as the services' ``events`` pool)."""
+    enabled: bool = False
+    host: str = "localhost"
+    port: int = 6379
+    db: int = 6
+    password: str | None = None
+    stream: str = "ashchan:events"
+    maxlen: int = 100_000          # approximate (~) trim, as EventPublisher does
+    batch_size: int = 500          # events per pipelined XADD round trip
+
+    @classmethod
+    def from_env(cls) -> EventsConfig:
+        return cls(
+            enabled=os.getenv("HARVESTER_EVENTS", "false").lower() == "true",
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", "6379")),
+            db=int(os.getenv("EVENTS_REDIS_DB", "6")),
+            password=os.getenv("REDIS_AUTH") or None,
+        )
+
+
+@dataclass(frozen=True)
+class DownloadConfig:
+    """Background media downloads (see downloads.MediaScheduler)."""
+    enabled: bool = False          # commit posts first, fill in media as files arrive
+    workers: int = 4               # download threads
+    rate: float = 0.0              # bytes/s across all hosts; 0 = unlimited
+    host_rate: float = 0.0         # bytes/s per host; 0 = unlimited
+    buffer: int = 32               # downloaded files held before the harvester stores them
+
+    @classmethod
+    def from_env(cls) -> DownloadConfig:
+        return cls(
+            enabled=os.getenv("HARVESTER_ASYNC_MEDIA", "false").lower() == "true",
+            rate=float(os.getenv("MEDIA_RATE", "0")) * 1e6,
+            host_rate=float(os.getenv("MEDIA_HOST_RATE", "0")) * 1e6,
+        )
+
+
+@dataclass(frozen=True)
+class MemoryConfig:
+    """Process memory budget (see governor.MemoryGovernor)."""
+    budget: int = 0                # bytes of RSS; 0 = 80% of the cgroup limit or physical RAM
+    inflight_ratio: float = 0.5    # share of the budget media bytes in flight may reserve
+    soft_ratio: float = 0.85       # above this share of the budget, buffers spill to disk
+    spill_dir: str | None = None   # temp directory for spilled media (default: system temp)
+
+    @classmethod
+    def from_env(cls) -> MemoryConfig:
+        return cls(
+            budget=int(float(os.getenv("HARVESTER_MEMORY_MB", "0")) * 1e6),
+            spill_dir=os.getenv("HARVESTER_SPILL_DIR") or None,
+        )
+
+
+THUMBNAIL_FORMATS = ("webp", "avif", "jpeg", "png")
+
+# catalog/reply sizes in WebP, plus a JPEG that fills the legacy thumb_url column
+DEFAULT_THUMBNAILS = "catalog:250:webp:80,reply:125:webp:80,catalog:250:jpeg:85"
+
+
+@dataclass(frozen=True)
+class ThumbnailSpec:
+    """One thumbnail variant: a bounding box, an encoding and its quality."""
+    name: str            # variant label the frontend picks by, e.g. "catalog"
+    max_size: int        # longest edge in pixels
+    format: str = "webp"  # one of THUMBNAIL_FORMATS
+    quality: int = 80    # 1–100; ignored for PNG
+
+    @classmethod
+    def parse(cls, text: str) -> ThumbnailSpec:
+        """Parse ``name:max_size[:format[:quality]]``, e.g. ``catalog:250:webp:80``."""
+        parts = text.strip().split(":")
+        if not 2 <= len(parts) <= 4 or not parts[0]:
+            raise ValueError(f"invalid thumbnail spec {text!r} (want name:size[:format[:quality]])")
+        try:
+            spec = cls(
+                name=parts[0],
+                max_size=int(parts[1]),
+                format=parts[2].lower() if len(parts) > 2 else "webp",
+                quality=int(parts[3]) if len(parts) > 3 else 80,
+            )
+        except ValueError:
+            raise ValueError(f"invalid size or quality in thumbnail spec {text!r}") from None
+        if spec.format == "jpg":
+            spec = cls(spec.name, spec.max_size, "jpeg", spec.quality)
+        if spec.format not in THUMBNAIL_FORMATS:
+            raise ValueError(f"unknown thumbnail format {spec.format!r}")
+        if spec.max_size <= 0 or not 1 <= spec.quality <= 100:
+            raise ValueError(f"invalid size or quality in thumbnail spec {text!r}")
+        return spec
+
+    @classmethod
+    def parse_list(cls, text: str) -> tuple[ThumbnailSpec, ...]:
+        """Parse a comma-separated list of specs (see parse())."""
+        return tuple(cls.parse(part) for part in text.split(",") if part.strip())
+
+
 @dataclass
 class HarvesterConfig:
     db: DatabaseConfig = field(default_factory=DatabaseConfig.from_env)
     s3: S3Config = field(default_factory=S3Config.from_env)
     disk: DiskConfig = field(default_factory=DiskConfig.from_env)
     fourchan: FourChanConfig = field(default_factory=FourChanConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig.from_env)
+    events: EventsConfig = field(default_factory=EventsConfig.from_env)
+    downloads: DownloadConfig = field(default_factory=DownloadConfig.from_env)
+    memory: MemoryConfig = field(default_factory=MemoryConfig.from_env)
     storage_driver: str = "disk"  # "disk" or "s3"
     download_images: bool = True
     generate_thumbnails: bool = True
-    thumbnail_max_size: int = 250
+    thumbnail_specs: tuple[ThumbnailSpec, ...] = field(
+        default_factory=lambda: ThumbnailSpec.parse_list(DEFAULT_THUMBNAILS)
+    )
+    thumbnail_optimize: bool = True     # extra encoder passes (JPEG/PNG optimize, WebP method 6)
+    thumbnail_progressive: bool = True  # progressive JPEG
+    media_retry_max_attempts: int = 8     # failed media is given up after this many retries
+    media_retry_base_delay: float = 300.0  # seconds; doubles per attempt, capped at a day
+    post_retry_max_attempts: int = 5      # quarantined posts are given up after this many retries
+    post_retry_base_delay: float = 600.0  # seconds; doubles per attempt, capped at a day
+    compute_phash: bool = True       # fill media_objects.phash (needs NumPy)
+    phash_reuse: bool = False        # reuse stored media for near-identical files
+    phash_max_distance: int = 3      # Hamming bits; ≤ PHASH_CHUNKS - 1 for exhaustive lookup
+    media_jobs: bool = False         # queue media as harvester_jobs instead of fetching inline
     dry_run: bool = False
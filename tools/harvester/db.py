@@ -3,16 +3,156 @@
 from __future__ import annotations
 
 import logging
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Iterable, Iterator, Sequence
 
 import psycopg
+from psycopg.pq import TransactionStatus
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
 
 from .config import DatabaseConfig
+from .phash import PHASH_CHUNKS, phash_chunks
+from .records import Media, MediaRef, PostRow
 
 logger = logging.getLogger("harvester.db")
 
+# Bookkeeping tables owned by the harvester (not part of db/install.sql).
+# Created on first connect; every statement must be idempotent.
+HARVESTER_SCHEMA: list[str] = [
+    """CREATE TABLE IF NOT EXISTS harvester_thread_gaps (
+           thread_id BIGINT PRIMARY KEY REFERENCES threads(id) ON DELETE CASCADE,
+           board_id INTEGER NOT NULL REFERENCES boards(id) ON DELETE CASCADE,
+           expected_replies INTEGER NOT NULL,
+           stored_replies INTEGER NOT NULL,
+           updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_harvester_thread_gaps_board ON harvester_thread_gaps(board_id)",
+    """CREATE TABLE IF NOT EXISTS harvester_media_retries (
+           id BIGSERIAL PRIMARY KEY,
+           board_slug VARCHAR(32) NOT NULL,
+           thread_id BIGINT NOT NULL,
+           board_post_no BIGINT NOT NULL,
+           tim BIGINT NOT NULL,
+           ext VARCHAR(16) NOT NULL,
+           filename TEXT,
+           md5 VARCHAR(64),
+           fsize INTEGER,
+           width INTEGER,
+           height INTEGER,
+           attempts INTEGER NOT NULL DEFAULT 0,
+           next_retry_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           last_error TEXT,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           UNIQUE (board_post_no, thread_id)
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_harvester_media_retries_due ON harvester_media_retries(next_retry_at)",
+    # Posts the database rejected, set aside so the rest of their thread commits
+    """CREATE TABLE IF NOT EXISTS harvester_post_quarantine (
+           id BIGSERIAL PRIMARY KEY,
+           board_slug VARCHAR(32) NOT NULL,
+           thread_id BIGINT NOT NULL,
+           board_post_no BIGINT NOT NULL,
+           post JSONB NOT NULL,
+           media JSONB,
+           attempts INTEGER NOT NULL DEFAULT 0,
+           next_retry_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           last_error TEXT,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           UNIQUE (thread_id, board_post_no)
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_harvester_post_quarantine_due ON harvester_post_quarantine(next_retry_at)",
+    # Multi-index hashing over media_objects.phash (see harvester.phash)
+    """CREATE TABLE IF NOT EXISTS harvester_phash_index (
+           chunk SMALLINT NOT NULL,
+           value INTEGER NOT NULL,
+           media_id INTEGER NOT NULL REFERENCES media_objects(id) ON DELETE CASCADE,
+           PRIMARY KEY (chunk, value, media_id)
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_harvester_phash_index_media ON harvester_phash_index(media_id)",
+    # Every thumbnail variant of a media object; thumb_key holds the fallback one
+    """CREATE TABLE IF NOT EXISTS harvester_media_thumbnails (
+           media_id INTEGER NOT NULL REFERENCES media_objects(id) ON DELETE CASCADE,
+           name VARCHAR(32) NOT NULL,
+           mime_type VARCHAR(64) NOT NULL,
+           storage_key TEXT NOT NULL,
+           width INTEGER,
+           height INTEGER,
+           file_size INTEGER,
+           PRIMARY KEY (media_id, name, mime_type)
+       )""",
+    # Video duration/codec read from container headers (see storage.probe_media)
+    """CREATE TABLE IF NOT EXISTS harvester_media_info (
+           media_id INTEGER PRIMARY KEY REFERENCES media_objects(id) ON DELETE CASCADE,
+           duration REAL,
+           codec VARCHAR(32)
+       )""",
+    # Distributed work queue shared by `harvester worker` processes
+    """CREATE TABLE IF NOT EXISTS harvester_jobs (
+           id BIGSERIAL PRIMARY KEY,
+           kind VARCHAR(16) NOT NULL,
+           board_slug VARCHAR(32) NOT NULL,
+           job_key TEXT NOT NULL DEFAULT '',
+           payload JSONB NOT NULL DEFAULT '{}',
+           priority DOUBLE PRECISION NOT NULL DEFAULT 0,
+           state VARCHAR(16) NOT NULL DEFAULT 'pending',
+           attempts INTEGER NOT NULL DEFAULT 0,
+           run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+           leased_by TEXT,
+           lease_expires_at TIMESTAMPTZ,
+           last_error TEXT,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+           finished_at TIMESTAMPTZ
+       )""",
+    # At most one live (pending or running) job per unit of work
+    """CREATE UNIQUE INDEX IF NOT EXISTS idx_harvester_jobs_live
+           ON harvester_jobs(kind, board_slug, job_key) WHERE state IN ('pending', 'running')""",
+    """CREATE INDEX IF NOT EXISTS idx_harvester_jobs_pending
+           ON harvester_jobs(priority DESC, id) WHERE state = 'pending'""",
+    """CREATE INDEX IF NOT EXISTS idx_harvester_jobs_leases
+           ON harvester_jobs(lease_expires_at) WHERE state = 'running'""",
+    """CREATE INDEX IF NOT EXISTS idx_harvester_jobs_done
+           ON harvester_jobs(kind, board_slug, job_key) WHERE state = 'done'""",
+    # Next free request slot per (egress IP, host), shared by every worker on that IP
+    """CREATE TABLE IF NOT EXISTS harvester_rate_budgets (
+           egress TEXT NOT NULL,
+           host TEXT NOT NULL,
+           next_at TIMESTAMPTZ NOT NULL,
+           PRIMARY KEY (egress, host)
+       )""",
+    # Transactional outbox: events are written with the rows they describe
+    # and relayed to the Redis Streams bus after commit (see harvester.events)
+    """CREATE TABLE IF NOT EXISTS harvester_event_outbox (
+           id BIGSERIAL PRIMARY KEY,
+           event_type VARCHAR(64) NOT NULL,
+           event TEXT NOT NULL,
+           created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+       )""",
+    # Resume positions of long-running batch commands (e.g. rethumb's last media id)
+    """CREATE TABLE IF NOT EXISTS harvester_checkpoints (
+           name TEXT PRIMARY KEY,
+           position BIGINT NOT NULL,
+           updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+       )""",
+]
+
+# Indexes the harvester adds to ashchan's own tables, as name -> "table(columns)".
+# They stay out of HARVESTER_SCHEMA: a plain CREATE INDEX takes a lock that
+# blocks writes to the table even when the index already exists.  They are
+# built once, without blocking, by `harvester indexes` (create_core_indexes).
+CORE_INDEXES: dict[str, str] = {
+    # Posts sharing a media object, for rewriting their media columns in bulk
+    "idx_harvester_posts_media_id": "posts(media_id) WHERE media_id IS NOT NULL",
+    # 4chan MD5s already imported, for harvest planning
+    "idx_harvester_posts_media_hash": "posts(media_hash) WHERE media_hash IS NOT NULL",
+    # Rows changed since an incremental export's watermark
+    "idx_harvester_posts_updated_at": "posts(updated_at)",
+    "idx_harvester_threads_updated_at": "threads(updated_at)",
+}
+# Only worth their write cost where `export --incremental` runs (`indexes --export`)
+EXPORT_INDEXES = ("idx_harvester_posts_updated_at", "idx_harvester_threads_updated_at")
+
 
 class Database:
     """Postgres interface for the harvester."""
@@ -25,8 +165,47 @@ class Database:
     def conn(self) -> psycopg.Connection:
         if self._conn is None or self._conn.closed:
             self._conn = psycopg.connect(self.cfg.dsn, row_factory=dict_row, autocommit=False)
+            self._ensure_schema()
         return self._conn
 
+    def _ensure_schema(self) -> None:
+        assert self._conn is not None
+        for stmt in HARVESTER_SCHEMA:
+            self._conn.execute(stmt)
+        self._conn.commit()
+
+    # ── core table indexes ───────────────────────────────────────
+
+    def missing_core_indexes(self, names: Iterable[str] | None = None) -> list[str]:
+        """Those of *names* (default: all CORE_INDEXES) that are absent or invalid."""
+        names = list(CORE_INDEXES) if names is None else list(names)
+        rows = self.conn.execute(
+            """SELECT n.name FROM unnest(%s::text[]) AS n(name)
+               JOIN pg_index i ON i.indexrelid = to_regclass(n.name)
+               WHERE i.indisvalid""",
+            (names,),
+        ).fetchall()
+        present = {r["name"] for r in rows}
+        return [name for name in names if name not in present]
+
+    def create_core_indexes(self, names: Iterable[str] | None = None) -> list[str]:
+        """Build those of *names* (default: all CORE_INDEXES) that are missing,
+        with CREATE INDEX CONCURRENTLY.
+
+        Live writes to the tables carry on during the build.  Runs on its own
+        autocommit connection, since a concurrent build can't run inside a
+        transaction; an invalid index left by an interrupted build is dropped
+        and built again.  Returns the names built.
+        """
+        missing = self.missing_core_indexes(names)
+        self.conn.rollback()
+        with psycopg.connect(self.cfg.dsn, autocommit=True) as conn:
+            for name in missing:
+                conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                logger.info("Building index %s on %s", name, CORE_INDEXES[name])
+                conn.execute(f"CREATE INDEX CONCURRENTLY {name} ON {CORE_INDEXES[name]}")
+        return missing
+
     # ── board operations ─────────────────────────────────────────
 
     def get_board_id(self, slug: str) -> int | None:
@@ -72,6 +251,36 @@ class Database:
         ).fetchone()
         return row is not None
 
+    def existing_post_nos(self, thread_id: int) -> set[int]:
+        """Return the board post numbers already stored for a thread."""
+        rows = self.conn.execute(
+            "SELECT board_post_no FROM posts WHERE thread_id = %s", (thread_id,)
+        ).fetchall()
+        return {r["board_post_no"] for r in rows}
+
+    def stored_reply_counts(self, thread_ids: list[int]) -> dict[int, int]:
+        """Return {thread_id: stored non-OP post count} for threads that exist."""
+        if not thread_ids:
+            return {}
+        rows = self.conn.execute(
+            """SELECT t.id, COUNT(p.id) FILTER (WHERE NOT p.is_op) AS replies
+               FROM threads t LEFT JOIN posts p ON p.thread_id = t.id
+               WHERE t.id = ANY(%s)
+               GROUP BY t.id""",
+            (thread_ids,),
+        ).fetchall()
+        return {r["id"]: r["replies"] for r in rows}
+
+    def archived_thread_ids(self, thread_ids: list[int]) -> set[int]:
+        """Return the subset of *thread_ids* already stored as archived."""
+        if not thread_ids:
+            return set()
+        rows = self.conn.execute(
+            "SELECT id FROM threads WHERE id = ANY(%s) AND archived",
+            (thread_ids,),
+        ).fetchall()
+        return {r["id"] for r in rows}
+
     def insert_thread(
         self,
         *,
@@ -84,8 +293,11 @@ class Database:
         archived_at: datetime | None = None,
         reply_count: int = 0,
         image_count: int = 0,
-    ) -> int:
-        """Insert a thread row. Uses the 4chan post number as ID."""
+    ) -> tuple[int, bool]:
+        """Insert or refresh a thread row (the 4chan post number is its ID).
+
+        Returns ``(id, created)``; *created* is False when the row existed.
+        """
         row = self.conn.execute(
             """INSERT INTO threads (id, board_id, created_at, updated_at, bumped_at,
                                     sticky, locked, archived, archived_at,
@@ -99,43 +311,18 @@ class Database:
                    archived    = EXCLUDED.archived,
                    archived_at = EXCLUDED.archived_at,
                    updated_at  = NOW()
-               RETURNING id""",
+               RETURNING id, (xmax = 0) AS created""",
             (
                 thread_no, board_id, created_at, created_at, created_at,
                 sticky, locked, archived, archived_at,
                 reply_count, image_count,
             ),
         ).fetchone()
-        return row["id"]
+        return row["id"], row["created"]
 
-    def insert_post(
-        self,
-        *,
-        thread_id: int,
-        board_post_no: int,
-        created_at: datetime,
-        content: str,
-        content_html: str | None = None,
-        is_op: bool = False,
-        author_name: str = "Anonymous",
-        tripcode: str | None = None,
-        capcode: str | None = None,
-        subject: str | None = None,
-        email: str | None = None,
-        country_code: str | None = None,
-        country_name: str | None = None,
-        poster_id: str | None = None,
-        media_url: str | None = None,
-        thumb_url: str | None = None,
-        media_filename: str | None = None,
-        media_size: int | None = None,
-        media_dimensions: str | None = None,
-        media_hash: str | None = None,
-        media_id: str | None = None,
-        spoiler_image: bool = False,
-    ) -> int:
-        """Insert a post. Returns the inserted post's internal ID."""
-        row = self.conn.execute(
+    def insert_post(self, row: PostRow) -> tuple[int, bool]:
+        """Insert or refresh a post. Returns ``(internal id, created)``."""
+        inserted = self.conn.execute(
             """INSERT INTO posts (
                    thread_id, board_post_no, created_at, updated_at,
                    content, content_html, is_op,
@@ -143,7 +330,7 @@ class Database:
                    country_code, country_name, poster_id,
                    media_url, thumb_url, media_filename,
                    media_size, media_dimensions, media_hash, media_id,
-                   spoiler_image
+                   spoiler_image, metadata
                ) VALUES (
                    %s, %s, %s, %s,
                    %s, %s, %s,
@@ -151,41 +338,420 @@ class Database:
                    %s, %s, %s,
                    %s, %s, %s,
                    %s, %s, %s, %s,
-                   %s
+                   %s, %s
                )
                ON CONFLICT (board_post_no, thread_id) DO UPDATE SET
                    content       = EXCLUDED.content,
                    content_html  = EXCLUDED.content_html,
+                   metadata      = CASE WHEN EXCLUDED.metadata IS NULL THEN posts.metadata
+                                        ELSE COALESCE(posts.metadata, '{}'::jsonb) || EXCLUDED.metadata END,
                    media_url     = COALESCE(EXCLUDED.media_url, posts.media_url),
                    thumb_url     = COALESCE(EXCLUDED.thumb_url, posts.thumb_url),
                    media_id      = COALESCE(EXCLUDED.media_id, posts.media_id),
                    updated_at    = NOW()
-               RETURNING id""",
+               RETURNING id, (xmax = 0) AS created""",
             (
-                thread_id, board_post_no, created_at, created_at,
-                content, content_html, is_op,
-                author_name, tripcode, capcode, subject, email,
-                country_code, country_name, poster_id,
-                media_url, thumb_url, media_filename,
-                media_size, media_dimensions, media_hash, media_id,
-                spoiler_image,
+                row.thread_id, row.board_post_no, row.created_at, row.created_at,
+                row.content, row.content_html, row.is_op,
+                row.author_name, row.tripcode, row.capcode, row.subject, row.email,
+                row.country_code, row.country_name, row.poster_id,
+                *self._media_params(row.media),
+                row.spoiler_image, Jsonb(row.metadata) if row.metadata is not None else None,
             ),
         ).fetchone()
-        return row["id"]
+        return inserted["id"], inserted["created"]
+
+    @staticmethod
+    def _media_params(media: MediaRef | None) -> tuple[Any, ...]:
+        """(media_url, thumb_url, media_filename, media_size, media_dimensions, media_hash, media_id)."""
+        if media is None:
+            return (None,) * 7
+        return (
+            media.media_url, media.thumb_url, media.media_filename,
+            media.media_size, media.media_dimensions, media.media_hash, media.media_id,
+        )
+
+    def finalize_threads(self, thread_ids: list[int]) -> int:
+        """Recompute thread columns that depend on the stored posts, in one statement.
+
+        Sets op_post_id, bumped_at (the OP or the last non-sage reply within
+        the board's bump limit), reply_count and image_count (replies with
+        stored media) from the posts rows, ignoring deleted posts.  Threads
+        with an open catalog gap keep 4chan's larger counts, since most of
+        their replies are not stored yet.  Returns the number of threads
+        changed.
+        """
+        if not thread_ids:
+            return 0
+        cur = self.conn.execute(
+            """WITH ranked AS (
+                   SELECT p.thread_id, p.id, p.is_op, p.created_at, p.media_url,
+                          lower(btrim(COALESCE(p.email, ''))) = 'sage' AS sage,
+                          row_number() OVER (PARTITION BY p.thread_id, p.is_op
+                                             ORDER BY p.board_post_no) AS ord
+                   FROM posts p
+                   WHERE p.thread_id = ANY(%s) AND p.deleted IS NOT TRUE
+               ), stats AS (
+                   SELECT r.thread_id,
+                          min(r.id) FILTER (WHERE r.is_op) AS op_post_id,
+                          max(r.created_at) FILTER (
+                              WHERE r.is_op OR (NOT r.sage AND r.ord <= COALESCE(NULLIF(b.bump_limit, 0), 300))
+                          ) AS bumped_at,
+                          count(*) FILTER (WHERE NOT r.is_op) AS replies,
+                          count(*) FILTER (WHERE NOT r.is_op AND r.media_url IS NOT NULL) AS images
+                   FROM ranked r
+                   JOIN threads t ON t.id = r.thread_id
+                   JOIN boards b ON b.id = t.board_id
+                   GROUP BY r.thread_id
+               ), fresh AS (
+                   SELECT s.thread_id, s.op_post_id, s.bumped_at,
+                          CASE WHEN g.thread_id IS NULL THEN s.replies
+                               ELSE GREATEST(t.reply_count, s.replies) END AS reply_count,
+                          CASE WHEN g.thread_id IS NULL THEN s.images
+                               ELSE GREATEST(t.image_count, s.images) END AS image_count
+                   FROM stats s
+                   JOIN threads t ON t.id = s.thread_id
+                   LEFT JOIN harvester_thread_gaps g ON g.thread_id = s.thread_id
+               )
+               UPDATE threads t SET
+                   op_post_id  = COALESCE(f.op_post_id, t.op_post_id),
+                   bumped_at   = COALESCE(f.bumped_at, t.bumped_at),
+                   reply_count = f.reply_count,
+                   image_count = f.image_count
+               FROM fresh f
+               WHERE t.id = f.thread_id
+                 AND (t.op_post_id, t.bumped_at, t.reply_count, t.image_count)
+                     IS DISTINCT FROM (COALESCE(f.op_post_id, t.op_post_id), COALESCE(f.bumped_at, t.bumped_at),
+                                       f.reply_count, f.image_count)""",
+            (thread_ids,),
+        )
+        return cur.rowcount
+
+    # ── thread gap tracking ──────────────────────────────────────
+
+    def record_thread_gap(self, thread_id: int, board_id: int, expected: int, stored: int) -> None:
+        """Remember that a thread has fewer stored replies than 4chan reports."""
+        self.conn.execute(
+            """INSERT INTO harvester_thread_gaps
+                   (thread_id, board_id, expected_replies, stored_replies)
+               VALUES (%s, %s, %s, %s)
+               ON CONFLICT (thread_id) DO UPDATE SET
+                   expected_replies = EXCLUDED.expected_replies,
+                   stored_replies   = EXCLUDED.stored_replies,
+                   updated_at       = NOW()""",
+            (thread_id, board_id, expected, stored),
+        )
+
+    def clear_thread_gap(self, thread_id: int) -> None:
+        self.conn.execute(
+            "DELETE FROM harvester_thread_gaps WHERE thread_id = %s", (thread_id,)
+        )
+
+    def thread_gaps(self, board_id: int, limit: int = 0) -> list[int]:
+        """Thread IDs with missing replies, largest gap first."""
+        sql = """SELECT thread_id FROM harvester_thread_gaps
+                 WHERE board_id = %s
+                 ORDER BY expected_replies - stored_replies DESC, thread_id"""
+        params: tuple[Any, ...] = (board_id,)
+        if limit > 0:
+            sql += " LIMIT %s"
+            params += (limit,)
+        return [r["thread_id"] for r in self.conn.execute(sql, params).fetchall()]
+
+    # ── media retry queue ────────────────────────────────────────
+
+    def enqueue_media_retry(self, board_slug: str, thread_id: int, post_no: int, media: Media, error: str) -> None:
+        """Record a failed media fetch/upload for a post so it can be retried."""
+        self.conn.execute(
+            """INSERT INTO harvester_media_retries
+                   (board_slug, thread_id, board_post_no, tim, ext,
+                    filename, md5, fsize, width, height, last_error)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+               ON CONFLICT (board_post_no, thread_id) DO UPDATE SET
+                   last_error = EXCLUDED.last_error""",
+            (
+                board_slug, thread_id, post_no, media.tim, media.ext,
+                media.filename, media.md5, media.fsize,
+                media.w, media.h, error[:1000],
+            ),
+        )
+
+    def claim_media_retries(self, limit: int, max_attempts: int) -> list[dict]:
+        """Lock up to *limit* due retry rows (skipping rows other workers hold)."""
+        return self.conn.execute(
+            """SELECT * FROM harvester_media_retries
+               WHERE next_retry_at <= NOW() AND attempts < %s
+               ORDER BY next_retry_at
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED""",
+            (max_attempts, limit),
+        ).fetchall()
 
-    def set_op_post(self, thread_id: int, post_id: int) -> None:
+    def reschedule_media_retry(self, retry_id: int, error: str, delay_seconds: float) -> None:
         self.conn.execute(
-            "UPDATE threads SET op_post_id = %s WHERE id = %s", (post_id, thread_id)
+            """UPDATE harvester_media_retries
+               SET attempts = attempts + 1,
+                   last_error = %s,
+                   next_retry_at = NOW() + make_interval(secs => %s)
+               WHERE id = %s""",
+            (error[:1000], delay_seconds, retry_id),
         )
 
+    def delete_media_retry(self, retry_id: int) -> None:
+        self.conn.execute("DELETE FROM harvester_media_retries WHERE id = %s", (retry_id,))
+
+    def update_post_media(self, thread_id: int, board_post_no: int, media: MediaRef) -> None:
+        """Back-fill the media columns of an already-imported post."""
+        self.conn.execute(
+            """UPDATE posts SET
+                   media_url        = %s,
+                   thumb_url        = %s,
+                   media_id         = %s,
+                   media_filename   = COALESCE(%s, media_filename),
+                   media_size       = COALESCE(%s, media_size),
+                   media_dimensions = COALESCE(%s, media_dimensions),
+                   media_hash       = COALESCE(%s, media_hash),
+                   metadata         = COALESCE(metadata, '{}'::jsonb) || %s,
+                   updated_at       = NOW()
+               WHERE thread_id = %s AND board_post_no = %s""",
+            (
+                media.media_url, media.thumb_url, media.media_id,
+                media.media_filename, media.media_size,
+                media.media_dimensions, media.media_hash,
+                Jsonb({"thumbnails": media.thumbnails} if media.thumbnails else {}),
+                thread_id, board_post_no,
+            ),
+        )
+
+    # ── post quarantine ──────────────────────────────────────────
+
+    def quarantine_post(
+        self, board_slug: str, thread_id: int, post_no: int, post: dict, media: dict | None, error: str,
+    ) -> None:
+        """Set aside a post that failed to import, with what is needed to retry it.
+
+        *media* is the post's already-stored media columns, if any, so a retry
+        links the file instead of fetching it again.
+        """
+        self.conn.execute(
+            """INSERT INTO harvester_post_quarantine
+                   (board_slug, thread_id, board_post_no, post, media, last_error)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               ON CONFLICT (thread_id, board_post_no) DO UPDATE SET
+                   post       = EXCLUDED.post,
+                   media      = COALESCE(EXCLUDED.media, harvester_post_quarantine.media),
+                   last_error = EXCLUDED.last_error""",
+            (board_slug, thread_id, post_no, Jsonb(post), Jsonb(media) if media else None, error[:1000]),
+        )
+
+    def claim_quarantined_posts(self, limit: int, max_attempts: int) -> list[dict]:
+        """Lock up to *limit* due quarantined posts (skipping rows other workers hold)."""
+        return self.conn.execute(
+            """SELECT * FROM harvester_post_quarantine
+               WHERE next_retry_at <= NOW() AND attempts < %s
+               ORDER BY next_retry_at
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED""",
+            (max_attempts, limit),
+        ).fetchall()
+
+    def reschedule_quarantined_post(self, quarantine_id: int, error: str, delay_seconds: float) -> None:
+        self.conn.execute(
+            """UPDATE harvester_post_quarantine
+               SET attempts = attempts + 1,
+                   last_error = %s,
+                   next_retry_at = NOW() + make_interval(secs => %s)
+               WHERE id = %s""",
+            (error[:1000], delay_seconds, quarantine_id),
+        )
+
+    def delete_quarantined_post(self, quarantine_id: int) -> None:
+        self.conn.execute("DELETE FROM harvester_post_quarantine WHERE id = %s", (quarantine_id,))
+
+    def release_quarantined_posts(self, thread_id: int, post_nos: list[int]) -> None:
+        """Drop quarantine entries for posts that have since imported cleanly."""
+        if post_nos:
+            self.conn.execute(
+                "DELETE FROM harvester_post_quarantine WHERE thread_id = %s AND board_post_no = ANY(%s)",
+                (thread_id, post_nos),
+            )
+
+    # ── distributed job queue ────────────────────────────────────
+
+    def enqueue_jobs(
+        self,
+        kind: str,
+        board_slug: str,
+        jobs: Iterable[tuple[str, dict, float]],
+        *,
+        delay: float = 0.0,
+        once: bool = False,
+    ) -> int:
+        """Queue (job_key, payload, priority) jobs; returns how many were added.
+
+        A job whose key already has a pending or running job is skipped.  With
+        *once*, keys that have already completed are skipped as well.
+        """
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                """INSERT INTO harvester_jobs (kind, board_slug, job_key, payload, priority, run_after)
+                   SELECT %(kind)s, %(board)s, %(key)s, %(payload)s, %(priority)s,
+                          NOW() + make_interval(secs => %(delay)s)
+                   WHERE NOT %(once)s OR NOT EXISTS (
+                       SELECT 1 FROM harvester_jobs
+                       WHERE kind = %(kind)s AND board_slug = %(board)s
+                         AND job_key = %(key)s AND state = 'done')
+                   ON CONFLICT (kind, board_slug, job_key) WHERE state IN ('pending', 'running')
+                   DO NOTHING""",
+                [
+                    {"kind": kind, "board": board_slug, "key": key, "payload": Jsonb(payload),
+                     "priority": priority, "delay": delay, "once": once}
+                    for key, payload, priority in jobs
+                ],
+            )
+            return max(cur.rowcount, 0)
+
+    def claim_jobs(
+        self,
+        worker_id: str,
+        kinds: list[str],
+        *,
+        limit: int,
+        lease_seconds: float,
+        max_attempts: int,
+    ) -> list[dict]:
+        """Lease up to *limit* due jobs to *worker_id*, highest priority first.
+
+        Jobs whose lease ran out (their worker died or stalled) are first put
+        back in the queue, or failed once they have used *max_attempts*.
+        """
+        self.conn.execute(
+            """UPDATE harvester_jobs
+               SET state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                   finished_at = CASE WHEN attempts >= %s THEN NOW() END,
+                   leased_by = NULL,
+                   lease_expires_at = NULL,
+                   last_error = 'lease expired'
+               WHERE id IN (
+                   SELECT id FROM harvester_jobs
+                   WHERE state = 'running' AND lease_expires_at < NOW()
+                   FOR UPDATE SKIP LOCKED)""",
+            (max_attempts, max_attempts),
+        )
+        rows = self.conn.execute(
+            """UPDATE harvester_jobs
+               SET state = 'running',
+                   leased_by = %s,
+                   lease_expires_at = NOW() + make_interval(secs => %s),
+                   attempts = attempts + 1
+               WHERE id IN (
+                   SELECT id FROM harvester_jobs
+                   WHERE state = 'pending' AND run_after <= NOW() AND kind = ANY(%s)
+                   ORDER BY priority DESC, id
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED)
+               RETURNING *""",
+            (worker_id, lease_seconds, kinds, limit),
+        ).fetchall()
+        return sorted(rows, key=lambda r: (-r["priority"], r["id"]))
+
+    def extend_job_lease(self, job: dict, worker_id: str, lease_seconds: float) -> bool:
+        """Heartbeat: push out a held lease.  False if the lease was lost."""
+        cur = self.conn.execute(
+            """UPDATE harvester_jobs
+               SET lease_expires_at = NOW() + make_interval(secs => %s)
+               WHERE id = %s AND state = 'running' AND leased_by = %s AND attempts = %s""",
+            (lease_seconds, job["id"], worker_id, job["attempts"]),
+        )
+        return cur.rowcount == 1
+
+    def complete_job(self, job: dict, worker_id: str) -> bool:
+        """Mark a leased job done, in the caller's transaction.
+
+        Returns False if the lease has meanwhile passed to another worker; the
+        caller must then roll back so the work is applied exactly once.
+        """
+        cur = self.conn.execute(
+            """UPDATE harvester_jobs
+               SET state = 'done', finished_at = NOW(), leased_by = NULL,
+                   lease_expires_at = NULL, last_error = NULL
+               WHERE id = %s AND state = 'running' AND leased_by = %s AND attempts = %s""",
+            (job["id"], worker_id, job["attempts"]),
+        )
+        return cur.rowcount == 1
+
+    def fail_job(self, job: dict, worker_id: str, error: str, *, delay_seconds: float, max_attempts: int) -> None:
+        """Release a leased job after a failure: retry after *delay_seconds*, or fail it."""
+        self.conn.execute(
+            """UPDATE harvester_jobs
+               SET state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                   finished_at = CASE WHEN attempts >= %s THEN NOW() END,
+                   run_after = NOW() + make_interval(secs => %s),
+                   leased_by = NULL,
+                   lease_expires_at = NULL,
+                   last_error = %s
+               WHERE id = %s AND state = 'running' AND leased_by = %s AND attempts = %s""",
+            (max_attempts, max_attempts, delay_seconds, error[:1000],
+             job["id"], worker_id, job["attempts"]),
+        )
+
+    def job_summary(self) -> list[dict]:
+        """Job counts per kind and state."""
+        return self.conn.execute(
+            """SELECT kind, state, COUNT(*) AS jobs, MIN(run_after) AS next_run
+               FROM harvester_jobs
+               GROUP BY kind, state
+               ORDER BY kind, state"""
+        ).fetchall()
+
+    def purge_jobs(self, older_than_days: float) -> int:
+        """Delete done and failed jobs that finished more than *older_than_days* ago."""
+        cur = self.conn.execute(
+            """DELETE FROM harvester_jobs
+               WHERE state IN ('done', 'failed')
+                 AND finished_at < NOW() - make_interval(secs => %s)""",
+            (older_than_days * 86400,),
+        )
+        return cur.rowcount
+
+    def reserve_rate_slot(self, egress: str, host: str, interval: float) -> float:
+        """Take the next request slot for *host* from *egress*'s shared budget.
+
+        Slots are *interval* seconds apart across every worker using the same
+        egress.  Returns how long to wait before sending.  Commits.
+        """
+        row = self.conn.execute(
+            """INSERT INTO harvester_rate_budgets AS b (egress, host, next_at)
+               VALUES (%s, %s, clock_timestamp() + make_interval(secs => %s))
+               ON CONFLICT (egress, host) DO UPDATE SET
+                   next_at = GREATEST(b.next_at, clock_timestamp()) + make_interval(secs => %s)
+               RETURNING GREATEST(
+                   EXTRACT(EPOCH FROM b.next_at - clock_timestamp()) - %s, 0
+               )::float8 AS wait""",
+            (egress, host, interval, interval, interval),
+        ).fetchone()
+        self.conn.commit()
+        return row["wait"]
+
     # ── media_objects dedup ──────────────────────────────────────
 
     def media_hash_exists(self, sha256: str) -> dict | None:
         """Return existing media_objects row if sha256 is already stored."""
         return self.conn.execute(
-            "SELECT * FROM media_objects WHERE hash_sha256 = %s", (sha256,)
+            # FOR SHARE: pruning must not delete the row before our post using it commits
+            "SELECT * FROM media_objects WHERE hash_sha256 = %s FOR SHARE", (sha256,)
         ).fetchone()
 
+    def known_media_md5s(self, md5s: list[str]) -> set[str]:
+        """Return the subset of 4chan MD5s (base64) already on an imported post."""
+        if not md5s:
+            return set()
+        rows = self.conn.execute(
+            "SELECT DISTINCT media_hash FROM posts WHERE media_hash = ANY(%s)",
+            (md5s,),
+        ).fetchall()
+        return {r["media_hash"] for r in rows}
+
     def insert_media_object(
         self,
         *,
@@ -197,21 +763,539 @@ class Database:
         storage_key: str | None = None,
         thumb_key: str | None = None,
         original_filename: str | None = None,
+        phash: str | None = None,
     ) -> int:
         row = self.conn.execute(
             """INSERT INTO media_objects
                    (hash_sha256, mime_type, file_size, width, height,
-                    storage_key, thumb_key, original_filename)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-               ON CONFLICT (hash_sha256) DO UPDATE SET hash_sha256 = EXCLUDED.hash_sha256
-               RETURNING id""",
+                    storage_key, thumb_key, original_filename, phash)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+               ON CONFLICT (hash_sha256) DO UPDATE SET
+                   phash = COALESCE(media_objects.phash, EXCLUDED.phash)
+               RETURNING id, phash""",
             (hash_sha256, mime_type, file_size, width, height,
-             storage_key, thumb_key, original_filename),
+             storage_key, thumb_key, original_filename, phash),
         ).fetchone()
+        if row["phash"]:
+            self.index_phash(row["id"], row["phash"])
         return row["id"]
 
+    def insert_media_thumbnails(self, media_id: int, thumbnails: list[dict]) -> None:
+        """Record a media object's thumbnail variants (see storage._thumb_info)."""
+        if not thumbnails:
+            return
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                """INSERT INTO harvester_media_thumbnails
+                       (media_id, name, mime_type, storage_key, width, height, file_size)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s)
+                   ON CONFLICT (media_id, name, mime_type) DO UPDATE SET
+                       storage_key = EXCLUDED.storage_key,
+                       width       = EXCLUDED.width,
+                       height      = EXCLUDED.height,
+                       file_size   = EXCLUDED.file_size""",
+                [
+                    (media_id, t["name"], t["mime_type"], t["storage_key"],
+                     t["width"], t["height"], t["file_size"])
+                    for t in thumbnails
+                ],
+            )
+
+    def set_media_info(self, media_id: int, duration: float | None, codec: str | None) -> None:
+        """Record what a video's headers say beyond media_objects' width/height."""
+        self.conn.execute(
+            """INSERT INTO harvester_media_info (media_id, duration, codec)
+               VALUES (%s, %s, %s)
+               ON CONFLICT (media_id) DO UPDATE SET
+                   duration = EXCLUDED.duration,
+                   codec    = EXCLUDED.codec""",
+            (media_id, duration, codec),
+        )
+
+    def media_thumbnails(self, media_id: int) -> list[dict]:
+        return self.conn.execute(
+            """SELECT name, mime_type, storage_key, width, height, file_size
+               FROM harvester_media_thumbnails
+               WHERE media_id = %s
+               ORDER BY width DESC, name, mime_type""",
+            (media_id,),
+        ).fetchall()
+
+    # ── perceptual hash index ────────────────────────────────────
+
+    def index_phash(self, media_id: int, phash: str) -> None:
+        """Add a media object's pHash chunks to the near-duplicate index."""
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                """INSERT INTO harvester_phash_index (chunk, value, media_id)
+                   VALUES (%s, %s, %s) ON CONFLICT DO NOTHING""",
+                [(i, value, media_id) for i, value in enumerate(phash_chunks(phash))],
+            )
+
+    def set_media_phash(self, media_id: int, phash: str) -> None:
+        self.conn.execute("UPDATE media_objects SET phash = %s WHERE id = %s", (phash, media_id))
+        self.index_phash(media_id, phash)
+
+    def find_near_duplicates(self, phash: str, max_distance: int, limit: int = 10) -> list[dict]:
+        """Media objects within *max_distance* bits of *phash*, closest first.
+
+        Candidates come from exact chunk matches, so recall is complete for
+        max_distance < PHASH_CHUNKS.
+        """
+        chunks = phash_chunks(phash)
+        pairs = ", ".join(["(%s, %s)"] * PHASH_CHUNKS)
+        params: list[Any] = [phash]
+        for i, value in enumerate(chunks):
+            params += [i, value]
+        params += [max_distance, limit]
+        return self.conn.execute(
+            f"""SELECT * FROM (
+                    SELECT m.*, bit_count(('x' || m.phash)::bit(64) # ('x' || %s)::bit(64)) AS distance
+                    FROM media_objects m
+                    WHERE m.id IN (
+                        SELECT media_id FROM harvester_phash_index
+                        WHERE (chunk, value) IN ({pairs})
+                    )
+                    AND NOT COALESCE(m.banned, false)
+                    FOR SHARE OF m
+                ) c
+                WHERE distance <= %s
+                ORDER BY distance, id
+                LIMIT %s""",
+            params,
+        ).fetchall()
+
+    def media_without_phash(self, after_id: int, limit: int) -> list[dict]:
+        """Keyset page of stored images that have no pHash yet."""
+        return self.conn.execute(
+            """SELECT id, storage_key FROM media_objects
+               WHERE id > %s AND phash IS NULL AND storage_key IS NOT NULL
+                 AND mime_type LIKE 'image/%%'
+               ORDER BY id
+               LIMIT %s""",
+            (after_id, limit),
+        ).fetchall()
+
+    # ── re-thumbnailing ──────────────────────────────────────────
+
+    def media_for_rethumb(
+        self,
+        after_id: int,
+        limit: int,
+        *,
+        boards: Sequence[str] = (),
+        since: datetime | None = None,
+        until: datetime | None = None,
+        mime: str | None = None,
+        missing_only: bool = False,
+    ) -> list[dict]:
+        """Keyset page of stored images to re-thumbnail, filtered.
+
+        *boards*, *since* and *until* select media attached to at least one
+        matching post; *mime* is a MIME type, ``*`` matching any suffix
+        (``image/*``).  *missing_only* keeps media without a thumb_key or
+        without any recorded variant.
+        """
+        where = ["m.id > %s", "m.storage_key IS NOT NULL", "m.mime_type LIKE 'image/%%'"]
+        params: list[Any] = [after_id]
+        if mime:
+            where.append("m.mime_type LIKE %s")
+            params.append(mime.replace("%", r"\%").replace("_", r"\_").replace("*", "%"))
+        if missing_only:
+            where.append(
+                "(m.thumb_key IS NULL OR NOT EXISTS "
+                "(SELECT 1 FROM harvester_media_thumbnails v WHERE v.media_id = m.id))"
+            )
+        if boards or since or until:
+            post_where = ["p.media_id = m.id::text"]
+            if boards:
+                post_where.append(
+                    "p.thread_id IN (SELECT t.id FROM threads t JOIN boards b ON b.id = t.board_id"
+                    " WHERE b.slug = ANY(%s))"
+                )
+                params.append(list(boards))
+            if since:
+                post_where.append("p.created_at >= %s")
+                params.append(since)
+            if until:
+                post_where.append("p.created_at < %s")
+                params.append(until)
+            where.append(f"EXISTS (SELECT 1 FROM posts p WHERE {' AND '.join(post_where)})")
+        params.append(limit)
+        return self.conn.execute(
+            f"""SELECT m.id, m.hash_sha256, m.storage_key FROM media_objects m
+                WHERE {' AND '.join(where)}
+                ORDER BY m.id
+                LIMIT %s""",
+            params,
+        ).fetchall()
+
+    def replace_media_thumbnails(
+        self, updates: Sequence[tuple[int, list[dict], str | None, str | None, list[dict] | None]],
+    ) -> None:
+        """Swap in new thumbnails for a batch of media objects.
+
+        Each update is ``(media_id, variants, thumb_key, thumb_url, refs)``:
+        the variant rows (see storage._thumb_info) replace the recorded
+        ones, thumb_key is set on media_objects, and every post using the
+        media gets thumb_url and ``metadata.thumbnails`` = *refs*.
+        """
+        if not updates:
+            return
+        ids = [u[0] for u in updates]
+        self.conn.execute("DELETE FROM harvester_media_thumbnails WHERE media_id = ANY(%s)", (ids,))
+        for media_id, variants, *_ in updates:
+            self.insert_media_thumbnails(media_id, variants)
+        self.conn.execute(
+            """UPDATE media_objects m SET thumb_key = u.thumb_key
+               FROM unnest(%s::int[], %s::text[]) AS u(id, thumb_key)
+               WHERE m.id = u.id""",
+            (ids, [u[2] for u in updates]),
+        )
+        self.conn.execute(
+            """UPDATE posts p SET
+                   thumb_url  = u.thumb_url,
+                   metadata   = CASE WHEN u.refs IS NULL
+                                     THEN p.metadata - 'thumbnails'
+                                     ELSE COALESCE(p.metadata, '{}'::jsonb)
+                                          || jsonb_build_object('thumbnails', u.refs) END,
+                   updated_at = NOW()
+               FROM unnest(%s::text[], %s::text[], %s::jsonb[]) AS u(media_id, thumb_url, refs)
+               WHERE p.media_id = u.media_id""",
+            (
+                [str(i) for i in ids],
+                [u[3] for u in updates],
+                [Jsonb(u[4]) if u[4] is not None else None for u in updates],
+            ),
+        )
+
+    # ── bulk load (synth) ────────────────────────────────────────
+
+    def max_post_no(self) -> int:
+        """Highest post number in use anywhere (thread ids are OP post numbers)."""
+        row = self.conn.execute(
+            """SELECT GREATEST(
+                   (SELECT COALESCE(MAX(id), 0) FROM threads),
+                   (SELECT COALESCE(MAX(board_post_no), 0) FROM posts)) AS n"""
+        ).fetchone()
+        return row["n"]
+
+    def set_synchronous_commit(self, on: bool) -> None:
+        """Toggle waiting for WAL flush on commit, for this session only."""
+        self.conn.execute(f"SET synchronous_commit = {'on' if on else 'off'}")
+
+    def copy_rows(self, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+        """Bulk-load rows with COPY (no conflict handling; for fresh data only)."""
+        with self.conn.cursor() as cur:
+            with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    def link_op_posts(self, thread_ids: list[int]) -> None:
+        """Point threads.op_post_id at each thread's OP post."""
+        self.conn.execute(
+            """UPDATE threads t SET op_post_id = p.id
+               FROM posts p
+               WHERE p.thread_id = t.id AND p.is_op AND t.id = ANY(%s)""",
+            (thread_ids,),
+        )
+
+    # ── event outbox ─────────────────────────────────────────────
+
+    def insert_outbox_events(self, events: list[tuple[str, str]]) -> None:
+        """Queue ``(event_type, event_json)`` pairs in the open transaction."""
+        if not events:
+            return
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO harvester_event_outbox (event_type, event) VALUES (%s, %s)", events
+            )
+
+    def claim_outbox_events(self, limit: int) -> list[dict]:
+        """Oldest unpublished events, locked so concurrent relays skip them."""
+        return self.conn.execute(
+            """SELECT id, event FROM harvester_event_outbox
+               ORDER BY id
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED""",
+            (limit,),
+        ).fetchall()
+
+    def delete_outbox_events(self, ids: list[int]) -> None:
+        self.conn.execute("DELETE FROM harvester_event_outbox WHERE id = ANY(%s)", (ids,))
+
+    def outbox_summary(self) -> list[dict]:
+        return self.conn.execute(
+            """SELECT event_type, COUNT(*) AS events, MIN(created_at) AS oldest
+               FROM harvester_event_outbox
+               GROUP BY event_type
+               ORDER BY event_type"""
+        ).fetchall()
+
+    # ── checkpoints ──────────────────────────────────────────────
+
+    def get_checkpoint(self, name: str) -> int | None:
+        row = self.conn.execute(
+            "SELECT position FROM harvester_checkpoints WHERE name = %s", (name,)
+        ).fetchone()
+        return row["position"] if row else None
+
+    def set_checkpoint(self, name: str, position: int) -> None:
+        self.conn.execute(
+            """INSERT INTO harvester_checkpoints (name, position) VALUES (%s, %s)
+               ON CONFLICT (name) DO UPDATE SET position = EXCLUDED.position, updated_at = now()""",
+            (name, position),
+        )
+
+    def clear_checkpoint(self, name: str) -> None:
+        self.conn.execute("DELETE FROM harvester_checkpoints WHERE name = %s", (name,))
+
+    # ── storage reconciliation ───────────────────────────────────
+
+    def iter_media_keys(self, itersize: int = 10000) -> Iterator[dict]:
+        """Every storage key the database references, sorted by key bytes.
+
+        Streams through a server-side cursor, so memory stays flat however
+        many media objects there are.  Rows carry ``role`` (original, thumb
+        or variant), ``media_id``, and for originals ``hash_sha256`` and
+        ``file_size``.  A key referenced more than once yields one row per
+        reference.
+        """
+        with self.conn.cursor(name="harvester_media_keys") as cur:
+            cur.itersize = itersize
+            cur.execute(
+                """SELECT key, role, media_id, hash_sha256, file_size FROM (
+                       SELECT storage_key AS key, 'original' AS role, id AS media_id,
+                              hash_sha256, file_size
+                       FROM media_objects WHERE storage_key IS NOT NULL
+                       UNION ALL
+                       SELECT thumb_key, 'thumb', id, NULL, NULL
+                       FROM media_objects WHERE thumb_key IS NOT NULL
+                       UNION ALL
+                       SELECT storage_key, 'variant', media_id, NULL, file_size
+                       FROM harvester_media_thumbnails
+                   ) k
+                   ORDER BY key COLLATE "C", role, media_id"""
+            )
+            yield from cur
+
+    def unlink_media_thumbnail(self, media_id: int, storage_key: str) -> None:
+        """Forget a thumbnail whose object is gone, so ``rethumb`` recreates it."""
+        self.conn.execute(
+            "DELETE FROM harvester_media_thumbnails WHERE media_id = %s AND storage_key = %s",
+            (media_id, storage_key),
+        )
+        self.conn.execute(
+            "UPDATE media_objects SET thumb_key = NULL WHERE id = %s AND thumb_key = %s",
+            (media_id, storage_key),
+        )
+
+    # ── retention pruning ────────────────────────────────────────
+
+    def nth_newest_bump(self, board_id: int, n: int) -> datetime | None:
+        """bumped_at of the board's *n*-th most recently bumped non-sticky thread."""
+        row = self.conn.execute(
+            """SELECT bumped_at FROM threads
+               WHERE board_id = %s AND NOT COALESCE(sticky, false)
+               ORDER BY bumped_at DESC OFFSET %s LIMIT 1""",
+            (board_id, n - 1),
+        ).fetchone()
+        return row["bumped_at"] if row else None
+
+    def prunable_threads(self, board_id: int, before: datetime, after_id: int, limit: int) -> list[int]:
+        """Keyset page of non-sticky thread ids last bumped before *before*."""
+        rows = self.conn.execute(
+            """SELECT id FROM threads
+               WHERE board_id = %s AND id > %s AND bumped_at < %s AND NOT COALESCE(sticky, false)
+               ORDER BY id LIMIT %s""",
+            (board_id, after_id, before, limit),
+        ).fetchall()
+        return [r["id"] for r in rows]
+
+    def count_thread_posts(self, thread_ids: list[int]) -> int:
+        return self.conn.execute(
+            "SELECT count(*) AS n FROM posts WHERE thread_id = ANY(%s)", (thread_ids,)
+        ).fetchone()["n"]
+
+    def set_lock_timeout(self, seconds: float) -> None:
+        """Give up on row/table locks held longer than *seconds* (open transaction only)."""
+        self.conn.execute(f"SET LOCAL lock_timeout = '{int(seconds * 1000)}ms'")
+
+    def delete_threads(self, thread_ids: list[int]) -> tuple[int, list[int]]:
+        """Delete threads with their posts and harvester bookkeeping.
+
+        Returns ``(posts deleted, media ids the posts referenced)``.
+        """
+        row = self.conn.execute(
+            """SELECT count(*) AS posts,
+                      COALESCE(array_agg(DISTINCT media_id::integer)
+                               FILTER (WHERE media_id ~ '^[0-9]+$'), '{}') AS media_ids
+               FROM posts WHERE thread_id = ANY(%s)""",
+            (thread_ids,),
+        ).fetchone()
+        self.conn.execute("DELETE FROM harvester_thread_gaps WHERE thread_id = ANY(%s)", (thread_ids,))
+        self.conn.execute("DELETE FROM harvester_media_retries WHERE thread_id = ANY(%s)", (thread_ids,))
+        self.conn.execute("DELETE FROM harvester_post_quarantine WHERE thread_id = ANY(%s)", (thread_ids,))
+        self.conn.execute("DELETE FROM threads WHERE id = ANY(%s)", (thread_ids,))
+        return row["posts"], row["media_ids"]
+
+    def delete_unreferenced_media(self, media_ids: list[int]) -> tuple[int, list[str]]:
+        """Delete those of *media_ids* no post references any more.
+
+        The rows are locked first, so a harvester that just matched one by
+        hash (media_hash_exists takes a share lock) commits its post before
+        the reference check runs.  Returns ``(rows deleted, storage keys of
+        their originals and thumbnails)``.
+        """
+        if not media_ids:
+            return 0, []
+        self.conn.execute(
+            "SELECT id FROM media_objects WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (media_ids,)
+        )
+        rows = self.conn.execute(
+            """WITH doomed AS (
+                   DELETE FROM media_objects m
+                   WHERE m.id = ANY(%s)
+                     AND NOT EXISTS (SELECT 1 FROM posts p WHERE p.media_id = m.id::text)
+                   RETURNING m.id, m.storage_key, m.thumb_key
+               )
+               SELECT d.id, d.storage_key, d.thumb_key,
+                      ARRAY(SELECT t.storage_key FROM harvester_media_thumbnails t
+                            WHERE t.media_id = d.id) AS thumb_keys
+               FROM doomed d""",
+            (media_ids,),
+        ).fetchall()
+        keys: set[str] = set()
+        for r in rows:
+            keys.update(k for k in (r["storage_key"], r["thumb_key"], *r["thumb_keys"]) if k)
+        return len(rows), sorted(keys)
+
+    # ── analytics export ─────────────────────────────────────────
+
+    def export_horizon(self) -> dict:
+        """Where an incremental export may safely stop: sequences, clock, running writers.
+
+        ``xmax`` is the first transaction id not yet started; once every
+        transaction below it has finished (see oldest_running_xid), every
+        post/media id up to the returned sequence positions is settled and
+        every later change has ``updated_at`` at or after ``at``.
+        """
+        return self.conn.execute(
+            """SELECT pg_snapshot_xmax(pg_current_snapshot())::text::bigint AS xmax,
+                      clock_timestamp() AS at,
+                      COALESCE(pg_sequence_last_value(pg_get_serial_sequence('posts', 'id')), 0) AS posts_id,
+                      COALESCE(pg_sequence_last_value(pg_get_serial_sequence('media_objects', 'id')), 0) AS media_id"""
+        ).fetchone()
+
+    def oldest_running_xid(self) -> int:
+        row = self.conn.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin").fetchone()
+        return row["xmin"]
+
+    def begin_snapshot(self) -> None:
+        """Start a read-only REPEATABLE READ transaction (call right after commit/rollback)."""
+        self.conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+    def iter_export_rows(
+        self,
+        table: str,
+        *,
+        boards: Sequence[str] = (),
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after_id: int | None = None,
+        changed_since: datetime | None = None,
+        itersize: int = 10000,
+    ) -> Iterator[dict]:
+        """Stream ``posts``, ``threads`` or ``media`` rows for analytics export.
+
+        *boards*/*since*/*until* select by board and creation time (media:
+        referenced by a selected post).  With *after_id* only rows created
+        after it (posts/media by their own id, threads by their OP post's)
+        or, for posts and threads, updated at/after *changed_since* are
+        returned.  Rows are in no particular order.
+        """
+        where: list[str] = []
+        params: dict[str, Any] = {
+            "boards": list(boards), "since": since, "until": until,
+            "after_id": after_id, "changed_since": changed_since,
+        }
+        scope = []
+        if boards:
+            scope.append("b.slug = ANY(%(boards)s)")
+        if since is not None:
+            scope.append("{t}.created_at >= %(since)s")
+        if until is not None:
+            scope.append("{t}.created_at < %(until)s")
+
+        if table == "posts":
+            where += [c.format(t="p") for c in scope]
+            if after_id is not None:
+                where.append("(p.id > %(after_id)s OR p.updated_at >= %(changed_since)s)")
+            sql = """SELECT p.id, p.thread_id, b.slug AS board, p.board_post_no,
+                            p.created_at, p.updated_at, p.is_op,
+                            p.author_name, p.tripcode, p.capcode, p.subject, p.email,
+                            p.content, p.country_code, p.poster_id,
+                            p.media_id, p.media_filename, p.media_size, p.media_dimensions, p.media_hash,
+                            p.spoiler_image, p.deleted,
+                            CASE WHEN jsonb_typeof(p.metadata->'quotes') = 'array' THEN
+                                ARRAY(SELECT jsonb_array_elements_text(p.metadata->'quotes')::bigint)
+                            END AS quotes
+                     FROM posts p
+                     JOIN threads t ON t.id = p.thread_id
+                     JOIN boards b ON b.id = t.board_id"""
+        elif table == "threads":
+            where += [c.format(t="t") for c in scope]
+            if after_id is not None:
+                where.append(
+                    """(t.updated_at >= %(changed_since)s
+                        OR t.id IN (SELECT thread_id FROM posts WHERE id > %(after_id)s AND is_op))"""
+                )
+            sql = """SELECT t.id, b.slug AS board, t.created_at, t.updated_at, t.bumped_at,
+                            t.archived, t.archived_at, t.sticky, t.locked,
+                            t.reply_count, t.image_count
+                     FROM threads t
+                     JOIN boards b ON b.id = t.board_id"""
+        elif table == "media":
+            if scope:
+                where.append(
+                    """EXISTS (SELECT 1 FROM posts p
+                               JOIN threads t ON t.id = p.thread_id
+                               JOIN boards b ON b.id = t.board_id
+                               WHERE p.media_id = m.id::text AND """
+                    + " AND ".join(c.format(t="p") for c in scope) + ")"
+                )
+            if after_id is not None:
+                where.append("m.id > %(after_id)s")
+            sql = """SELECT m.id, m.hash_sha256, m.mime_type, m.file_size, m.width, m.height,
+                            m.storage_key, m.original_filename, m.phash, m.nsfw_flagged, m.banned
+                     FROM media_objects m"""
+        else:
+            raise ValueError(f"unknown export table {table!r}")
+        if where:
+            sql += "\n WHERE " + " AND ".join(where)
+
+        with self.conn.cursor(name=f"harvester_export_{table}") as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params)
+            yield from cur
+
     # ── transaction helpers ──────────────────────────────────────
 
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """Run a block under a savepoint of the open transaction.
+
+        If the block raises, only its own writes are rolled back and the
+        transaction stays usable; the exception still propagates.
+        """
+        conn = self.conn
+        if conn.info.transaction_status == TransactionStatus.IDLE:
+            # Outside a transaction psycopg's block would be the top-level one
+            # and commit on exit; open the caller's transaction first
+            conn.execute("SELECT 1")
+        with conn.transaction():
+            yield
+
     def commit(self) -> None:
         self.conn.commit()
 
@@ -0,0 +1,262 @@
+"""Background media downloads – prioritized and bandwidth-capped.
+
+Inline media makes every thread wait for its files at the API's pace.  With
+the scheduler enabled, _process_image() only queues the file; the post is
+committed without media, and download threads fetch queued files in
+priority order (OP files, which become catalog thumbnails, before reply
+files) under a global and a per-host bytes/second cap.  The harvester
+stores finished downloads and fills in their posts between its own
+transactions (Harvester.store_downloads), so all database work stays on
+one connection and thread.
+
+Jobs only enter the queue once the transaction that wrote their post has
+committed.  Each download reserves its size with the memory governor
+first, so when stored files aren't claimed fast enough the download
+threads wait; finished files are spilled to temp files instead while the
+process is over its soft memory limit.  Files still queued when the
+harvester closes are handed to harvester_media_retries instead of being
+lost.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterator
+
+from .config import DownloadConfig
+from .governor import MemoryGovernor, Spill
+
+if TYPE_CHECKING:
+    from .harvester import MediaSource
+    from .records import Media
+
+logger = logging.getLogger("harvester.downloads")
+
+PRIORITY_OP = 0        # OP files: the catalog's thumbnails
+PRIORITY_REPLY = 1     # reply files
+PRIORITY_LOW = 2       # anything that can wait (archived threads, backfills)
+
+DEFAULT_SIZE = 500_000  # bytes reserved for a file whose fsize is unknown
+
+
+@dataclass(order=True, slots=True)
+class DownloadJob:
+    sort_key: tuple[int, int]      # (priority, submission order)
+    board_slug: str = field(compare=False)
+    thread_no: int = field(compare=False)
+    post_no: int = field(compare=False)
+    media: Media = field(compare=False)
+
+
+@dataclass(slots=True)
+class Download:
+    """A finished job: the file's bytes, None if it is gone (404), or the error.
+
+    Call read() for the bytes (they may be spilled to disk) and hand the
+    download back to MediaScheduler.finished() once it is stored.
+    """
+    job: DownloadJob
+    data: bytes | None = None
+    error: Exception | None = None
+    spill: Spill | None = None
+    reserved: int = 0               # bytes held with the memory governor
+
+    def read(self) -> bytes | None:
+        if self.spill is not None:
+            self.data = self.spill.read()
+            self.spill = None
+        return self.data
+
+
+class ByteRate:
+    """Pace byte transfers to *rate* bytes per second (0 = unlimited).
+
+    Virtual-clock token bucket: reserve() books the next slot and returns
+    how long the caller must wait before sending, so one large file may
+    start right away and the following ones wait off its size.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + nbytes / self.rate
+            return start - now
+
+
+class MediaScheduler:
+    """Priority queue of media downloads served by a pool of threads."""
+
+    def __init__(
+        self, source: MediaSource, cfg: DownloadConfig | None = None, *, governor: MemoryGovernor | None = None,
+    ) -> None:
+        self.source = source
+        self.cfg = cfg or DownloadConfig.from_env()
+        self.governor = governor or MemoryGovernor()
+        self.enabled = self.cfg.enabled
+        self._rate = ByteRate(self.cfg.rate)
+        # Every file comes from the one image host (i.4cdn.org); its cap applies on top of the total
+        self._host_rate = ByteRate(self.cfg.host_rate)
+        self._pending: list[DownloadJob] = []          # written by the open transaction
+        self._heap: list[DownloadJob] = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._results: queue.Queue[Download] = queue.Queue(maxsize=max(self.cfg.buffer, 1))
+        self._outstanding = 0                          # queued + downloading + unclaimed results
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+
+    # ── transaction hooks ────────────────────────────────────────
+
+    def submit(self, board_slug: str, thread_no: int, post_no: int, media: Media, priority: int = PRIORITY_REPLY) -> None:
+        """Queue *media* for the post, once the open transaction commits."""
+        self._pending.append(DownloadJob((priority, next(self._order)), board_slug, thread_no, post_no, media))
+
+    def committed(self) -> None:
+        if not self._pending:
+            return
+        with self._cond:
+            for job in self._pending:
+                heapq.heappush(self._heap, job)
+            self._outstanding += len(self._pending)
+            self._cond.notify_all()
+        self._pending = []
+        self._start()
+
+    def discard(self) -> None:
+        self._pending = []
+
+    def mark(self) -> int:
+        """A point to rewind() to when a savepoint is rolled back."""
+        return len(self._pending)
+
+    def rewind(self, mark: int) -> None:
+        del self._pending[mark:]
+
+    # ── results ──────────────────────────────────────────────────
+
+    @property
+    def outstanding(self) -> int:
+        with self._cond:
+            return self._outstanding
+
+    def ready(self) -> Iterator[Download]:
+        """Finished downloads available right now."""
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._claimed()
+            yield result
+
+    def drain(self) -> Iterator[Download]:
+        """Every download still outstanding, waiting for each to finish."""
+        while self.outstanding:
+            result = self._results.get()
+            self._claimed()
+            yield result
+
+    def finished(self, result: Download) -> None:
+        """Release what *result* holds (its memory reservation, any spill file)."""
+        self.governor.release(result.reserved)
+        result.reserved = 0
+        if result.spill is not None:
+            result.spill.discard()
+            result.spill = None
+        result.data = None
+
+    def close(self) -> list[DownloadJob]:
+        """Stop the download threads; returns committed jobs that never finished."""
+        with self._cond:
+            self._stopping = True
+            left = [heapq.heappop(self._heap) for _ in range(len(self._heap))]
+            self._outstanding -= len(left)
+            self._cond.notify_all()
+        # Threads blocked on a full buffer need room to see the stop flag
+        while any(t.is_alive() for t in self._threads):
+            try:
+                result = self._results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            left.append(result.job)
+            self.finished(result)
+            self._claimed()
+        while not self._results.empty():
+            result = self._results.get_nowait()
+            left.append(result.job)
+            self.finished(result)
+            self._claimed()
+        self._threads = []
+        self._pending = []
+        return left
+
+    def _claimed(self) -> None:
+        with self._cond:
+            self._outstanding -= 1
+
+    # ── download threads ─────────────────────────────────────────
+
+    def _start(self) -> None:
+        if self._threads:
+            return
+        for i in range(max(self.cfg.workers, 1)):
+            thread = threading.Thread(target=self._run, name=f"media-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = heapq.heappop(self._heap)
+            self._results.put(self._download(job))
+
+    def _download(self, job: DownloadJob) -> Download:
+        expected = job.media.fsize or DEFAULT_SIZE
+        # Waits while downloaded-but-unstored files use up the in-flight budget
+        self.governor.acquire(expected)
+        if self._stopping:
+            self.governor.release(expected)
+            return Download(job, error=RuntimeError("scheduler closed"))
+        self._pace(expected)
+        try:
+            data = self.source.download_image(job.board_slug, job.media.tim, job.media.ext)
+        except Exception as exc:
+            self.governor.release(expected)
+            return Download(job, error=exc)
+        if data is None:
+            self.governor.release(expected)
+            return Download(job)
+        if job.media.fsize is None:
+            self._pace(len(data), wait=False)
+        if self.governor.over_budget():
+            self.governor.release(expected)
+            return Download(job, spill=self.governor.spill(data))
+        # Hold the real size from here on
+        if len(data) > expected:
+            self.governor.acquire(len(data) - expected, wait=False)
+        else:
+            self.governor.release(expected - len(data))
+        return Download(job, data, reserved=len(data))
+
+    def _pace(self, nbytes: int, *, wait: bool = True) -> None:
+        delay = max(self._rate.reserve(nbytes), self._host_rate.reserve(nbytes))
+        if wait and delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,174 @@
+"""Domain events – publish imports to the ``ashchan:events`` Redis stream.
+
+Events follow contracts/events/*.json and are encoded like the services'
+CloudEvent (``{id, type, occurred_at, payload}`` in the ``event`` field of
+an XADD), so existing consumers such as search indexing handle harvested
+content the same way as native posts.
+
+Delivery uses a transactional outbox: events are buffered while a
+transaction runs, written to ``harvester_event_outbox`` in that same
+transaction just before it commits, and relayed to Redis afterwards in
+pipelined XADD batches.  Nothing is published for rolled-back data, and
+events whose relay fails stay in the outbox for the next one.  A crash
+between XADD and the outbox delete can publish an event twice, so
+consumers should treat ``id`` as an idempotency key.
+
+redis-py is an optional dependency, imported on first publish.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+
+from .config import EventsConfig
+
+if TYPE_CHECKING:
+    from .db import Database
+    from .records import PostRow
+
+logger = logging.getLogger("harvester.events")
+
+THREAD_CREATED = "thread.created"
+POST_CREATED = "post.created"
+MEDIA_INGESTED = "media.ingested"
+
+CONTENT_LIMIT = 10_000   # post.created content is truncated like BoardService does
+
+
+def _rfc3339(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def encode_event(event_type: str, payload: dict[str, Any]) -> str:
+    """A CloudEvent JSON document, as CloudEvent::toJson() writes it."""
+    return json.dumps(
+        {
+            "id": str(uuid.uuid4()),
+            "type": event_type,
+            "occurred_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "payload": payload,
+        },
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+class EventOutbox:
+    """Buffer events per transaction and relay committed ones to Redis."""
+
+    def __init__(self, db: Database, cfg: EventsConfig | None = None) -> None:
+        self.db = db
+        self.cfg = cfg or EventsConfig.from_env()
+        self.enabled = self.cfg.enabled
+        self.stats = {"queued": 0, "published": 0}
+        self._buffer: list[tuple[str, str]] = []
+        self._staged = False   # outbox rows written since the last successful publish
+        self._redis: Any = None
+
+    @property
+    def _client(self) -> Any:
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis(
+                host=self.cfg.host, port=self.cfg.port, db=self.cfg.db, password=self.cfg.password,
+                socket_timeout=10.0,
+            )
+        return self._redis
+
+    # ── event builders ───────────────────────────────────────────
+
+    def add(self, event_type: str, payload: dict[str, Any]) -> None:
+        if self.enabled:
+            self._buffer.append((event_type, encode_event(event_type, payload)))
+
+    def thread_created(self, board_slug: str, thread_no: int, op_post_id: int, created_at: datetime) -> None:
+        self.add(THREAD_CREATED, {
+            "board_id": board_slug,
+            "thread_id": str(thread_no),
+            "op_post_id": str(op_post_id),
+            "created_at": _rfc3339(created_at),
+        })
+
+    def post_created(self, board_slug: str, row: PostRow, post_id: int) -> None:
+        self.add(POST_CREATED, {
+            "board_id": board_slug,
+            "thread_id": str(row.thread_id),
+            "post_id": str(post_id),
+            "created_at": _rfc3339(row.created_at),
+            "content": row.content[:CONTENT_LIMIT],
+            "media_refs": [row.media.media_url] if row.media else [],
+        })
+
+    def media_ingested(self, media_id: int, sha256: str, content_type: str, size: int) -> None:
+        self.add(MEDIA_INGESTED, {
+            "media_id": str(media_id),
+            "hash": sha256,
+            "content_type": content_type,
+            "size_bytes": size,
+            "created_at": _rfc3339(datetime.now(timezone.utc)),
+        })
+
+    # ── transaction hooks ────────────────────────────────────────
+
+    def stage(self) -> None:
+        """Write buffered events into the open transaction (call right before commit)."""
+        if self._buffer:
+            self.db.insert_outbox_events(self._buffer)
+            self.stats["queued"] += len(self._buffer)
+            self._buffer = []
+            self._staged = True
+
+    def discard(self) -> None:
+        self._buffer = []
+
+    def mark(self) -> int:
+        """A point to rewind() to when a savepoint is rolled back."""
+        return len(self._buffer)
+
+    def rewind(self, mark: int) -> None:
+        del self._buffer[mark:]
+
+    def publish(self, *, force: bool = False) -> int:
+        """Relay committed outbox events to the stream; returns how many were sent.
+
+        Does nothing unless this outbox staged events since its last
+        successful publish, or *force* (to drain events left by other
+        processes).  Commits on the database connection, so call it between
+        transactions.  Stops at the first Redis error and leaves the rest
+        for the next call.
+        """
+        if not self.enabled or not (self._staged or force):
+            return 0
+        sent = 0
+        while True:
+            rows = self.db.claim_outbox_events(self.cfg.batch_size)
+            if not rows:
+                self.db.commit()
+                self._staged = False
+                break
+            try:
+                pipe = self._client.pipeline(transaction=False)
+                for row in rows:
+                    pipe.xadd(
+                        self.cfg.stream, {"event": row["event"]},
+                        maxlen=self.cfg.maxlen, approximate=True,
+                    )
+                pipe.execute()
+            except Exception as exc:
+                self.db.rollback()
+                logger.warning("Publishing %d events failed, left in outbox: %s", len(rows), exc)
+                break
+            self.db.delete_outbox_events([row["id"] for row in rows])
+            self.db.commit()
+            sent += len(rows)
+        self.stats["published"] += sent
+        return sent
+
+    def close(self) -> None:
+        if self._redis is not None:
+            self._redis.close()
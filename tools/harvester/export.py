@@ -0,0 +1,279 @@
+"""Analytics export – stream harvested tables into partitioned Parquet.
+
+Posts, threads and media metadata are read through server-side cursors in
+one REPEATABLE READ snapshot and written as Hive-style partitions::
+
+    OUT/posts/board=g/month=2024-05/part-20240601T000000-0000.parquet
+    OUT/threads/board=g/month=2024-05/...
+    OUT/media/part-...
+
+Rows are buffered per partition and written a row group at a time, with a
+bounded number of files open, so memory depends on the row group size and
+not on how much is exported.  Under memory pressure (see governor) the
+largest buffer is written out early as a smaller row group.
+
+Incremental exports keep a watermark in harvester_checkpoints: the last
+settled post and media ids plus the time the export started.  The next run
+exports posts and media created after those ids and posts and threads
+updated since that time, so each run writes new part files next to the old
+ones.  A row changed twice shows up in two runs; readers should keep the
+latest ``updated_at`` per ``id``.  Media rows carry no timestamps, so
+later changes to a media object (pHash, thumbnails) are not re-exported.
+
+pyarrow is an optional dependency, imported when an export starts.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Sequence
+
+from .db import Database
+from .governor import MemoryGovernor
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+logger = logging.getLogger("harvester.export")
+
+TABLES = ("posts", "threads", "media")
+SETTLE_TIMEOUT = 60.0   # seconds to wait for writers that predate the export
+
+
+def _schemas() -> dict[str, pa.Schema]:
+    import pyarrow as pa
+
+    ts = pa.timestamp("us", tz="UTC")
+    return {
+        "posts": pa.schema([
+            ("id", pa.int64()), ("thread_id", pa.int64()), ("board", pa.string()),
+            ("board_post_no", pa.int64()), ("created_at", ts), ("updated_at", ts), ("is_op", pa.bool_()),
+            ("author_name", pa.string()), ("tripcode", pa.string()), ("capcode", pa.string()),
+            ("subject", pa.string()), ("email", pa.string()), ("content", pa.string()),
+            ("country_code", pa.string()), ("poster_id", pa.string()),
+            ("media_id", pa.string()), ("media_filename", pa.string()), ("media_size", pa.int64()),
+            ("media_dimensions", pa.string()), ("media_hash", pa.string()),
+            ("spoiler_image", pa.bool_()), ("deleted", pa.bool_()), ("quotes", pa.list_(pa.int64())),
+        ]),
+        "threads": pa.schema([
+            ("id", pa.int64()), ("board", pa.string()),
+            ("created_at", ts), ("updated_at", ts), ("bumped_at", ts),
+            ("archived", pa.bool_()), ("archived_at", ts), ("sticky", pa.bool_()), ("locked", pa.bool_()),
+            ("reply_count", pa.int32()), ("image_count", pa.int32()),
+        ]),
+        "media": pa.schema([
+            ("id", pa.int64()), ("hash_sha256", pa.string()), ("mime_type", pa.string()),
+            ("file_size", pa.int64()), ("width", pa.int32()), ("height", pa.int32()),
+            ("storage_key", pa.string()), ("original_filename", pa.string()), ("phash", pa.string()),
+            ("nsfw_flagged", pa.bool_()), ("banned", pa.bool_()),
+        ]),
+    }
+
+
+class PartitionedWriter:
+    """Buffer rows per partition and write them as Parquet row groups.
+
+    At most *max_open* files are open; the least recently written one is
+    closed to make room, and its partition starts a new part file if more
+    rows arrive.  At most *max_buffered* rows are held across partitions,
+    fewer while *governor* reports the process over its soft memory limit.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        schema: pa.Schema,
+        *,
+        stamp: str,
+        row_group_size: int = 65536,
+        max_open: int = 16,
+        max_buffered: int = 262144,
+        compression: str = "zstd",
+        governor: MemoryGovernor | None = None,
+    ) -> None:
+        self.root = root
+        self.schema = schema
+        self.stamp = stamp
+        self.row_group_size = row_group_size
+        self.max_open = max_open
+        self.max_buffered = max_buffered
+        self.compression = compression
+        self.governor = governor
+        self.rows = 0
+        self.files = 0
+        self._buffers: dict[str, list[dict]] = {}
+        self._buffered = 0
+        self._writers: OrderedDict[str, pq.ParquetWriter] = OrderedDict()
+
+    def write(self, partition: str, row: dict) -> None:
+        buf = self._buffers.setdefault(partition, [])
+        buf.append(row)
+        self._buffered += 1
+        self.rows += 1
+        if len(buf) >= self.row_group_size:
+            self._flush(partition)
+        elif self._buffered >= self.max_buffered or (
+            self.governor is not None and self.rows % 1024 == 0 and self.governor.over_budget()
+        ):
+            self._flush(max(self._buffers, key=lambda p: len(self._buffers[p])))
+
+    def close(self) -> None:
+        for partition in list(self._buffers):
+            self._flush(partition)
+        while self._writers:
+            self._writers.popitem(last=False)[1].close()
+
+    def _flush(self, partition: str) -> None:
+        import pyarrow as pa
+
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        self._buffered -= len(rows)
+        self._writer(partition).write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def _writer(self, partition: str) -> pq.ParquetWriter:
+        import pyarrow.parquet as pq
+
+        writer = self._writers.get(partition)
+        if writer is not None:
+            self._writers.move_to_end(partition)
+            return writer
+        if len(self._writers) >= self.max_open:
+            self._writers.popitem(last=False)[1].close()
+        directory = os.path.join(self.root, partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{self.stamp}-{self.files:04d}.parquet")
+        self.files += 1
+        writer = self._writers[partition] = pq.ParquetWriter(path, self.schema, compression=self.compression)
+        return writer
+
+
+class Exporter:
+    """Export selected boards/dates (optionally only changes) to a Parquet tree."""
+
+    def __init__(
+        self,
+        db: Database,
+        out_dir: str,
+        *,
+        tables: Sequence[str] = TABLES,
+        boards: Sequence[str] = (),
+        since: datetime | None = None,
+        until: datetime | None = None,
+        incremental: bool = False,
+        checkpoint: str = "export",
+        row_group_size: int = 65536,
+        compression: str = "zstd",
+        governor: MemoryGovernor | None = None,
+    ) -> None:
+        unknown = set(tables) - set(TABLES)
+        if unknown:
+            raise ValueError(f"unknown export tables: {', '.join(sorted(unknown))}")
+        self.db = db
+        self.out_dir = out_dir
+        self.tables = tables
+        self.filters = {"boards": boards, "since": since, "until": until}
+        self.incremental = incremental
+        self.checkpoint = checkpoint
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.governor = governor
+        self.stats = {table: 0 for table in tables} | {"files": 0}
+
+    def run(self) -> dict:
+        """Export once; with incremental, advance the watermark afterwards."""
+        started = time.time()
+        schemas = _schemas()
+        # Watermarks are read and written on self.db; the snapshot gets its own
+        # connection so its long read-only transaction stays clean.
+        mark = self._load_watermark() if self.incremental else None
+        snap = Database(self.db.cfg)
+        try:
+            horizon = self._settle(snap) if self.incremental else None
+            snap.begin_snapshot()
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            for table in self.tables:
+                after_id = None
+                if mark is not None:
+                    after_id = mark["media_id"] if table == "media" else mark["posts_id"]
+                rows = snap.iter_export_rows(
+                    table, **self.filters, after_id=after_id,
+                    changed_since=mark["at"] if mark is not None else None,
+                )
+                self._export_table(table, rows, schemas[table], stamp)
+            snap.commit()
+        finally:
+            snap.close()
+        if horizon is not None:
+            self._save_watermark(horizon)
+        logger.info("Exported %s in %.1fs", self.stats, time.time() - started)
+        return self.stats
+
+    def _export_table(self, table: str, rows: Any, schema: pa.Schema, stamp: str) -> None:
+        writer = PartitionedWriter(
+            os.path.join(self.out_dir, table), schema, stamp=stamp,
+            row_group_size=self.row_group_size, compression=self.compression, governor=self.governor,
+        )
+        try:
+            for row in rows:
+                if table == "media":
+                    writer.write("", row)
+                else:
+                    writer.write(f"board={row['board']}/month={row['created_at']:%Y-%m}", row)
+        finally:
+            writer.close()
+        self.stats[table] = writer.rows
+        self.stats["files"] += writer.files
+        logger.info("Exported %d %s rows to %d files", writer.rows, table, writer.files)
+
+    # ── watermark ────────────────────────────────────────────────
+
+    def _settle(self, snap: Database) -> dict:
+        """Wait until every writer that started before now has finished.
+
+        Afterwards, rows up to the returned ids are all visible, and any
+        later change will have ``updated_at`` at or after the returned time.
+        """
+        horizon = snap.export_horizon()
+        snap.commit()
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        while snap.oldest_running_xid() < horizon["xmax"]:
+            snap.commit()
+            if time.monotonic() > deadline:
+                logger.warning("Transactions older than the export are still open; proceeding anyway")
+                break
+            time.sleep(0.2)
+        snap.commit()
+        return horizon
+
+    def _load_watermark(self) -> dict | None:
+        posts_id = self.db.get_checkpoint(f"{self.checkpoint}:posts_id")
+        if posts_id is None:
+            self.db.commit()
+            return None
+        at_us = self.db.get_checkpoint(f"{self.checkpoint}:at_us") or 0
+        mark = {
+            "posts_id": posts_id,
+            "media_id": self.db.get_checkpoint(f"{self.checkpoint}:media_id") or 0,
+            "at": datetime.fromtimestamp(at_us / 1e6, tz=timezone.utc),
+        }
+        self.db.commit()
+        return mark
+
+    def _save_watermark(self, horizon: dict) -> None:
+        self.db.set_checkpoint(f"{self.checkpoint}:posts_id", horizon["posts_id"])
+        self.db.set_checkpoint(f"{self.checkpoint}:media_id", horizon["media_id"])
+        self.db.set_checkpoint(f"{self.checkpoint}:at_us", int(horizon["at"].timestamp() * 1e6))
+        self.db.commit()
+
+    def reset(self) -> None:
+        """Forget the watermark, so the next incremental export starts over."""
+        for name in ("posts_id", "media_id", "at_us"):
+            self.db.clear_checkpoint(f"{self.checkpoint}:{name}")
+        self.db.commit()
@@ -0,0 +1,158 @@
+"""Memory governor – keep a harvester process inside an RSS budget.
+
+Large allocations along the pipeline reserve their size here first: media
+bytes being downloaded or waiting to be stored (downloads.MediaScheduler),
+decoded images being thumbnailed (Harvester._store_media) and rows
+buffered for Parquet (export.PartitionedWriter).  Reservations share one
+in-flight limit, a fraction of the budget, so a stage that has used it up
+makes the stages feeding it wait instead of allocating more.  Stages that
+must not wait (the single thread that drains the pipeline) reserve with
+``wait=False``: they always proceed, but still hold back everyone else.
+
+Reservations are estimates, so the governor also samples the real RSS;
+above the soft limit buffers spill to temp files (see Spill) or flush
+early rather than grow.  The budget is per process – give each worker on
+a shared VM its own share.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from .config import MemoryConfig
+
+logger = logging.getLogger("harvester.governor")
+
+MIN_INFLIGHT = 16_000_000      # never cap in-flight reservations below this
+RSS_SAMPLE_INTERVAL = 0.1      # seconds an RSS reading is reused
+
+
+def default_budget() -> int:
+    """80% of the cgroup memory limit, or of physical RAM without one."""
+    limit = 0
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            limit = int(value)
+            break
+    if not limit:
+        try:
+            limit = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError, AttributeError):
+            limit = 1 << 30
+    return int(limit * 0.8)
+
+
+def rss_bytes() -> int:
+    """Current resident set size, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MemoryGovernor:
+    """Byte reservations against a shared in-flight limit, plus RSS checks."""
+
+    def __init__(self, cfg: MemoryConfig | None = None) -> None:
+        self.cfg = cfg or MemoryConfig.from_env()
+        self.budget = self.cfg.budget or default_budget()
+        self.limit = max(int(self.budget * self.cfg.inflight_ratio), MIN_INFLIGHT)
+        self.soft_limit = int(self.budget * self.cfg.soft_ratio)
+        self._held = 0
+        self._cond = threading.Condition()
+        self._rss = 0
+        self._sampled = 0.0
+        self.stats = {"waits": 0, "spills": 0, "spilled_bytes": 0}
+
+    @property
+    def held(self) -> int:
+        with self._cond:
+            return self._held
+
+    def acquire(self, nbytes: int, *, wait: bool = True) -> None:
+        """Reserve *nbytes*, waiting while that would exceed the limit.
+
+        A reservation larger than the limit proceeds once nothing else is
+        held, so an oversized file slows the pipeline down but can't stall it.
+        """
+        with self._cond:
+            if wait and self._held and self._held + nbytes > self.limit:
+                self.stats["waits"] += 1
+                while self._held and self._held + nbytes > self.limit:
+                    self._cond.wait()
+            self._held += nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self._held = max(self._held - nbytes, 0)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, *, wait: bool = True) -> Iterator[None]:
+        self.acquire(nbytes, wait=wait)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def rss(self) -> int:
+        now = time.monotonic()
+        if now - self._sampled > RSS_SAMPLE_INTERVAL:
+            self._rss = rss_bytes()
+            self._sampled = now
+        return self._rss
+
+    def over_budget(self) -> bool:
+        """True while the process is above the soft limit; buffers should shrink."""
+        return self.rss() > self.soft_limit
+
+    def spill(self, data: bytes) -> Spill:
+        """Move *data* to a temp file (the caller drops its reference)."""
+        spill = Spill.write(data, self.cfg.spill_dir)
+        with self._cond:
+            self.stats["spills"] += 1
+            self.stats["spilled_bytes"] += len(data)
+        return spill
+
+
+class Spill:
+    """Bytes parked in a temp file until they are needed again."""
+
+    __slots__ = ("path", "size")
+
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = size
+
+    @classmethod
+    def write(cls, data: bytes, directory: str | None = None) -> Spill:
+        fd, path = tempfile.mkstemp(prefix="harvester-spill-", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return cls(path, len(data))
+
+    def read(self) -> bytes:
+        """The bytes back; the file is removed."""
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
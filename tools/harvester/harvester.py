@@ -3,15 +3,28 @@
 from __future__ import annotations
 
 import logging
+import os
+from contextlib import contextmanager
+from dataclasses import asdict
 from datetime import datetime, timezone
-from typing import Any
-
-from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Protocol
 
 from .api import FourChanAPI
+from .cache import CacheInvalidator
+from .comment import backlink_map, parse_comment
 from .config import HarvesterConfig
 from .db import Database
-from .storage import DiskStorageService, StorageService
+from .downloads import PRIORITY_OP, PRIORITY_REPLY, MediaScheduler
+from .events import EventOutbox
+from .governor import MemoryGovernor
+from .jobs import JOB_MEDIA, media_payload
+from .phash import image_phash
+from .records import CatalogThread, Media, MediaRef, Post, PostRow, Thread
+from .scheduler import archive_window, plan_board
+from .storage import NO_THUMB_EXTS, DiskStorageService, StorageService
+
+if TYPE_CHECKING:
+    from .planner import HarvestPlan
 
 logger = logging.getLogger("harvester.core")
 
@@ -20,132 +33,313 @@ def _ts_to_dt(ts: int) -> datetime:
     return datetime.fromtimestamp(ts, tz=timezone.utc)
 
 
+class MediaSource(Protocol):
+    """Anything that can fetch 4chan media bytes (FourChanAPI, LocalMediaSource)."""
+
+    def download_image(self, board: str, tim: int, ext: str) -> bytes | None: ...
+
+
 class Harvester:
     """Orchestrates the full 4chan → ashchan import pipeline."""
 
-    def __init__(self, cfg: HarvesterConfig | None = None) -> None:
+    def __init__(self, cfg: HarvesterConfig | None = None, *, media_source: MediaSource | None = None) -> None:
         self.cfg = cfg or HarvesterConfig()
         self.api = FourChanAPI(self.cfg.fourchan)
+        # Where image bytes come from; defaults to the live CDN via the API client
+        self.media: MediaSource = media_source or self.api
         self.db = Database(self.cfg.db)
+        # Varnish pages touched by the open transaction, invalidated after commit()
+        self.cache = CacheInvalidator(self.cfg.cache)
+        # Domain events, staged in the open transaction and relayed after commit()
+        self.events = EventOutbox(self.db, self.cfg.events)
+        # Memory budget shared by downloads, thumbnailing and buffers
+        self.governor = MemoryGovernor(self.cfg.memory)
+        # Background media downloads, queued after commit() and stored by store_downloads()
+        self.downloads = MediaScheduler(self.media, self.cfg.downloads, governor=self.governor)
+        # Threads written by the open transaction, finalized in commit()
+        self._touched: set[int] = set()
+        self._storing = False
         if self.cfg.download_images:
             if self.cfg.storage_driver == "disk":
                 self.storage: StorageService | DiskStorageService | None = DiskStorageService(
-                    self.cfg.disk, thumb_max=self.cfg.thumbnail_max_size
+                    self.cfg.disk, self.cfg.thumbnail_specs,
+                    optimize=self.cfg.thumbnail_optimize, progressive=self.cfg.thumbnail_progressive,
                 )
             else:
                 self.storage = StorageService(
-                    self.cfg.s3, thumb_max=self.cfg.thumbnail_max_size
+                    self.cfg.s3, self.cfg.thumbnail_specs,
+                    optimize=self.cfg.thumbnail_optimize, progressive=self.cfg.thumbnail_progressive,
                 )
         else:
             self.storage = None
         # Stats
-        self.stats = {"threads": 0, "posts": 0, "images": 0, "skipped": 0, "errors": 0}
+        self.stats = {"threads": 0, "posts": 0, "images": 0, "skipped": 0, "errors": 0, "quarantined": 0}
 
     # ── image handling ───────────────────────────────────────────
 
-    def _process_image(self, board_slug: str, post: dict) -> dict:
+    def _process_image(self, board_slug: str, post: Post, thread_no: int) -> MediaRef | None:
         """Download an image from 4chan and upload to S3.
 
-        Returns a dict with media fields to merge into the DB post row.
+        Returns the media columns for the DB post row.  If the fetch or
+        upload fails, the post is queued in harvester_media_retries and
+        imported without media; retry_media() back-fills it later.  With
+        cfg.media_jobs the fetch is queued as a worker job instead, and with
+        cfg.downloads.enabled it is handed to the background scheduler.
+        """
+        media = post.media
+        if media is None or not self.cfg.download_images or not self.storage:
+            return None
+        if self.cfg.media_jobs:
+            self.db.enqueue_jobs(JOB_MEDIA, board_slug, [(str(post.no), media_payload(media, thread_no, post.no), 0.0)])
+            return None
+        if self.downloads.enabled:
+            self.downloads.submit(board_slug, thread_no, post.no, media, PRIORITY_OP if post.is_op else PRIORITY_REPLY)
+            return None
+        try:
+            # A failed media row must not abort the thread's transaction
+            with self.savepoint():
+                return self._fetch_media(board_slug, media)
+        except Exception as exc:
+            logger.warning("Media %s%s from /%s/ failed, queued for retry: %s", media.tim, media.ext, board_slug, exc)
+            self.stats["errors"] += 1
+            self.db.enqueue_media_retry(board_slug, thread_no, post.no, media, str(exc))
+            return None
+
+    def _fetch_media(self, board_slug: str, media: Media) -> MediaRef | None:
+        """Fetch, dedup and store one post's media; raises on transient failure.
+
+        Returns None if the file is gone for good (404).
         """
-        result: dict[str, Any] = {}
-        tim = post.get("tim")
-        ext = post.get("ext")
-        if not tim or not ext or not self.cfg.download_images or not self.storage:
-            return result
-
-        filename = post.get("filename", str(tim))
-        fsize = post.get("fsize", 0)
-        md5 = post.get("md5", "")
-        w = post.get("w")
-        h = post.get("h")
-
-        # Download full image
-        image_data = self.api.download_image(board_slug, tim, ext)
+        image_data = self.media.download_image(board_slug, media.tim, media.ext)
+        return self._store_media(board_slug, media, image_data)
+
+    def _store_media(self, board_slug: str, media: Media, image_data: bytes | None) -> MediaRef | None:
+        """Dedup and store downloaded media bytes; None (a 404) means the file is gone."""
+        assert self.storage is not None
+        ext = media.ext
+        original_filename = media.filename + ext
+
         if not image_data:
-            logger.warning("Failed to download image %s%s from /%s/", tim, ext, board_slug)
+            logger.warning("Failed to download image %s%s from /%s/", media.tim, ext, board_slug)
             self.stats["errors"] += 1
-            return result
+            return None
 
         sha256 = StorageService.sha256(image_data)
 
         # Dedup: check if we already have this hash
         existing = self.db.media_hash_exists(sha256)
         if existing:
-            logger.debug("Image %s already stored (hash=%s)", filename, sha256[:12])
+            logger.debug("Image %s already stored (hash=%s)", media.filename, sha256[:12])
             self.stats["skipped"] += 1
-            url_prefix = (
-                self.cfg.disk.url_prefix
-                if self.cfg.storage_driver == "disk"
-                else f"{self.cfg.s3.endpoint}/{self.cfg.s3.bucket}"
+            return self._existing_media_ref(existing, media)
+
+        phash = image_phash(image_data, ext) if self.cfg.compute_phash else None
+        if phash and self.cfg.phash_reuse:
+            near = self.db.find_near_duplicates(phash, self.cfg.phash_max_distance, limit=1)
+            if near:
+                logger.debug(
+                    "Image %s is a near-duplicate of media %s (distance %d)",
+                    media.filename, near[0]["id"], near[0]["distance"],
+                )
+                self.stats["skipped"] += 1
+                return self._existing_media_ref(near[0], media)
+
+        # Upload to storage (S3 or disk).  Decoding for thumbnails is the
+        # biggest allocation here; this thread drains the pipeline, so it
+        # doesn't wait, but holding the reservation makes downloads wait.
+        decoded = media.w * media.h * 4 if media.w and media.h and ext.lower() not in NO_THUMB_EXTS else 0
+        with self.governor.reserve(decoded, wait=False):
+            upload_info = self.storage.upload(
+                image_data, ext, generate_thumb=self.cfg.generate_thumbnails
             )
-            return {
-                "media_url": f"{url_prefix}/{existing['storage_key']}",
-                "thumb_url": f"{url_prefix}/{existing['thumb_key']}" if existing.get("thumb_key") else None,
-                "media_filename": filename + ext,
-                "media_size": fsize or existing.get("file_size"),
-                "media_dimensions": f"{w}x{h}" if w and h else None,
-                "media_hash": md5,
-                "media_id": str(existing["id"]),
-            }
-
-        # Upload to storage (S3 or disk)
-        upload_info = self.storage.upload(
-            image_data, ext, generate_thumb=self.cfg.generate_thumbnails
-        )
 
         # Store in media_objects
         media_id = self.db.insert_media_object(
             hash_sha256=upload_info["hash_sha256"],
             mime_type=upload_info["mime_type"],
             file_size=upload_info["file_size"],
-            width=upload_info.get("width") or w,
-            height=upload_info.get("height") or h,
+            width=upload_info.get("width") or media.w,
+            height=upload_info.get("height") or media.h,
             storage_key=upload_info["storage_key"],
             thumb_key=upload_info.get("thumb_key"),
-            original_filename=filename + ext,
+            original_filename=original_filename,
+            phash=phash,
+        )
+        self.db.insert_media_thumbnails(media_id, upload_info["thumbnails"])
+        if upload_info.get("duration") is not None or upload_info.get("codec"):
+            self.db.set_media_info(media_id, upload_info.get("duration"), upload_info.get("codec"))
+        self.events.media_ingested(
+            media_id, upload_info["hash_sha256"], upload_info["mime_type"], upload_info["file_size"]
         )
 
         self.stats["images"] += 1
-        return {
-            "media_url": upload_info["media_url"],
-            "thumb_url": upload_info.get("thumb_url"),
-            "media_filename": filename + ext,
-            "media_size": fsize or upload_info["file_size"],
-            "media_dimensions": f"{w}x{h}" if w and h else None,
-            "media_hash": md5,
-            "media_id": str(media_id),
-        }
+        return MediaRef(
+            media_url=upload_info["media_url"],
+            thumb_url=upload_info.get("thumb_url"),
+            media_filename=original_filename,
+            media_size=media.fsize or upload_info["file_size"],
+            media_dimensions=media.dimensions,
+            media_hash=media.md5,
+            media_id=str(media_id),
+            thumbnails=self._thumbnail_refs(upload_info["thumbnails"]),
+        )
+
+    @property
+    def _url_prefix(self) -> str:
+        if self.cfg.storage_driver == "disk":
+            return self.cfg.disk.url_prefix
+        return f"{self.cfg.s3.endpoint}/{self.cfg.s3.bucket}"
+
+    def _thumbnail_refs(self, thumbnails: list[dict]) -> list[dict] | None:
+        """Thumbnail variants in the posts.metadata form the frontend picks from."""
+        if not thumbnails:
+            return None
+        return [
+            {
+                "name": t["name"],
+                "type": t["mime_type"],
+                "url": f"{self._url_prefix}/{t['storage_key']}",
+                "w": t["width"],
+                "h": t["height"],
+            }
+            for t in thumbnails
+        ]
+
+    def _existing_media_ref(self, existing: dict, media: Media) -> MediaRef:
+        """Point a post at an already-stored media_objects row."""
+        url_prefix = self._url_prefix
+        return MediaRef(
+            media_url=f"{url_prefix}/{existing['storage_key']}",
+            thumb_url=f"{url_prefix}/{existing['thumb_key']}" if existing.get("thumb_key") else None,
+            media_filename=media.filename + media.ext,
+            media_size=media.fsize or existing.get("file_size"),
+            media_dimensions=media.dimensions,
+            media_hash=media.md5,
+            media_id=str(existing["id"]),
+            thumbnails=self._thumbnail_refs(self.db.media_thumbnails(existing["id"])),
+        )
+
+    def backfill_phash(self, *, batch_size: int = 200, limit: int = 0) -> int:
+        """Compute pHashes for stored images that lack one, in keyset batches."""
+        if not self.storage:
+            return 0
+        done = 0
+        last_id = 0
+        seen = 0
+        while limit <= 0 or seen < limit:
+            rows = self.db.media_without_phash(last_id, batch_size)
+            if not rows:
+                break
+            for row in rows:
+                last_id = row["id"]
+                seen += 1
+                key = row["storage_key"]
+                try:
+                    data = self.storage.read(key)
+                except Exception as exc:
+                    logger.warning("Cannot read %s for pHash: %s", key, exc)
+                    self.stats["errors"] += 1
+                    continue
+                phash = image_phash(data, os.path.splitext(key)[1])
+                if phash:
+                    self.db.set_media_phash(row["id"], phash)
+                    done += 1
+            self.commit()
+            logger.info("pHash backfill: %d hashed (last id %d)", done, last_id)
+        return done
 
     # ── post mapping ─────────────────────────────────────────────
 
-    def _map_post(self, board_slug: str, post: dict, thread_no: int) -> dict:
-        """Convert a 4chan post object into keyword args for Database.insert_post()."""
-        is_op = post.get("resto", 0) == 0
-        ts = post.get("time", 0)
-        created_at = _ts_to_dt(ts) if ts else datetime.now(timezone.utc)
-
-        # Process image if present
-        media_fields = self._process_image(board_slug, post)
-
-        return {
-            "thread_id": thread_no,
-            "board_post_no": post["no"],
-            "created_at": created_at,
-            "content": post.get("com", ""),
-            "content_html": post.get("com"),
-            "is_op": is_op,
-            "author_name": post.get("name", "Anonymous"),
-            "tripcode": post.get("trip"),
-            "capcode": post.get("capcode"),
-            "subject": post.get("sub"),
-            "email": post.get("email"),
-            "country_code": post.get("country"),
-            "country_name": post.get("country_name"),
-            "poster_id": post.get("id"),  # 4chan's poster ID field
-            "spoiler_image": bool(post.get("spoiler", 0)),
-            **media_fields,
-        }
+    def _map_post(
+        self, board_slug: str, post: Post, thread_no: int, *, media: MediaRef | None = None,
+    ) -> PostRow:
+        """Convert a 4chan post into a row for Database.insert_post().
+
+        *media* is the post's already-stored file (a quarantine retry);
+        without it the post's image is processed.
+        """
+        created_at = _ts_to_dt(post.time) if post.time else datetime.now(timezone.utc)
+        comment = parse_comment(post.com)
+        if media is None:
+            media = self._process_image(board_slug, post, thread_no)
+        metadata: dict = {"quotes": comment.quotes}
+        if media and media.thumbnails:
+            metadata["thumbnails"] = media.thumbnails
+
+        return PostRow(
+            thread_id=thread_no,
+            board_post_no=post.no,
+            created_at=created_at,
+            content=comment.text,
+            content_html=comment.html or None,
+            is_op=post.is_op,
+            author_name=post.name or "Anonymous",
+            tripcode=post.trip,
+            capcode=post.capcode,
+            subject=post.sub,
+            email=post.email,
+            country_code=post.country,
+            country_name=post.country_name,
+            poster_id=post.id,  # 4chan's poster ID field
+            spoiler_image=bool(post.spoiler),
+            metadata=metadata,
+            media=media,
+        )
+
+    @staticmethod
+    def _link_backlinks(rows: list[PostRow]) -> None:
+        """Add each post's in-batch backlinks to its metadata, in place."""
+        quotes = {r.board_post_no: r.metadata["quotes"] for r in rows if r.metadata}
+        backlinks = backlink_map(quotes)
+        for r in rows:
+            if r.metadata is not None:
+                r.metadata["backlinks"] = backlinks.get(r.board_post_no, [])
+
+    def _map_posts(self, board_slug: str, posts: list[Post], thread_no: int) -> list[PostRow]:
+        """Map one thread's posts, quarantining any that fail to map."""
+        rows = []
+        for post in posts:
+            try:
+                rows.append(self._map_post(board_slug, post, thread_no))
+            except Exception as exc:
+                self._quarantine(board_slug, thread_no, post, None, exc)
+        self._link_backlinks(rows)
+        return rows
+
+    def _insert_posts(
+        self, board_slug: str, thread_no: int, rows: list[PostRow], posts: list[Post],
+    ) -> list[tuple[PostRow, int, bool]]:
+        """Insert one thread's mapped posts, quarantining any the database rejects.
+
+        The rows go in under a single savepoint; if one fails they are
+        rolled back to it and inserted again one savepoint per row, so only
+        the failing posts are set aside.  Returns ``(row, post id, created)``
+        for each inserted row.
+        """
+        try:
+            with self.savepoint():
+                inserted = [(row, *self.db.insert_post(row)) for row in rows]
+        except Exception:
+            by_no = {post.no: post for post in posts}
+            inserted = []
+            for row in rows:
+                try:
+                    with self.savepoint():
+                        inserted.append((row, *self.db.insert_post(row)))
+                except Exception as exc:
+                    self._quarantine(board_slug, thread_no, by_no[row.board_post_no], row.media, exc)
+        self.db.release_quarantined_posts(thread_no, [row.board_post_no for row, _, _ in inserted])
+        return inserted
+
+    def _quarantine(
+        self, board_slug: str, thread_no: int, post: Post, media: MediaRef | None, exc: Exception,
+    ) -> None:
+        logger.warning("Post /%s/%d in thread %d quarantined: %s", board_slug, post.no, thread_no, exc)
+        self.stats["errors"] += 1
+        self.stats["quarantined"] += 1
+        self.db.quarantine_post(
+            board_slug, thread_no, post.no, post.to_dict(), asdict(media) if media else None, str(exc),
+        )
 
     # ── thread harvesting ────────────────────────────────────────
 
@@ -157,116 +351,331 @@ class Harvester:
         if board_id is None:
             board_id = self.db.ensure_board(board_slug)
 
-        thread_data = self.api.get_thread(board_slug, thread_no)
-        if not thread_data or "posts" not in thread_data:
+        thread = self.api.get_thread(board_slug, thread_no)
+        if not thread or not thread.posts:
             logger.warning("Thread /%s/%d not found or empty", board_slug, thread_no)
             return False
 
-        posts = thread_data["posts"]
-        if not posts:
+        if not self.import_thread(board_slug, thread, board_id=board_id):
             return False
+        self.commit()
+        logger.info("Harvested thread /%s/%d (%d posts)", board_slug, thread_no, len(thread.posts))
+        return True
+
+    def import_thread(self, board_slug: str, thread: Thread, *, board_id: int) -> bool:
+        """Write an already-fetched thread to the database (no commit).
 
-        op = posts[0]
-        created_at = _ts_to_dt(op.get("time", 0))
+        Shared by live harvesting and offline replay.  Returns False if the
+        thread has no posts.
+        """
+        if not thread.posts:
+            return False
+        op = thread.posts[0]
+        thread_no = op.no
 
         # Insert thread
-        self.db.insert_thread(
+        _, created = self.db.insert_thread(
             thread_no=thread_no,
             board_id=board_id,
-            created_at=created_at,
-            sticky=bool(op.get("sticky", 0)),
-            locked=bool(op.get("closed", 0)),
-            archived=bool(op.get("archived", 0)),
-            archived_at=_ts_to_dt(op["archived_on"]) if op.get("archived_on") else None,
-            reply_count=op.get("replies", 0),
-            image_count=op.get("images", 0),
+            created_at=_ts_to_dt(op.time),
+            sticky=bool(op.sticky),
+            locked=bool(op.closed),
+            archived=bool(op.archived),
+            archived_at=_ts_to_dt(op.archived_on) if op.archived_on else None,
+            reply_count=op.replies,
+            image_count=op.images,
         )
 
-        # Insert all posts
-        max_post_no = 0
-        for post in posts:
-            post_args = self._map_post(board_slug, post, thread_no)
-            post_id = self.db.insert_post(**post_args)
-            max_post_no = max(max_post_no, post["no"])
+        # Map all posts first so the thread's backlink map can be built in bulk;
+        # a post that fails to map or insert is quarantined, not the thread
+        rows = self._map_posts(board_slug, thread.posts, thread_no)
 
-            # Link OP post to thread
-            if post.get("resto", 0) == 0:
-                self.db.set_op_post(thread_no, post_id)
+        # Insert all posts
+        for row, post_id, new_post in self._insert_posts(board_slug, thread_no, rows, thread.posts):
+            if row.is_op and created:
+                self.events.thread_created(board_slug, thread_no, post_id, row.created_at)
+            if new_post:
+                self.events.post_created(board_slug, row, post_id)
 
             self.stats["posts"] += 1
 
-        # Advance board counter
-        self.db.advance_post_counter(board_id, max_post_no)
-        self.db.commit()
+        # Advance board counter (past quarantined posts too); a full thread
+        # fetch closes any catalog gap
+        self.db.advance_post_counter(board_id, max(post.no for post in thread.posts))
+        self.db.clear_thread_gap(thread_no)
+        self._touched.add(thread_no)
+        self.cache.touch(board_slug, thread_no, len(rows))
         self.stats["threads"] += 1
-        logger.info("Harvested thread /%s/%d (%d posts)", board_slug, thread_no, len(posts))
         return True
 
+    # ── media retries ────────────────────────────────────────────
+
+    def backfill_post_media(self, board_slug: str, thread_id: int, post_no: int, media: Media) -> bool:
+        """Fetch an imported post's media and fill in its columns (no commit).
+
+        Returns False if the file is gone; raises on transient failure.
+        """
+        ref = self._fetch_media(board_slug, media)
+        if ref is None:
+            return False
+        self.db.update_post_media(thread_id, post_no, ref)
+        self._touched.add(thread_id)
+        self.cache.touch(board_slug, thread_id)
+        return True
+
+    def retry_media(self, *, batch_size: int = 50, limit: int = 0) -> int:
+        """Drain due entries from the media retry queue in batches.
+
+        Successful fetches back-fill the post's media columns; failures are
+        rescheduled with exponential backoff until media_retry_max_attempts.
+        Returns the number of posts whose media was back-filled.
+        """
+        if not self.storage:
+            return 0
+        fixed = 0
+        processed = 0
+        while limit <= 0 or processed < limit:
+            want = batch_size if limit <= 0 else min(batch_size, limit - processed)
+            rows = self.db.claim_media_retries(want, self.cfg.media_retry_max_attempts)
+            if not rows:
+                break
+            for row in rows:
+                media = Media(
+                    tim=row["tim"],
+                    ext=row["ext"],
+                    filename=row["filename"] or str(row["tim"]),
+                    fsize=row["fsize"],
+                    md5=row["md5"],
+                    w=row["width"],
+                    h=row["height"],
+                )
+                try:
+                    # A failed row must leave the transaction usable for the rest of the batch
+                    with self.savepoint():
+                        filled = self.backfill_post_media(row["board_slug"], row["thread_id"], row["board_post_no"], media)
+                except Exception as exc:
+                    delay = min(self.cfg.media_retry_base_delay * 2 ** row["attempts"], 86400.0)
+                    logger.warning(
+                        "Retry %d for %s%s from /%s/ failed: %s",
+                        row["attempts"] + 1, row["tim"], row["ext"], row["board_slug"], exc,
+                    )
+                    self.db.reschedule_media_retry(row["id"], str(exc), delay)
+                    self.stats["errors"] += 1
+                    continue
+                if filled:
+                    fixed += 1
+                else:
+                    logger.info("Media %s%s from /%s/ is gone, dropping retry", row["tim"], row["ext"], row["board_slug"])
+                self.db.delete_media_retry(row["id"])
+            self.commit()
+            processed += len(rows)
+        logger.info("Media retry: %d posts back-filled", fixed)
+        return fixed
+
+    # ── quarantined posts ────────────────────────────────────────
+
+    def retry_posts(self, *, batch_size: int = 50, limit: int = 0) -> int:
+        """Re-import posts from the quarantine, a savepoint per post.
+
+        A post whose media was already stored is linked to it without a
+        fresh download.  Failures are rescheduled with exponential backoff
+        until post_retry_max_attempts.  Returns the number of posts imported.
+        """
+        fixed = 0
+        processed = 0
+        while limit <= 0 or processed < limit:
+            want = batch_size if limit <= 0 else min(batch_size, limit - processed)
+            rows = self.db.claim_quarantined_posts(want, self.cfg.post_retry_max_attempts)
+            if not rows:
+                break
+            for row in rows:
+                board_slug, thread_no = row["board_slug"], row["thread_id"]
+                try:
+                    with self.savepoint():
+                        post = Post.from_dict(row["post"])
+                        media = MediaRef(**row["media"]) if row["media"] else None
+                        mapped = self._map_post(board_slug, post, thread_no, media=media)
+                        self._link_backlinks([mapped])
+                        post_id, new_post = self.db.insert_post(mapped)
+                except Exception as exc:
+                    delay = min(self.cfg.post_retry_base_delay * 2 ** row["attempts"], 86400.0)
+                    logger.warning(
+                        "Retry %d for post /%s/%d failed: %s",
+                        row["attempts"] + 1, board_slug, row["board_post_no"], exc,
+                    )
+                    self.db.reschedule_quarantined_post(row["id"], str(exc), delay)
+                    self.stats["errors"] += 1
+                    continue
+                if new_post:
+                    self.events.post_created(board_slug, mapped, post_id)
+                self.db.delete_quarantined_post(row["id"])
+                self._touched.add(thread_no)
+                self.cache.touch(board_slug, thread_no)
+                self.stats["posts"] += 1
+                fixed += 1
+            self.commit()
+            processed += len(rows)
+        logger.info("Post retry: %d quarantined posts imported", fixed)
+        return fixed
+
+    # ── offline replay ───────────────────────────────────────────
+
+    def replay_threads(self, board_slug: str, threads: Iterable[Thread], *, batch_size: int = 100) -> int:
+        """Import thread objects from a local source with no API calls.
+
+        Commits every *batch_size* threads.  Each thread is imported under a
+        savepoint, so one that fails is logged and skipped while the rest of
+        its batch still commits.  Returns the number of threads imported.
+        """
+        board_id = self.db.ensure_board(board_slug)
+        imported = 0
+        pending = 0
+        for thread in threads:
+            try:
+                with self.savepoint():
+                    if not self.import_thread(board_slug, thread, board_id=board_id):
+                        continue
+            except Exception as exc:
+                thread_no = thread.posts[0].no if thread.posts else None
+                logger.error("Error replaying /%s/%s, skipped: %s", board_slug, thread_no, exc)
+                self.stats["errors"] += 1
+                continue
+            imported += 1
+            pending += 1
+            if pending >= batch_size:
+                self.commit()
+                pending = 0
+                logger.info("Replay /%s/: %d threads imported", board_slug, imported)
+        self.commit()
+        logger.info("Replay for /%s/ complete: %d threads", board_slug, imported)
+        return imported
+
     # ── catalog / board harvesting ───────────────────────────────
 
     def harvest_catalog(self, board_slug: str) -> int:
-        """Harvest the catalog for a board (OPs only, no full threads)."""
+        """Harvest the catalog for a board: OPs plus each thread's ``last_replies``.
+
+        Existing threads are refreshed in place (counters, flags, new replies).
+        Threads whose stored reply count is still below 4chan's ``replies``
+        are recorded as gaps for a later full fetch (see harvest_gaps).
+        Returns the number of new threads.
+        """
         board_id = self.db.ensure_board(board_slug)
         catalog = self.api.get_catalog(board_slug)
         count = 0
         for page in catalog:
-            for thread in page.get("threads", []):
-                thread_no = thread["no"]
-                if self.db.thread_exists(thread_no):
-                    logger.debug("Thread %d already exists, skipping catalog entry", thread_no)
-                    self.stats["skipped"] += 1
-                    continue
-                created_at = _ts_to_dt(thread.get("time", 0))
-                self.db.insert_thread(
-                    thread_no=thread_no,
-                    board_id=board_id,
-                    created_at=created_at,
-                    sticky=bool(thread.get("sticky", 0)),
-                    locked=bool(thread.get("closed", 0)),
-                    reply_count=thread.get("replies", 0),
-                    image_count=thread.get("images", 0),
-                )
-                # Insert OP post
-                post_args = self._map_post(board_slug, thread, thread_no)
-                post_id = self.db.insert_post(**post_args)
-                self.db.set_op_post(thread_no, post_id)
-                self.stats["posts"] += 1
-                self.stats["threads"] += 1
-                count += 1
-        self.db.commit()
+            for thread in page.threads:
+                if self._import_catalog_entry(board_slug, thread, board_id=board_id):
+                    count += 1
+        self.commit()
         logger.info("Catalog harvest for /%s/: %d new threads", board_slug, count)
         return count
 
-    def harvest_board(self, board_slug: str, *, include_archive: bool = False, limit: int = 0) -> int:
+    def _import_catalog_entry(self, board_slug: str, thread: CatalogThread, *, board_id: int) -> bool:
+        """Upsert one catalog thread and its last_replies. Returns True if new."""
+        thread_no = thread.no
+        known = self.db.existing_post_nos(thread_no) if self.db.thread_exists(thread_no) else None
+        is_new = known is None
+        known = known or set()
+
+        self.db.insert_thread(
+            thread_no=thread_no,
+            board_id=board_id,
+            created_at=_ts_to_dt(thread.time),
+            sticky=bool(thread.sticky),
+            locked=bool(thread.closed),
+            reply_count=thread.replies,
+            image_count=thread.images,
+        )
+
+        max_post_no = thread_no
+        new_posts: list[Post] = [thread] if thread_no not in known else []
+        for reply in thread.last_replies:
+            max_post_no = max(max_post_no, reply.no)
+            if reply.no not in known:
+                new_posts.append(reply)
+        rows = self._map_posts(board_slug, new_posts, thread_no)
+        for row, post_id, new_post in self._insert_posts(board_slug, thread_no, rows, new_posts):
+            if row.is_op and is_new:
+                self.events.thread_created(board_slug, thread_no, post_id, row.created_at)
+            if new_post:
+                self.events.post_created(board_slug, row, post_id)
+            known.add(row.board_post_no)
+            self.stats["posts"] += 1
+
+        stored = len(known - {thread_no})
+        expected = thread.replies
+        if stored < expected:
+            self.db.record_thread_gap(thread_no, board_id, expected, stored)
+        else:
+            self.db.clear_thread_gap(thread_no)
+
+        self.db.advance_post_counter(board_id, max_post_no)
+        self._touched.add(thread_no)
+        self.cache.touch(board_slug, thread_no, len(rows))
+        if is_new:
+            self.stats["threads"] += 1
+        else:
+            self.stats["skipped"] += 1
+        return is_new
+
+    def harvest_gaps(self, board_slug: str, *, limit: int = 0) -> int:
+        """Fully fetch threads that catalog harvests left incomplete."""
+        board_id = self.db.ensure_board(board_slug)
+        harvested = 0
+        for tno in self.db.thread_gaps(board_id, limit):
+            try:
+                if self.harvest_thread(board_slug, tno, board_id=board_id):
+                    harvested += 1
+            except Exception as exc:
+                logger.error("Error harvesting /%s/%d: %s", board_slug, tno, exc)
+                self.stats["errors"] += 1
+                self.rollback()
+        logger.info("Gap fill for /%s/: %d threads completed", board_slug, harvested)
+        return harvested
+
+    def harvest_board(
+        self,
+        board_slug: str,
+        *,
+        include_archive: bool = False,
+        limit: int = 0,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        thread_nos: list[int] | None = None,
+    ) -> int:
         """Harvest all threads from a board (full content + images).
 
-        Fetches the catalog for thread numbers, then fetches each thread fully.
+        Fetches the catalog for thread numbers, then fetches each thread fully,
+        most at-risk first (see scheduler.plan_board): threads on the last
+        pages, at the bump/image limit, fast-moving or gone quiet come before
+        archived threads, which come before sticky or already-current ones.
         If include_archive is True, also fetches archived threads.
-        If limit > 0, stops after that many threads.
+        since/until keep only threads created in that window (see
+        fetch_archive).  If limit > 0, stops after that many threads.
+        If thread_nos is given (a saved plan's work list, see
+        planner.HarvestPlan), harvests exactly those, in order, without
+        fetching the catalog or archive.
         """
         board_id = self.db.ensure_board(board_slug)
-        thread_nos: list[int] = []
-
-        # Gather active thread numbers from catalog
-        catalog = self.api.get_catalog(board_slug)
-        for page in catalog:
-            for t in page.get("threads", []):
-                thread_nos.append(t["no"])
-
-        # Optionally include archived threads
-        if include_archive:
-            archive = self.api.get_archive(board_slug)
-            thread_nos.extend(archive)
-
-        # Deduplicate and sort
-        thread_nos = sorted(set(thread_nos))
 
+        if thread_nos is None:
+            catalog = self.api.get_catalog(board_slug)
+            archive = self.fetch_archive(board_slug, since=since, until=until) if include_archive else []
+            live_nos = [t.no for page in catalog for t in page.threads]
+            queue = plan_board(
+                catalog, archive, stored_replies=self.db.stored_reply_counts(live_nos),
+                since=since.timestamp() if since else None, until=until.timestamp() if until else None,
+            )
+            thread_nos = [work.thread_no for work in queue]
         if limit > 0:
             thread_nos = thread_nos[:limit]
 
         total = len(thread_nos)
         harvested = 0
 
+        from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
+
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
@@ -276,15 +685,13 @@ class Harvester:
         ) as progress:
             task = progress.add_task(f"/{board_slug}/ threads", total=total)
             for tno in thread_nos:
-                if self.db.thread_exists(tno):
-                    logger.debug("Thread %d already exists, updating", tno)
                 try:
                     self.harvest_thread(board_slug, tno, board_id=board_id)
                     harvested += 1
                 except Exception as exc:
                     logger.error("Error harvesting /%s/%d: %s", board_slug, tno, exc)
                     self.stats["errors"] += 1
-                    self.db.rollback()
+                    self.rollback()
                 progress.advance(task)
 
         logger.info(
@@ -292,21 +699,151 @@ class Harvester:
         )
         return harvested
 
+    def fetch_archive(self, board_slug: str, *, since: datetime | None = None, until: datetime | None = None) -> list[int]:
+        """Fetch archive.json, narrowed to threads created in [since, until).
+
+        The bounds are found by bisecting the post numbers with a few thread
+        fetches (scheduler.archive_window), so a one-day window of a
+        3000-thread archive costs about 25 requests instead of 3000.
+        """
+        archive = self.api.get_archive(board_slug)
+        if since is None and until is None:
+            return archive
+        probes = 0
+
+        def probe(thread_no: int) -> int | None:
+            nonlocal probes
+            probes += 1
+            thread = self.api.get_thread(board_slug, thread_no)
+            return thread.posts[0].time if thread and thread.posts else None
+
+        window = archive_window(
+            archive, probe,
+            since=since.timestamp() if since else None, until=until.timestamp() if until else None,
+        )
+        logger.info(
+            "Archive window for /%s/: %d of %d threads (%d probes)", board_slug, len(window), len(archive), probes
+        )
+        return window
+
     # ── multi-board ──────────────────────────────────────────────
 
-    def harvest_boards(self, slugs: list[str], **kwargs: Any) -> dict[str, int]:
-        """Harvest multiple boards sequentially."""
+    def harvest_boards(self, slugs: list[str], *, plan: HarvestPlan | None = None, **kwargs: Any) -> dict[str, int]:
+        """Harvest multiple boards sequentially, from *plan*'s work lists if given."""
         results = {}
         for slug in slugs:
             logger.info("Starting harvest of /%s/", slug)
-            results[slug] = self.harvest_board(slug, **kwargs)
+            thread_nos = plan.work_list(slug) if plan is not None else None
+            results[slug] = self.harvest_board(slug, thread_nos=thread_nos, **kwargs)
         return results
 
     # ── lifecycle ────────────────────────────────────────────────
 
+    def commit(self) -> None:
+        """Commit the open transaction, then publish its events and invalidate the pages it touched.
+
+        Before committing, the touched threads' bump times and counters are
+        recomputed from their stored posts.  Afterwards, media queued by the
+        transaction starts downloading and finished background downloads
+        are stored.
+        """
+        if self._touched:
+            self.db.finalize_threads(sorted(self._touched))
+            self._touched.clear()
+        self.events.stage()
+        self.db.commit()
+        self.events.publish()
+        self.cache.committed()
+        self.downloads.committed()
+        self.store_downloads()
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """Database.savepoint() that also forgets what the block queued.
+
+        If the block raises, the events, cache touches, downloads, touched
+        threads and stats it added are dropped with its rows.
+        """
+        marks = (self.events.mark(), self.cache.mark(), self.downloads.mark())
+        touched, stats = set(self._touched), dict(self.stats)
+        try:
+            with self.db.savepoint():
+                yield
+        except BaseException:
+            self.events.rewind(marks[0])
+            self.cache.rewind(marks[1])
+            self.downloads.rewind(marks[2])
+            self._touched = touched
+            self.stats.update(stats)
+            raise
+
+    def rollback(self) -> None:
+        self._touched.clear()
+        self.db.rollback()
+        self.events.discard()
+        self.cache.discard()
+        self.downloads.discard()
+
+    def store_downloads(self, *, wait: bool = False) -> int:
+        """Store finished background downloads and fill in their posts.
+
+        Each file commits on its own; one that fails to download or store is
+        queued in harvester_media_retries.  With *wait*, blocks until every
+        queued download has finished.  Returns the number of posts filled.
+        """
+        if self._storing or not self.storage:
+            return 0
+        self._storing = True
+        filled = 0
+        try:
+            for done in self.downloads.drain() if wait else self.downloads.ready():
+                job = done.job
+                try:
+                    if done.error is not None:
+                        raise done.error
+                    ref = self._store_media(job.board_slug, job.media, done.read())
+                    if ref is not None:
+                        self.db.update_post_media(job.thread_no, job.post_no, ref)
+                        self._touched.add(job.thread_no)
+                        self.cache.touch(job.board_slug, job.thread_no)
+                        filled += 1
+                except Exception as exc:
+                    self.rollback()
+                    logger.warning(
+                        "Media %s%s from /%s/ failed, queued for retry: %s",
+                        job.media.tim, job.media.ext, job.board_slug, exc,
+                    )
+                    self.stats["errors"] += 1
+                    self.db.enqueue_media_retry(job.board_slug, job.thread_no, job.post_no, job.media, str(exc))
+                finally:
+                    self.downloads.finished(done)
+                self.commit()
+        finally:
+            self._storing = False
+        return filled
+
     def close(self) -> None:
-        self.api.close()
-        self.db.close()
+        try:
+            self.store_downloads(wait=True)
+        finally:
+            try:
+                self._requeue_downloads()
+            finally:
+                self.cache.close()
+                self.events.close()
+                self.api.close()
+                self.db.close()
+
+    def _requeue_downloads(self) -> None:
+        """Hand downloads still queued (after a failure) to retry_media()."""
+        left = self.downloads.close()
+        if not left or not self.storage:
+            return
+        self.db.rollback()
+        for job in left:
+            self.db.enqueue_media_retry(job.board_slug, job.thread_no, job.post_no, job.media, "harvester closed")
+        self.db.commit()
+        logger.warning("%d background downloads left unfinished, queued for retry", len(left))
 
     def __enter__(self) -> Harvester:
         return self
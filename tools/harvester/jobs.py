@@ -0,0 +1,274 @@
+"""Distributed work queue – Postgres-leased jobs shared by ``harvester worker`` processes.
+
+Jobs live in ``harvester_jobs`` (see db.HARVESTER_SCHEMA).  Workers claim
+them with ``FOR UPDATE SKIP LOCKED`` and hold a lease that a heartbeat
+thread keeps extending; a job whose worker dies is re-queued once its lease
+runs out.  A job is marked done in the same transaction as its import, and
+only while its lease still belongs to this worker, so each unit of work is
+applied exactly once even when a stalled worker's lease is taken over.
+
+Every worker on the same egress IP shares one request budget per host
+(``harvester_rate_budgets``), so adding processes to a box never exceeds
+the 4chan request rate that IP is allowed.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+from typing import TYPE_CHECKING, Sequence
+from urllib.parse import urlsplit
+
+from .db import Database
+from .records import Media
+from .scheduler import TIER_ARCHIVE, TIER_DEFERRED, plan_board
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+logger = logging.getLogger("harvester.jobs")
+
+JOB_THREAD = "thread"    # fetch and import one thread; job_key = thread number
+JOB_MEDIA = "media"      # fetch and store one post's file; job_key = post number
+JOB_REFRESH = "refresh"  # plan a board and queue its thread jobs; job_key = ""
+JOB_KINDS = (JOB_THREAD, JOB_MEDIA, JOB_REFRESH)
+
+REFRESH_PRIORITY = 1.0   # above every thread job (those are ≤ 0)
+
+
+def media_payload(media: Media, thread_no: int, post_no: int) -> dict:
+    return {
+        "thread_no": thread_no, "post_no": post_no,
+        "tim": media.tim, "ext": media.ext, "filename": media.filename,
+        "fsize": media.fsize, "md5": media.md5, "w": media.w, "h": media.h,
+    }
+
+
+def _media_from_payload(payload: dict) -> Media:
+    return Media(
+        tim=payload["tim"], ext=payload["ext"], filename=payload["filename"],
+        fsize=payload.get("fsize"), md5=payload.get("md5"), w=payload.get("w"), h=payload.get("h"),
+    )
+
+
+def detect_egress(url: str) -> str:
+    """Local address the OS routes *url*'s host through (no packets are sent).
+
+    Behind NAT every node reports its private address; pass the public IP
+    explicitly (``--egress``) when several nodes share one.
+    """
+    host = urlsplit(url).hostname or url
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((host, 443))
+            return sock.getsockname()[0]
+    except OSError:
+        return socket.gethostname()
+
+
+class SharedRateBudget:
+    """RateBudget backed by harvester_rate_budgets: one budget per egress IP."""
+
+    def __init__(self, db: Database, egress: str, interval: float) -> None:
+        self._db = db
+        self._lock = threading.Lock()
+        self.egress = egress
+        self.interval = interval
+
+    def reserve(self, host: str) -> float:
+        with self._lock:
+            return self._db.reserve_rate_slot(self.egress, host, self.interval)
+
+
+class _Heartbeat(threading.Thread):
+    """Extend a job's lease every third of its length until stopped."""
+
+    def __init__(self, db: Database, job: dict, worker_id: str, lease_seconds: float) -> None:
+        super().__init__(name=f"heartbeat-{job['id']}", daemon=True)
+        self._db = db
+        self._job = job
+        self._worker_id = worker_id
+        self._lease = lease_seconds
+        self._stop_event = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self._lease / 3):
+            try:
+                ok = self._db.extend_job_lease(self._job, self._worker_id, self._lease)
+                self._db.commit()
+            except Exception as exc:
+                logger.warning("Heartbeat for job %d failed: %s", self._job["id"], exc)
+                try:
+                    self._db.rollback()
+                except Exception:
+                    pass
+                continue
+            if not ok:
+                logger.warning("Lease on job %d was lost", self._job["id"])
+                self.lost.set()
+                return
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class Worker:
+    """Pull jobs from harvester_jobs and run them with a Harvester.
+
+    The harvester's API client gets a SharedRateBudget for *egress*, and
+    media found while importing threads is queued as media jobs unless the
+    harvester's config says otherwise (cfg.media_jobs).
+    """
+
+    def __init__(
+        self,
+        harvester: Harvester,
+        *,
+        worker_id: str | None = None,
+        kinds: Sequence[str] = JOB_KINDS,
+        egress: str | None = None,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 5.0,
+        max_attempts: int = 5,
+        retry_base_delay: float = 30.0,
+    ) -> None:
+        self.h = harvester
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = list(kinds)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.stats = {"done": 0, "failed": 0, "lost": 0}
+        cfg = harvester.cfg
+        self.egress = egress or detect_egress(cfg.fourchan.api_base)
+        # Heartbeats and rate slots commit independently of the job transaction
+        self._heartbeat_db = Database(cfg.db)
+        self._budget_db = Database(cfg.db)
+        harvester.api.budget = SharedRateBudget(self._budget_db, self.egress, cfg.fourchan.request_delay)
+        self._stopping = threading.Event()
+
+    def stop(self) -> None:
+        """Finish the current job, then return from run()."""
+        self._stopping.set()
+
+    def run(self, *, max_jobs: int = 0, exit_when_idle: bool = False) -> int:
+        """Process jobs until stopped; returns the number of jobs handled."""
+        logger.info("Worker %s started (egress %s, kinds %s)", self.worker_id, self.egress, ",".join(self.kinds))
+        db = self.h.db
+        handled = 0
+        while not self._stopping.is_set() and (max_jobs <= 0 or handled < max_jobs):
+            jobs = db.claim_jobs(
+                self.worker_id, self.kinds,
+                limit=1, lease_seconds=self.lease_seconds, max_attempts=self.max_attempts,
+            )
+            db.commit()
+            if not jobs:
+                # Nothing will commit for a while; don't hold back cache invalidations,
+                # and relay outbox events any process failed to publish
+                self.h.cache.flush()
+                self.h.events.publish(force=True)
+                self.h.store_downloads()
+                if exit_when_idle:
+                    break
+                self._stopping.wait(self.poll_interval)
+                continue
+            self._run_job(jobs[0])
+            handled += 1
+        logger.info("Worker %s stopped after %d jobs", self.worker_id, handled)
+        return handled
+
+    def _run_job(self, job: dict) -> None:
+        db = self.h.db
+        heartbeat = _Heartbeat(self._heartbeat_db, job, self.worker_id, self.lease_seconds)
+        heartbeat.start()
+        try:
+            if job["kind"] == JOB_THREAD:
+                self._thread_job(job)
+            elif job["kind"] == JOB_MEDIA:
+                self._media_job(job)
+            elif job["kind"] == JOB_REFRESH:
+                self._refresh_job(job)
+            else:
+                raise ValueError(f"unknown job kind {job['kind']!r}")
+            if heartbeat.lost.is_set() or not db.complete_job(job, self.worker_id):
+                logger.warning("Lease on job %d moved to another worker; discarding its work", job["id"])
+                self.h.rollback()
+                self.stats["lost"] += 1
+                return
+            every = job["payload"].get("every")
+            if every:
+                db.enqueue_jobs(
+                    job["kind"], job["board_slug"],
+                    [(job["job_key"], job["payload"], job["priority"])], delay=every,
+                )
+            self.h.commit()
+            self.stats["done"] += 1
+        except Exception as exc:
+            self.h.rollback()
+            delay = min(self.retry_base_delay * 2 ** (job["attempts"] - 1), 3600.0)
+            logger.error(
+                "Job %d (%s /%s/ %s) failed on attempt %d: %s",
+                job["id"], job["kind"], job["board_slug"], job["job_key"], job["attempts"], exc,
+            )
+            db.fail_job(job, self.worker_id, str(exc), delay_seconds=delay, max_attempts=self.max_attempts)
+            db.commit()
+            self.stats["failed"] += 1
+            self.h.stats["errors"] += 1
+        finally:
+            heartbeat.stop()
+
+    # ── job kinds ────────────────────────────────────────────────
+
+    def _thread_job(self, job: dict) -> None:
+        board_slug, thread_no = job["board_slug"], int(job["job_key"])
+        board_id = self.h.db.ensure_board(board_slug)
+        thread = self.h.api.get_thread(board_slug, thread_no)
+        if not thread or not thread.posts:
+            logger.info("Thread /%s/%d is gone", board_slug, thread_no)
+            return
+        self.h.import_thread(board_slug, thread, board_id=board_id)
+        logger.info("Harvested thread /%s/%d (%d posts)", board_slug, thread_no, len(thread.posts))
+
+    def _media_job(self, job: dict) -> None:
+        payload = job["payload"]
+        if not self.h.backfill_post_media(
+            job["board_slug"], payload["thread_no"], payload["post_no"], _media_from_payload(payload)
+        ):
+            logger.info("Media %s%s from /%s/ is gone", payload["tim"], payload["ext"], job["board_slug"])
+
+    def _refresh_job(self, job: dict) -> None:
+        """Plan a board (see scheduler.plan_board) and queue its thread jobs.
+
+        Rank in the plan becomes priority, so several boards' most at-risk
+        threads interleave.  Archived threads never change, so they are
+        queued only if they have not been imported by an earlier job.
+        """
+        board_slug, payload = job["board_slug"], job["payload"]
+        limit = payload.get("limit") or 0
+        db, api = self.h.db, self.h.api
+        db.ensure_board(board_slug)
+        catalog = api.get_catalog(board_slug)
+        archive = api.get_archive(board_slug) if payload.get("archive") else []
+        live_nos = [t.no for page in catalog for t in page.threads]
+        queue = plan_board(catalog, archive, stored_replies=db.stored_reply_counts(live_nos))
+
+        live: list[tuple[str, dict, float]] = []
+        archived: list[tuple[str, dict, float]] = []
+        for rank, work in enumerate(queue):
+            if limit and rank >= limit:
+                break
+            if work.tier == TIER_DEFERRED:
+                continue
+            (archived if work.tier == TIER_ARCHIVE else live).append((str(work.thread_no), {}, -float(rank)))
+        added = db.enqueue_jobs(JOB_THREAD, board_slug, live)
+        added += db.enqueue_jobs(JOB_THREAD, board_slug, archived, once=True)
+        logger.info("Refresh /%s/: queued %d thread jobs", board_slug, added)
+
+    def close(self) -> None:
+        self._heartbeat_db.close()
+        self._budget_db.close()
@@ -0,0 +1,103 @@
+"""Perceptual hashing – 64-bit DCT pHash for near-duplicate media detection.
+
+Hashes are stored in ``media_objects.phash`` as 16 hex digits.  For indexed
+lookup each hash is split into PHASH_CHUNKS 16-bit chunks (multi-index
+hashing): two hashes within Hamming distance ``PHASH_CHUNKS - 1`` are
+guaranteed to share at least one chunk exactly, so an equality lookup on the
+chunk table yields every candidate and the exact distance is checked after.
+
+Requires NumPy; without it image_phash() returns None and hashing is skipped.
+NumPy and Pillow are imported on first use, so importing this module (as
+db.py does for the chunk helpers) stays cheap.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
+logger = logging.getLogger("harvester.phash")
+
+HASH_SIZE = 8          # 8×8 low-frequency DCT block → 64 bits
+SAMPLE_SIZE = 32       # image is reduced to 32×32 greyscale before the DCT
+PHASH_CHUNKS = 4       # 16-bit chunks per hash in the lookup index
+CHUNK_BITS = 64 // PHASH_CHUNKS
+
+# Not raster images, or not decodable by Pillow
+_SKIP_EXTS = frozenset({".webm", ".pdf", ".svg", ".mp4"})
+
+
+@lru_cache(maxsize=1)
+def _numpy() -> Any:
+    """The numpy module, or None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:  # optional dependency
+        return None
+    return numpy
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix() -> np.ndarray:
+    """Orthonormal DCT-II basis, so dct2(x) == M @ x @ M.T."""
+    np = _numpy()
+    n = SAMPLE_SIZE
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+def phash_image(img: Image.Image) -> str:
+    """pHash a decoded image: 32×32 greyscale → 2-D DCT → median threshold."""
+    from PIL import Image
+
+    np = _numpy()
+    small = img.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.float64)
+    m = _dct_matrix()
+    low = (m @ pixels @ m.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term is excluded from the median so overall brightness doesn't skew it
+    bits = low > np.median(low[1:])
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return f"{value:016x}"
+
+
+def image_phash(data: bytes, ext: str) -> str | None:
+    """pHash raw file bytes, or None if hashing is unavailable or fails.
+
+    JPEGs are decoded at reduced scale (Pillow draft mode), so the cost is
+    close to decoding a thumbnail rather than the full image.
+    """
+    if ext.lower() in _SKIP_EXTS or _numpy() is None:
+        return None
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.draft("L", (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))
+        return phash_image(img)
+    except Exception as exc:
+        logger.debug("pHash failed: %s", exc)
+        return None
+
+
+def hamming(a: str, b: str) -> int:
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def phash_chunks(phash: str) -> list[int]:
+    """Split a hex pHash into PHASH_CHUNKS integers, most significant first."""
+    value = int(phash, 16)
+    mask = (1 << CHUNK_BITS) - 1
+    return [
+        (value >> (CHUNK_BITS * (PHASH_CHUNKS - 1 - i))) & mask
+        for i in range(PHASH_CHUNKS)
+    ]
@@ -0,0 +1,217 @@
+"""Harvest planning – estimate a board harvest's cost before running it.
+
+A plan costs one catalog (and archive) request per board, plus a few thread
+probes when the archive is narrowed with since/until.  From the catalog
+it counts the thread requests and file downloads a harvest would make, with
+exact sizes for the OP and ``last_replies`` files and board averages for
+the rest; 4chan MD5s already on imported posts tell which files would only
+be deduplicated rather than stored.  Archived threads list numbers only, so
+their files are extrapolated from the catalog's averages too.
+
+The plan's thread lists leave out threads the database already holds in
+full, and can be saved as JSON and handed to ``board``/``multi --plan`` as
+the work list, so a run scheduled for later does exactly what was estimated.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from .scheduler import TIER_ARCHIVE, plan_board
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+    from .records import CatalogPage, Post
+
+logger = logging.getLogger("harvester.planner")
+
+PLAN_VERSION = 1
+DEFAULT_FSIZE = 400_000     # bytes per file when a board's catalog shows none
+THUMB_BYTES = 12_000        # stored bytes per thumbnail variant
+
+
+@dataclass(slots=True)
+class BoardPlan:
+    """Work list and estimated cost of harvesting one board."""
+    board: str
+    threads: list[int] = field(default_factory=list)   # harvest order
+    live: int = 0                  # catalog threads in the work list
+    archived: int = 0              # archived threads in the work list
+    skipped: int = 0               # threads left out: already stored in full
+    downloads: int = 0             # file requests
+    download_bytes: int = 0        # bytes fetched from 4chan
+    estimated_bytes: int = 0       # part of download_bytes extrapolated from averages
+    new_bytes: int = 0             # storage growth (originals + thumbnails)
+
+    @property
+    def requests(self) -> int:
+        return len(self.threads) + self.downloads
+
+
+@dataclass(slots=True)
+class HarvestPlan:
+    """Board plans plus what is needed to turn them into a duration."""
+    boards: list[BoardPlan]
+    include_archive: bool = False
+    request_delay: float = 1.1     # FourChanConfig.request_delay at planning time
+    bandwidth: float = 10e6        # assumed download rate, bytes/s
+    created_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+    def seconds(self, bp: BoardPlan) -> float:
+        """Estimated wall-clock time for *bp*.
+
+        Harvests run one request at a time and the API client spaces them
+        ``request_delay`` apart per host, so the estimate is that spacing
+        per request plus transfer time; it ignores latency and backoff.
+        """
+        return bp.requests * self.request_delay + bp.download_bytes / self.bandwidth
+
+    def total(self) -> BoardPlan:
+        """Every board summed into one (unnamed) plan."""
+        out = BoardPlan(board="")
+        for bp in self.boards:
+            out.threads += bp.threads
+            for name in ("live", "archived", "skipped", "downloads", "download_bytes", "estimated_bytes", "new_bytes"):
+                setattr(out, name, getattr(out, name) + getattr(bp, name))
+        return out
+
+    def work_list(self, board: str) -> list[int]:
+        for bp in self.boards:
+            if bp.board == board:
+                return bp.threads
+        raise ValueError(f"plan has no work list for /{board}/")
+
+    def save(self, path: str) -> None:
+        doc = {
+            "version": PLAN_VERSION,
+            "created_at": self.created_at,
+            "include_archive": self.include_archive,
+            "request_delay": self.request_delay,
+            "bandwidth": self.bandwidth,
+            "boards": [asdict(bp) for bp in self.boards],
+        }
+        with open(path, "w") as f:
+            json.dump(doc, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> HarvestPlan:
+        with open(path) as f:
+            doc = json.load(f)
+        if doc.get("version") != PLAN_VERSION:
+            raise ValueError(f"{path}: unsupported plan version {doc.get('version')!r}")
+        return cls(
+            boards=[BoardPlan(**bp) for bp in doc["boards"]],
+            include_archive=doc["include_archive"],
+            request_delay=doc["request_delay"],
+            bandwidth=doc["bandwidth"],
+            created_at=doc["created_at"],
+        )
+
+
+class HarvestPlanner:
+    """Build HarvestPlans with a Harvester's API client, database and settings."""
+
+    def __init__(
+        self,
+        harvester: Harvester,
+        *,
+        include_archive: bool = False,
+        limit: int = 0,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> None:
+        self.h = harvester
+        self.include_archive = include_archive
+        self.limit = limit
+        self.since = since
+        self.until = until
+
+    def plan(self, boards: list[str], *, bandwidth: float = 10e6) -> HarvestPlan:
+        # Files shared between boards are stored once; track MD5s across the plan
+        seen: set[str] = set()
+        return HarvestPlan(
+            boards=[self.plan_board(slug, seen) for slug in boards],
+            include_archive=self.include_archive,
+            request_delay=self.h.api.cfg.request_delay,
+            bandwidth=bandwidth,
+        )
+
+    def plan_board(self, board_slug: str, seen: set[str] | None = None) -> BoardPlan:
+        h, db = self.h, self.h.db
+        seen = set() if seen is None else seen
+        catalog = h.api.get_catalog(board_slug)
+        archive = h.fetch_archive(board_slug, since=self.since, until=self.until) if self.include_archive else []
+        entries = {t.no: t for page in catalog for t in page.threads}
+        stored = db.stored_reply_counts(list(entries))
+        done_archive = db.archived_thread_ids(archive)
+        queue = plan_board(
+            catalog, archive, stored_replies=stored,
+            since=self.since.timestamp() if self.since else None,
+            until=self.until.timestamp() if self.until else None,
+        )
+
+        images = h.cfg.download_images and h.storage is not None
+        thumbs = len(h.cfg.thumbnail_specs) if h.cfg.generate_thumbnails else 0
+        previews = self._preview_files(catalog) if images else {}
+        known = db.known_media_md5s([md5 for md5, _ in previews.values() if md5]) | seen
+        mean_size, dup_ratio = self._file_stats(previews, known)
+        mean_files = (
+            sum(1 + t.images for t in entries.values()) / len(entries) if entries else 1.0
+        )
+
+        bp = BoardPlan(board=board_slug)
+        for work in queue:
+            tno = work.thread_no
+            entry = entries.get(tno)
+            if (entry is not None and stored.get(tno, -1) >= entry.replies) or tno in done_archive:
+                bp.skipped += 1
+                continue
+            if self.limit > 0 and len(bp.threads) >= self.limit:
+                continue
+            bp.threads.append(tno)
+            if work.tier == TIER_ARCHIVE:
+                bp.archived += 1
+            else:
+                bp.live += 1
+            if not images:
+                continue
+
+            # Exact for previewed files, averages for the rest
+            exact = [previews[p] for p in (entry.no, *(r.no for r in entry.last_replies)) if p in previews] if entry else []
+            files = (int(entry.media is not None) + entry.images) if entry else round(mean_files)
+            rest = max(files - len(exact), 0)
+            bp.downloads += len(exact) + rest
+            for md5, size in exact:
+                bp.download_bytes += size
+                if md5 not in known:
+                    bp.new_bytes += size + thumbs * THUMB_BYTES
+                    if md5:
+                        known.add(md5)
+            guessed = int(rest * mean_size)
+            bp.download_bytes += guessed
+            bp.estimated_bytes += guessed
+            bp.new_bytes += int((guessed + rest * thumbs * THUMB_BYTES) * (1 - dup_ratio))
+        seen |= known
+        logger.info(
+            "Plan /%s/: %d threads (%d skipped), %d downloads", board_slug, len(bp.threads), bp.skipped, bp.downloads
+        )
+        return bp
+
+    @staticmethod
+    def _preview_files(catalog: list[CatalogPage]) -> dict[int, tuple[str | None, int]]:
+        """{post_no: (md5, fsize)} for every catalog post with a file."""
+        posts: list[Post] = [p for page in catalog for t in page.threads for p in (t, *t.last_replies)]
+        return {p.no: (p.md5, p.fsize or DEFAULT_FSIZE) for p in posts if p.media is not None}
+
+    @staticmethod
+    def _file_stats(previews: dict[int, tuple[str | None, int]], known: set[str]) -> tuple[float, float]:
+        """(mean file size, share of files already stored) over the catalog previews."""
+        if not previews:
+            return float(DEFAULT_FSIZE), 0.0
+        sizes = [size for _, size in previews.values()]
+        dups = sum(1 for md5, _ in previews.values() if md5 in known)
+        return sum(sizes) / len(sizes), dups / len(previews)
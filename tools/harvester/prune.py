@@ -0,0 +1,139 @@
+"""Retention pruning – delete old harvested threads and the media only they used.
+
+A board's policy keeps threads bumped after a cutoff time, the newest N
+threads, or both (a thread is pruned if either says so); stickies are never
+pruned.  Matching threads are deleted in small keyset-paginated batches,
+one short transaction each, with a pause in between and a lock timeout so a
+batch that would queue behind live traffic gives up instead of blocking it.
+
+Each batch notes the media its posts referenced, deletes the threads
+(posts cascade), then deletes the media_objects rows no remaining post
+references and, after the commit, their originals and thumbnails.  Media
+shared with a surviving post is kept.  A file that fails to delete is left
+for ``reconcile --repair``.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import psycopg
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+logger = logging.getLogger("harvester.prune")
+
+LOCK_RETRIES = 3        # attempts per batch that hits the lock timeout
+
+
+@dataclass(frozen=True, slots=True)
+class RetentionPolicy:
+    """Which of a board's threads to keep; None means no limit of that kind."""
+    before: datetime | None = None   # prune threads last bumped before this time
+    keep: int | None = None          # prune all but the newest N threads (by bump time)
+
+
+class Pruner:
+    """Apply retention policies to boards, a batch of threads at a time."""
+
+    def __init__(
+        self,
+        harvester: Harvester,
+        *,
+        batch_size: int = 50,
+        pause: float = 0.5,
+        lock_timeout: float = 2.0,
+        dry_run: bool = False,
+    ) -> None:
+        self.h = harvester
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lock_timeout = lock_timeout
+        self.dry_run = dry_run
+        self.stats = {"threads": 0, "posts": 0, "media": 0, "files": 0, "skipped": 0}
+
+    def run(self, policies: dict[str, RetentionPolicy]) -> dict:
+        for slug, policy in policies.items():
+            self.prune_board(slug, policy)
+        return self.stats
+
+    def prune_board(self, board_slug: str, policy: RetentionPolicy) -> int:
+        """Prune one board; returns the number of threads deleted (or matched, on a dry run)."""
+        db = self.h.db
+        board_id = db.get_board_id(board_slug)
+        if board_id is None:
+            logger.warning("Board /%s/ does not exist", board_slug)
+            return 0
+        cutoff = self._cutoff(board_id, policy)
+        db.commit()
+        if cutoff is None:
+            logger.info("Nothing to prune on /%s/", board_slug)
+            return 0
+
+        pruned = 0
+        after_id = 0
+        while True:
+            ids = db.prunable_threads(board_id, cutoff, after_id, self.batch_size)
+            db.commit()
+            if not ids:
+                break
+            after_id = ids[-1]
+            if self.dry_run:
+                self.stats["posts"] += db.count_thread_posts(ids)
+                db.commit()
+                pruned += len(ids)
+                continue
+            if self._delete_batch(board_slug, ids):
+                pruned += len(ids)
+            if self.pause > 0:
+                time.sleep(self.pause)
+        self.stats["threads"] += pruned
+        logger.info("Pruned %d threads from /%s/ (bumped before %s)", pruned, board_slug, cutoff.isoformat())
+        return pruned
+
+    def _cutoff(self, board_id: int, policy: RetentionPolicy) -> datetime | None:
+        """The bump time before which threads go: the later of the two limits."""
+        cutoffs = [policy.before] if policy.before is not None else []
+        if policy.keep is not None:
+            nth = self.h.db.nth_newest_bump(board_id, policy.keep)
+            if nth is not None:
+                cutoffs.append(nth)
+        return max(cutoffs) if cutoffs else None
+
+    def _delete_batch(self, board_slug: str, ids: list[int]) -> bool:
+        h, db = self.h, self.h.db
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                db.set_lock_timeout(self.lock_timeout)
+                posts, media_ids = db.delete_threads(ids)
+                media, keys = db.delete_unreferenced_media(media_ids)
+                for tno in ids:
+                    h.cache.touch(board_slug, tno, 0)
+                h.commit()
+            except psycopg.errors.LockNotAvailable:
+                h.rollback()
+                logger.info("Batch at thread %d is locked (attempt %d/%d)", ids[0], attempt, LOCK_RETRIES)
+                time.sleep(self.pause * 2 ** attempt)
+                continue
+            self.stats["posts"] += posts
+            self.stats["media"] += media
+            self._delete_files(keys)
+            return True
+        logger.warning("Skipped %d threads from /%s/: still locked after %d attempts", len(ids), board_slug, LOCK_RETRIES)
+        self.stats["skipped"] += len(ids)
+        return False
+
+    def _delete_files(self, keys: list[str]) -> None:
+        if not keys or self.h.storage is None:
+            return
+        try:
+            self.h.storage.delete(keys)
+        except Exception as exc:
+            logger.warning("Could not delete %d files (reconcile --repair will): %s", len(keys), exc)
+            return
+        self.stats["files"] += len(keys)
@@ -0,0 +1,203 @@
+"""Storage reconciliation – compare stored objects with media_objects.
+
+Both sides are produced in key order: the storage backend lists its tree
+with an ordered parallel walk (storage._walk_sorted) and the database
+streams every referenced key through a server-side cursor sorted with
+``COLLATE "C"`` (byte order, matching the listing).  A single merge pass then
+classifies each key as present, orphaned (stored but unreferenced) or
+missing (referenced but not stored), so memory is bounded by the largest
+single directory/prefix listing rather than by the size of the archive.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from typing import TYPE_CHECKING, Iterator, TextIO
+
+from .db import Database
+
+if TYPE_CHECKING:
+    from .storage import DiskStorageService, StorageService, StoredObject
+
+logger = logging.getLogger("harvester.reconcile")
+
+DELETE_BATCH = 1000     # orphans deleted per storage request
+COMMIT_EVERY = 500      # database repairs per transaction
+
+ORPHAN = "orphan"       # object in storage that nothing references
+MISSING = "missing"     # referenced key with no object behind it
+CORRUPT = "corrupt"     # object whose size (or, with verify, hash) is wrong
+
+
+class Reconciler:
+    """Diff a storage backend against the database and optionally repair it.
+
+    Repairs are conservative: orphans are deleted only once older than
+    *grace_seconds* (an upload whose row is not committed yet looks exactly
+    like an orphan), and missing or corrupt thumbnails are unlinked so that
+    ``rethumb --missing`` regenerates them.  Missing or corrupt originals are
+    only reported – the source file may no longer exist anywhere else.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        storage: StorageService | DiskStorageService,
+        *,
+        workers: int = 8,
+        verify: bool = False,
+        repair: bool = False,
+        grace_seconds: float = 86400.0,
+        report: TextIO | None = None,
+    ) -> None:
+        self.db = db
+        self.storage = storage
+        self.workers = max(workers, 1)
+        self.verify = verify
+        self.repair = repair
+        self.grace_seconds = grace_seconds
+        self.report = report
+        self.stats = {
+            "objects": 0, "references": 0, "ok": 0,
+            ORPHAN: 0, MISSING: 0, CORRUPT: 0,
+            "orphan_bytes": 0, "deleted": 0, "unlinked": 0,
+        }
+        self._orphans: list[str] = []
+        self._pending_repairs = 0
+
+    def run(self) -> dict:
+        """Reconcile everything once; returns the stats dict."""
+        started = time.time()
+        # Repairs commit on self.db; the key stream needs its own connection
+        # because committing would close its server-side cursor.
+        stream_db = Database(self.db.cfg)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="verify") as pool:
+                window: deque[tuple[Future[str], dict]] = deque()
+                for key, obj, refs in self._merge(self.storage.iter_objects(workers=self.workers), stream_db):
+                    if obj is not None:
+                        self.stats["objects"] += 1
+                    self.stats["references"] += len(refs)
+                    if not refs:
+                        self._orphan(obj)
+                    elif obj is None:
+                        self._missing(key, refs)
+                    elif self._check_size(obj, refs):
+                        original = next((r for r in refs if r["role"] == "original" and r["hash_sha256"]), None)
+                        if self.verify and original is not None:
+                            window.append((pool.submit(self.storage.hash_object, key), original))
+                            # Bound the hashes in flight so a slow disk can't pile up work
+                            while len(window) > self.workers * 4:
+                                self._check_hash(*window.popleft())
+                        else:
+                            self.stats["ok"] += 1
+                while window:
+                    self._check_hash(*window.popleft())
+        finally:
+            stream_db.close()
+        self._flush_orphans(force=True)
+        self._commit_repairs(force=True)
+        logger.info("Reconciled %d objects in %.1fs", self.stats["objects"], time.time() - started)
+        return self.stats
+
+    # ── merge ────────────────────────────────────────────────────
+
+    @staticmethod
+    def _merge(
+        objects: Iterator[StoredObject], stream_db: Database,
+    ) -> Iterator[tuple[str, StoredObject | None, list[dict]]]:
+        """Merge-join two key-sorted streams: yield (key, object or None, references)."""
+        refs = ((key, list(rows)) for key, rows in groupby(stream_db.iter_media_keys(), key=itemgetter("key")))
+        obj = next(objects, None)
+        ref = next(refs, None)
+        while obj is not None or ref is not None:
+            if ref is None or (obj is not None and obj.key < ref[0]):
+                yield obj.key, obj, []
+                obj = next(objects, None)
+            elif obj is None or ref[0] < obj.key:
+                yield ref[0], None, ref[1]
+                ref = next(refs, None)
+            else:
+                yield obj.key, obj, ref[1]
+                obj = next(objects, None)
+                ref = next(refs, None)
+
+    # ── classification ───────────────────────────────────────────
+
+    def _problem(self, problem: str, key: str, **extra: object) -> None:
+        self.stats[problem] += 1
+        if self.report is not None:
+            self.report.write(json.dumps({"problem": problem, "key": key, **extra}) + "\n")
+
+    def _orphan(self, obj: StoredObject) -> None:
+        age = time.time() - obj.mtime
+        self.stats["orphan_bytes"] += obj.size
+        self._problem(ORPHAN, obj.key, size=obj.size, age_seconds=int(age))
+        if self.repair and age >= self.grace_seconds:
+            self._orphans.append(obj.key)
+            self._flush_orphans()
+
+    def _missing(self, key: str, refs: list[dict]) -> None:
+        # The listing is not a snapshot: the object may have been written
+        # after the walk passed its prefix.
+        if self.storage.object_exists(key):
+            self.stats["ok"] += 1
+            return
+        for ref in refs:
+            self._problem(MISSING, key, role=ref["role"], media_id=ref["media_id"])
+        self._unlink_thumbnails(key, refs)
+
+    def _check_size(self, obj: StoredObject, refs: list[dict]) -> bool:
+        bad = [r for r in refs if r["file_size"] is not None and r["file_size"] != obj.size]
+        for ref in bad:
+            self._problem(
+                CORRUPT, obj.key, role=ref["role"], media_id=ref["media_id"],
+                reason="size", expected=ref["file_size"], actual=obj.size,
+            )
+        if bad:
+            self._unlink_thumbnails(obj.key, bad)
+        return not bad
+
+    def _check_hash(self, future: Future[str], ref: dict) -> None:
+        try:
+            actual = future.result()
+        except Exception as exc:
+            logger.warning("Could not hash %s: %s", ref["key"], exc)
+            return
+        if actual == ref["hash_sha256"]:
+            self.stats["ok"] += 1
+            return
+        self._problem(
+            CORRUPT, ref["key"], role=ref["role"], media_id=ref["media_id"],
+            reason="sha256", expected=ref["hash_sha256"], actual=actual,
+        )
+
+    # ── repairs ──────────────────────────────────────────────────
+
+    def _unlink_thumbnails(self, key: str, refs: list[dict]) -> None:
+        if not self.repair:
+            return
+        for ref in refs:
+            if ref["role"] in ("thumb", "variant"):
+                self.db.unlink_media_thumbnail(ref["media_id"], key)
+                self.stats["unlinked"] += 1
+                self._pending_repairs += 1
+        self._commit_repairs()
+
+    def _commit_repairs(self, *, force: bool = False) -> None:
+        if self._pending_repairs and (force or self._pending_repairs >= COMMIT_EVERY):
+            self.db.commit()
+            self._pending_repairs = 0
+
+    def _flush_orphans(self, *, force: bool = False) -> None:
+        if self._orphans and (force or len(self._orphans) >= DELETE_BATCH):
+            self.storage.delete(self._orphans)
+            self.stats["deleted"] += len(self._orphans)
+            logger.info("Deleted %d orphaned objects", len(self._orphans))
+            self._orphans = []
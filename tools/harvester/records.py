@@ -0,0 +1,208 @@
+"""Typed records for 4chan API objects and ashchan rows.
+
+All records are slotted dataclasses: no per-instance ``__dict__``, so large
+buffered batches stay small, and attribute access replaces dict lookups in
+the hot path.  Field names match the 4chan JSON keys, which lets msgspec
+(when installed) decode response bytes straight into these classes; without
+it, decode() falls back to the stdlib json module plus from_dict().
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from typing import Any, TypeVar
+
+try:
+    import msgspec
+except ImportError:  # optional speed-up
+    msgspec = None
+
+T = TypeVar("T")
+
+
+def _pick(cls: type, data: dict) -> dict:
+    """Keep only the keys of *data* that are fields of *cls*."""
+    names = _FIELD_NAMES.get(cls)
+    if names is None:
+        names = _FIELD_NAMES[cls] = frozenset(f.name for f in fields(cls))
+    return {k: v for k, v in data.items() if k in names}
+
+
+_FIELD_NAMES: dict[type, frozenset[str]] = {}
+
+
+# ── 4chan API objects ────────────────────────────────────────────
+
+
+@dataclass(slots=True)
+class Post:
+    """A post as returned in thread.json (and the base of catalog entries)."""
+    no: int
+    resto: int = 0
+    time: int = 0
+    name: str | None = None
+    trip: str | None = None
+    id: str | None = None          # poster ID
+    capcode: str | None = None
+    country: str | None = None
+    country_name: str | None = None
+    email: str | None = None
+    sub: str | None = None
+    com: str | None = None
+    tim: int | None = None
+    filename: str | None = None
+    ext: str | None = None
+    fsize: int | None = None
+    md5: str | None = None
+    w: int | None = None
+    h: int | None = None
+    tn_w: int | None = None
+    tn_h: int | None = None
+    spoiler: int = 0
+    sticky: int = 0
+    closed: int = 0
+    archived: int = 0
+    archived_on: int | None = None
+    replies: int = 0
+    images: int = 0
+    bumplimit: int = 0
+    imagelimit: int = 0
+
+    @property
+    def is_op(self) -> bool:
+        return self.resto == 0
+
+    @property
+    def media(self) -> Media | None:
+        if not self.tim or not self.ext:
+            return None
+        return Media(
+            tim=self.tim, ext=self.ext, filename=self.filename or str(self.tim),
+            fsize=self.fsize, md5=self.md5, w=self.w, h=self.h,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Post:
+        return cls(**_pick(cls, data))
+
+    def to_dict(self) -> dict:
+        """The thread.json fields, without any catalog extras."""
+        return {f.name: getattr(self, f.name) for f in fields(Post)}
+
+
+@dataclass(slots=True)
+class CatalogThread(Post):
+    """A catalog.json thread entry: the OP plus a preview of the latest replies."""
+    last_modified: int = 0
+    omitted_posts: int = 0
+    omitted_images: int = 0
+    last_replies: list[Post] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> CatalogThread:
+        entry = cls(**_pick(cls, data))
+        entry.last_replies = [Post.from_dict(p) for p in data.get("last_replies") or ()]
+        return entry
+
+
+@dataclass(slots=True)
+class CatalogPage:
+    page: int
+    threads: list[CatalogThread] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> CatalogPage:
+        return cls(
+            page=data.get("page", 0),
+            threads=[CatalogThread.from_dict(t) for t in data.get("threads") or ()],
+        )
+
+
+@dataclass(slots=True)
+class Thread:
+    """A thread.json document (OP first)."""
+    posts: list[Post] = field(default_factory=list)
+
+    @property
+    def no(self) -> int:
+        return self.posts[0].no
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Thread:
+        return cls(posts=[Post.from_dict(p) for p in data.get("posts") or ()])
+
+
+@dataclass(slots=True)
+class Media:
+    """The file attached to a post, as described by 4chan."""
+    tim: int
+    ext: str
+    filename: str
+    fsize: int | None = None
+    md5: str | None = None
+    w: int | None = None
+    h: int | None = None
+
+    @property
+    def dimensions(self) -> str | None:
+        return f"{self.w}x{self.h}" if self.w and self.h else None
+
+
+# ── ashchan rows ─────────────────────────────────────────────────
+
+
+@dataclass(slots=True)
+class MediaRef:
+    """Media columns written to a post once its file is stored."""
+    media_url: str
+    thumb_url: str | None
+    media_filename: str
+    media_size: int | None
+    media_dimensions: str | None
+    media_hash: str | None
+    media_id: str
+    # Every stored thumbnail variant, as written to posts.metadata["thumbnails"]
+    thumbnails: list[dict] | None = None
+
+
+@dataclass(slots=True)
+class PostRow:
+    """A mapped post, ready for Database.insert_post()."""
+    thread_id: int
+    board_post_no: int
+    created_at: datetime
+    content: str
+    content_html: str | None = None
+    is_op: bool = False
+    author_name: str = "Anonymous"
+    tripcode: str | None = None
+    capcode: str | None = None
+    subject: str | None = None
+    email: str | None = None
+    country_code: str | None = None
+    country_name: str | None = None
+    poster_id: str | None = None
+    spoiler_image: bool = False
+    metadata: dict | None = None
+    media: MediaRef | None = None
+
+
+# ── decoding ─────────────────────────────────────────────────────
+
+_DECODERS: dict[Any, Any] = {}
+
+
+def decode(data: bytes, typ: Any) -> Any:
+    """Decode JSON *data* into *typ* (a record class or ``list[...]`` of one)."""
+    if msgspec is not None:
+        dec = _DECODERS.get(typ)
+        if dec is None:
+            dec = _DECODERS[typ] = msgspec.json.Decoder(typ)
+        return dec.decode(data)
+    obj = json.loads(data)
+    if getattr(typ, "__origin__", None) is list:
+        (item,) = typ.__args__
+        return [item.from_dict(o) for o in obj]
+    return typ.from_dict(obj)
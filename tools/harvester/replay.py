@@ -0,0 +1,195 @@
+"""Offline replay – stream 4chan thread JSON from local dumps."""
+
+from __future__ import annotations
+
+import bz2
+import gzip
+import json
+import logging
+import lzma
+import mmap
+import os
+import tarfile
+from pathlib import Path
+from typing import IO, Any, Callable, Iterator
+
+from .records import Thread
+
+logger = logging.getLogger("harvester.replay")
+
+# Plain JSONL files at least this large are memory-mapped instead of buffered
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
+_OPENERS: dict[str, Callable[..., IO[bytes]]] = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+_TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+_JSON_SUFFIXES = (".json",)
+_JSONL_SUFFIXES = (".jsonl", ".ndjson")
+
+
+# ── format detection ─────────────────────────────────────────────
+
+
+def _split_compression(name: str) -> tuple[str, str | None]:
+    """Return (name without compression suffix, compression suffix or None)."""
+    lower = name.lower()
+    for suffix in _OPENERS:
+        if lower.endswith(suffix):
+            return name[: -len(suffix)], suffix
+    return name, None
+
+
+def _is_tar(name: str) -> bool:
+    return name.lower().endswith(_TAR_SUFFIXES)
+
+
+def _is_dump(name: str) -> bool:
+    if _is_tar(name):
+        return True
+    inner, _ = _split_compression(name)
+    return inner.lower().endswith(_JSON_SUFFIXES + _JSONL_SUFFIXES)
+
+
+# ── JSON shapes ──────────────────────────────────────────────────
+
+
+def _threads_from_obj(obj: Any) -> Iterator[Thread]:
+    """Yield threads from a decoded document.
+
+    Accepts a single thread (``{"posts": [...]}``), a list of threads, or
+    ``{"threads": [...]}``.
+    """
+    if isinstance(obj, dict):
+        if isinstance(obj.get("posts"), list):
+            if obj["posts"]:
+                yield Thread.from_dict(obj)
+        elif isinstance(obj.get("threads"), list):
+            for item in obj["threads"]:
+                yield from _threads_from_obj(item)
+    elif isinstance(obj, list):
+        for item in obj:
+            yield from _threads_from_obj(item)
+
+
+def _threads_from_lines(lines: Iterator[bytes], source: str) -> Iterator[Thread]:
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as exc:
+            logger.warning("%s:%d: invalid JSON (%s), skipping", source, lineno, exc)
+            continue
+        yield from _threads_from_obj(obj)
+
+
+def _threads_from_stream(fh: IO[bytes], name: str, source: str) -> Iterator[Thread]:
+    """Parse an open binary stream as JSON or JSONL depending on *name*."""
+    if name.lower().endswith(_JSONL_SUFFIXES):
+        yield from _threads_from_lines(iter(fh), source)
+        return
+    try:
+        obj = json.load(fh)
+    except ValueError as exc:
+        logger.warning("%s: invalid JSON (%s), skipping", source, exc)
+        return
+    yield from _threads_from_obj(obj)
+
+
+# ── sources ──────────────────────────────────────────────────────
+
+
+def _iter_tar(path: Path) -> Iterator[Thread]:
+    with tarfile.open(path, mode="r:*") as tar:
+        for member in tar:
+            if not member.isfile() or not _is_dump(member.name) or _is_tar(member.name):
+                continue
+            fh = tar.extractfile(member)
+            if fh is None:
+                continue
+            source = f"{path}:{member.name}"
+            inner, comp = _split_compression(member.name)
+            if comp:
+                with _OPENERS[comp](fh) as dfh:
+                    yield from _threads_from_stream(dfh, inner, source)
+            else:
+                yield from _threads_from_stream(fh, inner, source)
+
+
+def _iter_mmap_lines(path: Path) -> Iterator[Thread]:
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from _threads_from_lines(iter(mm.readline, b""), str(path))
+
+
+def iter_file(path: str | os.PathLike[str]) -> Iterator[Thread]:
+    """Yield threads from a single dump file of any supported format."""
+    path = Path(path)
+    if _is_tar(path.name):
+        yield from _iter_tar(path)
+        return
+    inner, comp = _split_compression(path.name)
+    if comp:
+        with _OPENERS[comp](path, "rb") as fh:
+            yield from _threads_from_stream(fh, inner, str(path))
+        return
+    if inner.lower().endswith(_JSONL_SUFFIXES) and path.stat().st_size >= MMAP_THRESHOLD:
+        yield from _iter_mmap_lines(path)
+        return
+    with open(path, "rb") as fh:
+        yield from _threads_from_stream(fh, inner, str(path))
+
+
+def iter_threads(paths: list[str]) -> Iterator[Thread]:
+    """Yield threads from files, directories (recursive) and tarballs.
+
+    Directory entries are visited in sorted order so replays are repeatable.
+    """
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if _is_dump(name):
+                        yield from iter_file(Path(root) / name)
+        elif path.exists():
+            yield from iter_file(path)
+        else:
+            logger.warning("Replay source not found: %s", path)
+
+
+# ── local media ──────────────────────────────────────────────────
+
+
+class LocalMediaSource:
+    """Resolve 4chan media from a local directory instead of i.4cdn.org.
+
+    Looks for ``<root>/<board>/<tim><ext>`` first, then ``<root>/<tim><ext>``.
+    Exposes the same download methods as FourChanAPI so the harvester can
+    use either interchangeably.
+    """
+
+    def __init__(self, root: str | os.PathLike[str]) -> None:
+        self._root = Path(root)
+
+    def _read(self, board: str, name: str) -> bytes | None:
+        for candidate in (self._root / board / name, self._root / name):
+            try:
+                return candidate.read_bytes()
+            except FileNotFoundError:
+                continue
+        logger.debug("Local media not found: %s (/%s/)", name, board)
+        return None
+
+    def download_image(self, board: str, tim: int, ext: str) -> bytes | None:
+        return self._read(board, f"{tim}{ext}")
+
+    def download_thumbnail(self, board: str, tim: int) -> bytes | None:
+        return self._read(board, f"{tim}s.jpg")
+
+    def close(self) -> None:
+        pass
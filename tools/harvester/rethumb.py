@@ -0,0 +1,147 @@
+"""Bulk re-thumbnailing – regenerate thumbnails of already-stored media.
+
+Thumbnail settings (``--thumbs`` and friends) only apply to new imports.
+Rethumber walks media_objects in keyset pages, reads each original back
+from storage, renders the configured variants in a process pool and swaps
+the new keys into media_objects, harvester_media_thumbnails and every post
+using the media, one transaction per page.  The last finished media id is
+saved in harvester_checkpoints in the same transaction, so an interrupted
+run resumes where it stopped.
+
+Old variant objects are left in place (their keys carry the upload date);
+``reconcile --repair`` deletes them once they are past its grace period.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Sequence
+
+from .storage import _legacy_thumb, make_thumbnails
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+    from .storage import Thumbnail
+
+logger = logging.getLogger("harvester.rethumb")
+
+
+class Rethumber:
+    """Regenerate thumbnails for stored images matching a filter.
+
+    Reads and uploads run on a thread pool, rendering on a process pool of
+    the same size; at most one page of originals is held in memory.
+    """
+
+    def __init__(
+        self,
+        harvester: Harvester,
+        *,
+        workers: int | None = None,
+        batch_size: int = 100,
+        checkpoint: str = "rethumb",
+        boards: Sequence[str] = (),
+        since: datetime | None = None,
+        until: datetime | None = None,
+        mime: str | None = None,
+        missing_only: bool = False,
+    ) -> None:
+        if harvester.storage is None:
+            raise ValueError("rethumb needs a storage backend (images are disabled)")
+        self.h = harvester
+        self.storage = harvester.storage
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.filters = {
+            "boards": boards, "since": since, "until": until,
+            "mime": mime, "missing_only": missing_only,
+        }
+
+    def run(self, *, restart: bool = False, limit: int = 0) -> int:
+        """Re-thumbnail matching media; returns how many were rewritten.
+
+        Resumes after the saved checkpoint unless *restart*.  The checkpoint
+        is cleared once every matching media object has been processed.
+        """
+        db = self.h.db
+        if restart:
+            db.clear_checkpoint(self.checkpoint)
+            db.commit()
+        last_id = db.get_checkpoint(self.checkpoint) or 0
+        if last_id:
+            logger.info("Resuming %s after media id %d", self.checkpoint, last_id)
+        done = seen = 0
+        finished = False
+        with ProcessPoolExecutor(max_workers=self.workers) as cpu, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rethumb") as io:
+            while limit <= 0 or seen < limit:
+                page = self.batch_size if limit <= 0 else min(self.batch_size, limit - seen)
+                rows = db.media_for_rethumb(last_id, page, **self.filters)
+                if not rows:
+                    finished = True
+                    break
+                updates = self._render_batch(rows, cpu, io)
+                db.replace_media_thumbnails(updates)
+                last_id = rows[-1]["id"]
+                db.set_checkpoint(self.checkpoint, last_id)
+                db.commit()
+                seen += len(rows)
+                done += len(updates)
+                self.h.stats["images"] += len(updates)
+                logger.info("Rethumb: %d rewritten (last id %d)", done, last_id)
+        if finished:
+            db.clear_checkpoint(self.checkpoint)
+            db.commit()
+        return done
+
+    def _render_batch(
+        self, rows: list[dict], cpu: Executor, io: Executor,
+    ) -> list[tuple[int, list[dict], str | None, str | None, list[dict] | None]]:
+        storage = self.storage
+        reads = [io.submit(storage.read, row["storage_key"]) for row in rows]
+        renders: list[Future[list[Thumbnail]] | None] = []
+        for row, read in zip(rows, reads):
+            try:
+                data = read.result()
+            except Exception as exc:
+                logger.warning("Cannot read %s for rethumb: %s", row["storage_key"], exc)
+                self.h.stats["errors"] += 1
+                renders.append(None)
+                continue
+            renders.append(cpu.submit(
+                make_thumbnails, data, os.path.splitext(row["storage_key"])[1], storage.thumbnails,
+                optimize=storage.optimize, progressive=storage.progressive, strict=True,
+            ))
+
+        # A render that fails leaves the stored thumbnails alone; [] only means
+        # the image is smaller than every spec
+        rendered: list[list[Thumbnail] | None] = []
+        for row, render in zip(rows, renders):
+            try:
+                rendered.append(render.result() if render else None)
+            except Exception as exc:
+                logger.warning("Cannot render thumbnails of media %d, keeping the stored ones: %s", row["id"], exc)
+                self.h.stats["errors"] += 1
+                rendered.append(None)
+
+        uploads = [
+            io.submit(storage.upload_thumbnails, row["hash_sha256"], thumbs) if thumbs is not None else None
+            for row, thumbs in zip(rows, rendered)
+        ]
+        updates = []
+        for row, upload in zip(rows, uploads):
+            if upload is None:
+                continue
+            try:
+                stored = upload.result()
+            except Exception as exc:
+                logger.warning("Cannot store thumbnails of media %d: %s", row["id"], exc)
+                self.h.stats["errors"] += 1
+                continue
+            legacy = _legacy_thumb(stored)
+            updates.append((row["id"], stored, legacy["thumb_key"], legacy["thumb_url"], self.h._thumbnail_refs(stored)))
+        return updates
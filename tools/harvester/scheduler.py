@@ -0,0 +1,172 @@
+"""Thread work scheduling – fetch the threads closest to pruning first."""
+
+from __future__ import annotations
+
+import heapq
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Sequence
+
+from .records import CatalogPage, CatalogThread
+
+# Scheduling tiers; lower tiers are always drained first
+TIER_AT_RISK = 0   # live threads, ordered by expiry risk
+TIER_ARCHIVE = 1   # archived threads, oldest (closest to deletion) first
+TIER_DEFERRED = 2  # sticky or already-current threads
+
+# Risk score weights (see expiry_risk)
+W_PAGE = 2.0          # position in the catalog (last page ≈ next to be pruned)
+W_BUMPLIMIT = 1.5     # thread can no longer be bumped and will only sink
+W_IMAGELIMIT = 0.5    # image limit reached – usually close behind bump limit
+W_VELOCITY = 1.0      # replies/hour – fast threads hit the limits sooner
+W_STALE = 1.0         # time since last activity – quiet threads are sinking
+VELOCITY_SCALE = 60.0  # replies/hour that saturates the velocity term
+STALE_SCALE = 3600.0   # seconds of inactivity that saturate the staleness term
+
+
+def expiry_risk(entry: CatalogThread, page_no: int, page_count: int, *, now: float | None = None) -> float:
+    """Score how likely a catalog thread is to 404 soon (higher = sooner).
+
+    *page_no* is 1-based.  Uses catalog page position, ``bumplimit``/
+    ``imagelimit``, reply velocity and ``last_modified``.
+    """
+    now = time.time() if now is None else now
+    score = W_PAGE * (page_no / page_count if page_count else 0.0)
+    if entry.bumplimit:
+        score += W_BUMPLIMIT
+    if entry.imagelimit:
+        score += W_IMAGELIMIT
+
+    created = entry.time or now
+    age_hours = max((now - created) / 3600.0, 1 / 60)
+    velocity = entry.replies / age_hours
+    score += W_VELOCITY * min(velocity / VELOCITY_SCALE, 1.0)
+
+    last_modified = entry.last_modified or created
+    score += W_STALE * min(max(now - last_modified, 0) / STALE_SCALE, 1.0)
+    return score
+
+
+@dataclass(order=True)
+class ThreadWork:
+    """A unit of thread work; sorts by tier, then highest score first."""
+    sort_key: tuple[int, float, int]
+    thread_no: int = field(compare=False)
+    tier: int = field(compare=False)
+    score: float = field(compare=False)
+
+
+class ThreadQueue:
+    """Priority queue of thread numbers, most at-risk first.
+
+    Pushing a thread that is already queued keeps the more urgent entry.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[ThreadWork] = []
+        self._best: dict[int, tuple[int, float, int]] = {}
+
+    def push(self, thread_no: int, score: float = 0.0, *, tier: int = TIER_AT_RISK) -> None:
+        key = (tier, -score, thread_no)
+        best = self._best.get(thread_no)
+        if best is not None and best <= key:
+            return
+        self._best[thread_no] = key
+        heapq.heappush(self._heap, ThreadWork(key, thread_no, tier, score))
+
+    def pop(self) -> ThreadWork:
+        while self._heap:
+            work = heapq.heappop(self._heap)
+            if self._best.get(work.thread_no) == work.sort_key:
+                del self._best[work.thread_no]
+                return work
+        raise IndexError("pop from empty ThreadQueue")
+
+    def __len__(self) -> int:
+        return len(self._best)
+
+    def __iter__(self) -> Iterator[ThreadWork]:
+        """Drain the queue in priority order."""
+        while self._best:
+            yield self.pop()
+
+
+def plan_board(
+    catalog: list[CatalogPage],
+    archive: Iterable[int] = (),
+    *,
+    stored_replies: dict[int, int] | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    now: float | None = None,
+) -> ThreadQueue:
+    """Build the thread work queue for a board harvest.
+
+    *stored_replies* maps thread numbers already in the database to their
+    stored reply count; threads whose count matches the catalog are current
+    and get deferred along with stickies.  Live threads created outside
+    [*since*, *until*) are left out; *archive* is expected to be windowed
+    already (see archive_window).
+    """
+    stored_replies = stored_replies or {}
+    queue = ThreadQueue()
+    page_count = len(catalog)
+    for idx, page in enumerate(catalog):
+        page_no = page.page or idx + 1
+        for entry in page.threads:
+            if (since is not None and entry.time < since) or (until is not None and entry.time >= until):
+                continue
+            tno = entry.no
+            score = expiry_risk(entry, page_no, page_count, now=now)
+            current = stored_replies.get(tno, -1) >= entry.replies
+            tier = TIER_DEFERRED if entry.sticky or current else TIER_AT_RISK
+            queue.push(tno, score, tier=tier)
+    # archive.json is ascending; older threads are purged from the archive first
+    for rank, tno in enumerate(sorted(archive)):
+        queue.push(tno, -float(rank), tier=TIER_ARCHIVE)
+    return queue
+
+
+def archive_window(
+    archive: Sequence[int],
+    probe: Callable[[int], int | None],
+    *,
+    since: float | None = None,
+    until: float | None = None,
+) -> list[int]:
+    """Return the archived threads created in [*since*, *until*).
+
+    Post numbers grow with time, so the window is a contiguous slice of the
+    sorted archive; each bound is found by bisection, calling
+    ``probe(thread_no)`` for the thread's creation time (None if it is
+    gone).  That is about log2(len(archive)) probes per bound instead of a
+    fetch per thread.  Threads whose time can't be probed are kept.
+    """
+    nos = sorted(archive)
+    times: dict[int, int | None] = {}
+
+    def time_at(i: int) -> int | None:
+        no = nos[i]
+        if no not in times:
+            times[no] = probe(no)
+        return times[no]
+
+    def first_at_or_after(ts: float) -> int:
+        lo, hi = 0, len(nos)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # A purged thread has no time; use the next one that still answers
+            j = mid
+            while j < hi and time_at(j) is None:
+                j += 1
+            if j == hi:
+                hi = mid
+            elif time_at(j) < ts:  # type: ignore[operator]
+                lo = j + 1
+            else:
+                hi = mid
+        return lo
+
+    start = first_at_or_after(since) if since is not None else 0
+    end = first_at_or_after(until) if until is not None else len(nos)
+    return nos[start:max(start, end)]
@@ -0,0 +1,56 @@
+"""Startup budget check – ``python -m harvester.startup [--budget MS]``.
+
+Imports harvester.cli in fresh interpreters and reports the median import
+time.  Exits non-zero if it is over budget or if a backend module was
+imported eagerly: psycopg, boto3, Pillow, NumPy and httpx must only load
+inside the commands (and on the code paths) that use them.
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+DEFAULT_BUDGET_MS = 100.0
+DEFERRED_MODULES = ("psycopg", "boto3", "botocore", "PIL", "numpy", "httpx", "rich.progress")
+
+_PROBE = (
+    "import sys, time\n"
+    "t = time.perf_counter()\n"
+    "import harvester.cli\n"
+    "print((time.perf_counter() - t) * 1000)\n"
+    "print(','.join(m for m in {mods!r} if m in sys.modules))\n"
+)
+
+
+def measure(runs: int = 7) -> tuple[float, list[str]]:
+    """Median milliseconds to import harvester.cli, and eagerly loaded backends."""
+    env = dict(os.environ)
+    root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    code = _PROBE.format(mods=DEFERRED_MODULES)
+    timings: list[float] = []
+    eager: set[str] = set()
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+        timings.append(float(out[0]))
+        eager.update(m for m in out[1].split(",") if m)
+    return statistics.median(timings), sorted(eager)
+
+
+def main(argv: list[str]) -> int:
+    budget = float(argv[argv.index("--budget") + 1]) if "--budget" in argv else DEFAULT_BUDGET_MS
+    median, eager = measure()
+    print(f"import harvester.cli: {median:.1f} ms (budget {budget:.0f} ms)")
+    if eager:
+        print(f"eagerly imported: {', '.join(eager)}")
+    return 0 if median <= budget and not eager else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,9 @@
-"""Storage layer – upload images and thumbnails to S3/MinIO or local disk."""
+"""Storage layer – upload images and thumbnails to S3/MinIO or local disk.
+
+boto3 and Pillow are imported on first use, and the S3 client (and its
+bucket check) is only created when an object is first read or written, so
+commands that never touch media pay nothing for them.
+"""
 
 from __future__ import annotations
 
@@ -6,15 +11,20 @@ import hashlib
 import io
 import logging
 import os
+import re
 import shutil
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Sequence
 
-import boto3
-from botocore.config import Config as BotoConfig
-from PIL import Image
+from .config import DEFAULT_THUMBNAILS, DiskConfig, S3Config, ThumbnailSpec
 
-from .config import DiskConfig, S3Config
+if TYPE_CHECKING:
+    from PIL import Image
 
 logger = logging.getLogger("harvester.storage")
 
@@ -25,29 +35,566 @@ MIME_MAP: dict[str, str] = {
     ".png": "image/png",
     ".gif": "image/gif",
     ".webm": "video/webm",
+    ".mp4": "video/mp4",
     ".webp": "image/webp",
+    ".avif": "image/avif",
     ".svg": "image/svg+xml",
     ".pdf": "application/pdf",
 }
 
+# Files Pillow cannot (or should not) thumbnail
+NO_THUMB_EXTS = (".webm", ".mp4", ".pdf", ".svg")
+
+# ThumbnailSpec.format → (Pillow encoder, file extension)
+_THUMB_ENCODERS: dict[str, tuple[str, str]] = {
+    "webp": ("WEBP", ".webp"),
+    "avif": ("AVIF", ".avif"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+
+
+# ── thumbnail generation ─────────────────────────────────────────
+
+
+@dataclass(slots=True)
+class Thumbnail:
+    """One encoded thumbnail variant."""
+    name: str
+    ext: str
+    data: bytes
+    width: int
+    height: int
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_MAP[self.ext]
+
+
+@lru_cache(maxsize=None)
+def _can_encode(encoder: str) -> bool:
+    from PIL import Image
+
+    if encoder == "AVIF":
+        try:
+            import pillow_avif  # noqa: F401  registers AVIF support on older Pillow builds
+        except ImportError:  # optional dependency
+            pass
+    Image.init()
+    if encoder in Image.SAVE:
+        return True
+    logger.warning("Pillow has no %s encoder; skipping those thumbnails", encoder)
+    return False
+
+
+def _encode(img: Image.Image, spec: ThumbnailSpec, *, has_alpha: bool, optimize: bool, progressive: bool) -> tuple[bytes, str] | None:
+    encoder, ext = _THUMB_ENCODERS[spec.format]
+    if encoder == "JPEG" and has_alpha:
+        # JPEG would flatten transparency onto black; keep it lossless instead
+        encoder, ext = "PNG", ".png"
+    if not _can_encode(encoder):
+        return None
+    buf = io.BytesIO()
+    if encoder == "JPEG":
+        img.save(buf, format="JPEG", quality=spec.quality, optimize=optimize, progressive=progressive)
+    elif encoder == "WEBP":
+        img.save(buf, format="WEBP", quality=spec.quality, method=6 if optimize else 4)
+    elif encoder == "AVIF":
+        img.save(buf, format="AVIF", quality=spec.quality)
+    else:
+        img.save(buf, format="PNG", optimize=optimize)
+    return buf.getvalue(), ext
+
+
+def make_thumbnails(
+    data: bytes,
+    ext: str,
+    specs: Sequence[ThumbnailSpec],
+    *,
+    optimize: bool = True,
+    progressive: bool = True,
+    strict: bool = False,
+) -> list[Thumbnail]:
+    """Render every thumbnail variant of an image, in *specs* order.
+
+    The image is decoded once (JPEGs at reduced scale) and each distinct size
+    is resampled from the next larger one.  Variants the image already fits
+    inside are skipped, as are formats this Pillow build cannot encode.  An
+    image that fails to decode yields no variants, or raises with *strict*.
+    """
+    if ext.lower() in NO_THUMB_EXTS or not specs:
+        return []
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        wanted = [s for s in specs if img.width > s.max_size or img.height > s.max_size]
+        if not wanted:
+            return []
+        largest = max(s.max_size for s in wanted)
+        img.draft("RGB", (largest, largest))
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        resized: dict[int, Image.Image] = {}
+        for size in sorted({s.max_size for s in wanted}, reverse=True):
+            img = img.copy()
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            resized[size] = img
+
+        thumbs: list[Thumbnail] = []
+        for spec in wanted:
+            small = resized[spec.max_size]
+            encoded = _encode(small, spec, has_alpha=has_alpha, optimize=optimize, progressive=progressive)
+            if encoded:
+                thumbs.append(Thumbnail(spec.name, encoded[1], encoded[0], small.width, small.height))
+        return thumbs
+    except Exception as exc:
+        if strict:
+            raise
+        logger.warning("Thumbnail generation failed: %s", exc)
+        return []
+
+
+def _thumb_info(thumb: Thumbnail, key: str, url: str) -> dict:
+    """Describe a stored variant (harvester_media_thumbnails columns + url)."""
+    return {
+        "name": thumb.name,
+        "mime_type": thumb.mime_type,
+        "storage_key": key,
+        "url": url,
+        "width": thumb.width,
+        "height": thumb.height,
+        "file_size": len(thumb.data),
+    }
+
+
+def _legacy_thumb(stored: list[dict]) -> dict:
+    """thumb_key/thumb_url/tn_w/tn_h for the legacy media_objects/posts columns.
+
+    Uses the first JPEG or PNG variant, since every client can display
+    those; otherwise the first variant.
+    """
+    fallback = next(
+        (t for t in stored if t["mime_type"] in ("image/jpeg", "image/png")),
+        stored[0] if stored else None,
+    )
+    if fallback is None:
+        return {"thumb_key": None, "thumb_url": None, "tn_w": None, "tn_h": None}
+    return {
+        "thumb_key": fallback["storage_key"],
+        "thumb_url": fallback["url"],
+        "tn_w": fallback["width"],
+        "tn_h": fallback["height"],
+    }
+
+
+# ── container metadata ───────────────────────────────────────────
+#
+# Pillow can't open videos or PDFs, so their size, duration and codec are
+# read straight from the container headers: the EBML Info/Tracks elements
+# of a WebM, the moov box of an MP4 and the first /MediaBox of a PDF.  The
+# parsers pull bytes from an iterable of chunks and stop as soon as they
+# have what they need, so a streamed download is only read up to its
+# headers (an MP4 with moov at the end is skipped through, not buffered).
+
+PROBE_EXTS = (".webm", ".mp4", ".pdf")
+
+PDF_SCAN_LIMIT = 1 << 20    # bytes of a PDF searched for a /MediaBox
+MP4_MOOV_LIMIT = 16 << 20   # larger moov boxes are not parsed
+
+_EBML_HEADER = 0x1A45DFA3
+_MKV_SEGMENT = 0x18538067
+_MKV_INFO = 0x1549A966
+_MKV_TRACKS = 0x1654AE6B
+_MKV_CLUSTER = 0x1F43B675
+_MKV_TIMECODE_SCALE = 0x2AD7B1
+_MKV_DURATION = 0x4489
+_MKV_TRACK_ENTRY = 0xAE
+_MKV_TRACK_TYPE = 0x83
+_MKV_CODEC_ID = 0x86
+_MKV_VIDEO = 0xE0
+_MKV_PIXEL_WIDTH = 0xB0
+_MKV_PIXEL_HEIGHT = 0xBA
+
+_PDF_MEDIABOX = re.compile(rb"/MediaBox\s*\[\s*([-+\d.]+)\s+([-+\d.]+)\s+([-+\d.]+)\s+([-+\d.]+)\s*\]")
+
+
+@dataclass(slots=True)
+class MediaInfo:
+    """What a file's headers say about it; None where they don't say."""
+    width: int | None = None
+    height: int | None = None
+    duration: float | None = None   # seconds
+    codec: str | None = None        # e.g. V_VP9, avc1
+
+
+class _ChunkReader:
+    """Sequential reads and skips over an iterable of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._buf = b""
+        self._off = 0
+        self.pos = 0
+
+    def read(self, n: int) -> bytes:
+        """Up to *n* bytes; fewer only at the end of the input."""
+        while len(self._buf) - self._off < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf = self._buf[self._off:] + chunk
+            self._off = 0
+        out = self._buf[self._off:self._off + n]
+        self._off += len(out)
+        self.pos += len(out)
+        return out
+
+    def exactly(self, n: int) -> bytes:
+        out = self.read(n)
+        if len(out) < n:
+            raise EOFError
+        return out
+
+    def skip(self, n: int) -> None:
+        avail = len(self._buf) - self._off
+        if n <= avail:
+            self._off += n
+            self.pos += n
+            return
+        self.pos += avail
+        n -= avail
+        self._buf, self._off = b"", 0
+        for chunk in self._chunks:
+            if len(chunk) > n:
+                self._buf, self._off = chunk, n
+                self.pos += n
+                return
+            n -= len(chunk)
+            self.pos += len(chunk)
+        raise EOFError
+
+
+def probe_media(data: bytes | Iterable[bytes], ext: str) -> MediaInfo | None:
+    """Read a WebM, MP4 or PDF's metadata from its headers.
+
+    *data* is the whole file or an iterable of chunks (e.g. an HTTP
+    response body); returns None for other types and unreadable files.
+    """
+    parser = {".webm": _probe_webm, ".mp4": _probe_mp4, ".pdf": _probe_pdf}.get(ext.lower())
+    if parser is None:
+        return None
+    reader = _ChunkReader((data,) if isinstance(data, (bytes, bytearray, memoryview)) else data)
+    try:
+        return parser(reader)
+    except (EOFError, ValueError, struct.error) as exc:
+        logger.debug("Could not read %s headers: %s", ext, exc)
+        return None
+
+
+# WebM (Matroska/EBML)
+
+def _ebml_vint(r: _ChunkReader, *, marker: bool) -> int | None:
+    """An EBML variable-length integer; element IDs keep their marker bit.
+
+    Returns None for a size with every value bit set ("unknown size").
+    """
+    first = r.exactly(1)[0]
+    if not first:
+        raise ValueError("invalid EBML variable-length integer")
+    length = 9 - first.bit_length()
+    value = first if marker else first & (0xFF >> length)
+    for byte in r.exactly(length - 1):
+        value = value << 8 | byte
+    if not marker and value == (1 << 7 * length) - 1:
+        return None
+    return value
+
+
+def _ebml_children(data: bytes) -> Iterator[tuple[int, bytes]]:
+    r = _ChunkReader((data,))
+    while r.pos < len(data):
+        eid = _ebml_vint(r, marker=True)
+        size = _ebml_vint(r, marker=False)
+        yield eid, r.exactly(size if size is not None else len(data) - r.pos)  # type: ignore[arg-type]
+
+
+def _ebml_uint(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+
+def _ebml_float(data: bytes) -> float:
+    return struct.unpack(">f" if len(data) == 4 else ">d", data)[0]
+
+
+def _probe_webm(r: _ChunkReader) -> MediaInfo | None:
+    if _ebml_vint(r, marker=True) != _EBML_HEADER:
+        return None
+    size = _ebml_vint(r, marker=False)
+    r.skip(size or 0)
+    if _ebml_vint(r, marker=True) != _MKV_SEGMENT:
+        return None
+    _ebml_vint(r, marker=False)
+
+    info = MediaInfo()
+    seen_info = seen_tracks = False
+    while not (seen_info and seen_tracks):
+        try:
+            eid = _ebml_vint(r, marker=True)
+        except EOFError:
+            break
+        size = _ebml_vint(r, marker=False)
+        if eid == _MKV_CLUSTER or size is None:
+            break
+        if eid == _MKV_INFO:
+            scale, duration = 1_000_000, None
+            for cid, payload in _ebml_children(r.exactly(size)):
+                if cid == _MKV_TIMECODE_SCALE:
+                    scale = _ebml_uint(payload)
+                elif cid == _MKV_DURATION:
+                    duration = _ebml_float(payload)
+            if duration is not None:
+                info.duration = round(duration * scale / 1e9, 3)
+            seen_info = True
+        elif eid == _MKV_TRACKS:
+            _webm_tracks(r.exactly(size), info)
+            seen_tracks = True
+        else:
+            r.skip(size)
+    return info if seen_info or seen_tracks else None
+
+
+def _webm_tracks(data: bytes, info: MediaInfo) -> None:
+    """Fill in the first video track's size and codec (else the first codec)."""
+    for eid, entry in _ebml_children(data):
+        if eid != _MKV_TRACK_ENTRY:
+            continue
+        fields = dict(_ebml_children(entry))
+        codec = fields.get(_MKV_CODEC_ID, b"").rstrip(b"\0").decode("ascii", "replace") or None
+        if _ebml_uint(fields.get(_MKV_TRACK_TYPE, b"")) == 1:
+            video = dict(_ebml_children(fields.get(_MKV_VIDEO, b"")))
+            if _MKV_PIXEL_WIDTH in video and _MKV_PIXEL_HEIGHT in video:
+                info.width = _ebml_uint(video[_MKV_PIXEL_WIDTH])
+                info.height = _ebml_uint(video[_MKV_PIXEL_HEIGHT])
+            info.codec = codec
+            return
+        info.codec = info.codec or codec
+
+
+# MP4 (ISO base media)
+
+def _mp4_boxes(data: bytes) -> Iterator[tuple[bytes, bytes]]:
+    off = 0
+    while off + 8 <= len(data):
+        size, kind = struct.unpack_from(">I4s", data, off)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, off + 8)[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - off
+        if size < header:
+            raise ValueError(f"bad MP4 box size {size}")
+        yield kind, data[off + header:off + size]
+        off += size
+
+
+def _probe_mp4(r: _ChunkReader) -> MediaInfo | None:
+    first = True
+    while True:
+        header = r.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack(">I4s", header)
+        if first and kind not in (b"ftyp", b"moov", b"free", b"skip", b"wide", b"mdat"):
+            return None
+        first = False
+        if size == 1:
+            size = struct.unpack(">Q", r.exactly(8))[0] - 16
+        elif size == 0:
+            size = MP4_MOOV_LIMIT if kind == b"moov" else -1
+        else:
+            size -= 8
+        if kind == b"moov":
+            if size > MP4_MOOV_LIMIT:
+                return None
+            return _mp4_moov(r.read(size))
+        if size < 0:
+            return None
+        r.skip(size)
+
+
+def _mp4_moov(moov: bytes) -> MediaInfo:
+    info = MediaInfo()
+    for kind, box in _mp4_boxes(moov):
+        if kind == b"mvhd":
+            if box[0] == 1:
+                timescale, duration = struct.unpack_from(">IQ", box, 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", box, 12)
+            if timescale:
+                info.duration = round(duration / timescale, 3)
+        elif kind == b"trak":
+            handler, codec, size = _mp4_track(box)
+            if handler == b"vide":
+                if size:
+                    info.width, info.height = size
+                info.codec = codec
+            elif handler == b"soun" and info.codec is None:
+                info.codec = codec
+    return info
+
+
+def _mp4_track(trak: bytes) -> tuple[bytes | None, str | None, tuple[int, int] | None]:
+    """(handler type, sample entry format, tkhd width/height) of one trak."""
+    handler = codec = size = None
+    for kind, box in _mp4_boxes(trak):
+        if kind == b"tkhd" and len(box) >= 8:
+            w, h = struct.unpack_from(">II", box, len(box) - 8)
+            if w >> 16 and h >> 16:
+                size = (w >> 16, h >> 16)
+        elif kind == b"mdia":
+            for mkind, mbox in _mp4_boxes(box):
+                if mkind == b"hdlr":
+                    handler = mbox[8:12]
+                elif mkind == b"minf":
+                    codec = _mp4_sample_format(mbox)
+    return handler, codec, size
+
+
+def _mp4_sample_format(minf: bytes) -> str | None:
+    for kind, box in _mp4_boxes(minf):
+        if kind != b"stbl":
+            continue
+        for skind, sbox in _mp4_boxes(box):
+            if skind == b"stsd" and len(sbox) >= 16:
+                return sbox[12:16].decode("ascii", "replace").strip() or None
+    return None
+
+
+# PDF
+
+def _probe_pdf(r: _ChunkReader) -> MediaInfo | None:
+    """Size of the first page box, in points (1/72 inch)."""
+    if not r.read(5) == b"%PDF-":
+        return None
+    window = b""
+    while r.pos < PDF_SCAN_LIMIT:
+        chunk = r.read(65536)
+        if not chunk:
+            break
+        window = window[-256:] + chunk
+        match = _PDF_MEDIABOX.search(window)
+        if match:
+            x0, y0, x1, y1 = (float(v) for v in match.groups())
+            return MediaInfo(width=round(abs(x1 - x0)), height=round(abs(y1 - y0)))
+    return None
+
+
+def media_info(data: bytes, ext: str) -> MediaInfo | None:
+    """Dimensions of an image (via Pillow), or the header metadata of a container."""
+    if ext.lower() in PROBE_EXTS:
+        return probe_media(data, ext)
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        return MediaInfo(width=img.width, height=img.height)
+    except Exception:
+        return None
+
+
+# ── listing ──────────────────────────────────────────────────────
+
+
+@dataclass(slots=True)
+class StoredObject:
+    """A stored file/object, as listed by iter_objects().
+
+    Directory entries (``is_dir``) only appear inside _walk_sorted().
+    """
+    key: str
+    size: int = 0
+    mtime: float = 0.0   # POSIX timestamp (file mtime / S3 LastModified)
+    is_dir: bool = False
+
+
+def _walk_sorted(scan: Callable[[str], list[StoredObject]], workers: int) -> Iterator[StoredObject]:
+    """Yield every object under a key tree in byte order, listing directories in parallel.
+
+    *scan(prefix)* lists one directory level: objects plus sub-directories,
+    whose keys end in ``/``.  Sorting each level by key (so ``a/`` sorts
+    where its contents do) makes the depth-first output globally sorted.
+    Up to *workers* sibling directories are listed ahead of the one being
+    consumed, so memory stays bounded by a few directory listings.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walk") as pool:
+
+        def visit(listing: Future[list[StoredObject]]) -> Iterator[StoredObject]:
+            entries = sorted(listing.result(), key=lambda e: e.key)
+            subdirs = iter([e.key for e in entries if e.is_dir])
+            ahead: dict[str, Future[list[StoredObject]]] = {}
+
+            def prefetch() -> None:
+                while len(ahead) < workers:
+                    prefix = next(subdirs, None)
+                    if prefix is None:
+                        return
+                    ahead[prefix] = pool.submit(scan, prefix)
+
+            prefetch()
+            for entry in entries:
+                if entry.is_dir:
+                    sub = ahead.pop(entry.key)
+                    prefetch()
+                    yield from visit(sub)
+                else:
+                    yield entry
+
+        yield from visit(pool.submit(scan, ""))
+
 
 class StorageService:
     """Upload images and thumbnails to MinIO / S3."""
 
-    def __init__(self, cfg: S3Config | None = None, thumb_max: int = 250) -> None:
+    def __init__(
+        self,
+        cfg: S3Config | None = None,
+        thumbnails: Sequence[ThumbnailSpec] | None = None,
+        *,
+        optimize: bool = True,
+        progressive: bool = True,
+    ) -> None:
         self.cfg = cfg or S3Config.from_env()
-        self.thumb_max = thumb_max
-        self._s3 = boto3.client(
-            "s3",
-            endpoint_url=self.cfg.endpoint,
-            aws_access_key_id=self.cfg.access_key,
-            aws_secret_access_key=self.cfg.secret_key,
-            config=BotoConfig(signature_version="s3"),
-            use_ssl=self.cfg.use_ssl,
-        )
-        self._ensure_bucket()
+        self.thumbnails = tuple(thumbnails) if thumbnails is not None else ThumbnailSpec.parse_list(DEFAULT_THUMBNAILS)
+        self.optimize = optimize
+        self.progressive = progressive
+        self._client: Any = None
+        self._bucket_ready = False
+
+    @property
+    def _s3(self) -> Any:
+        """The boto3 client, created on first use."""
+        if self._client is None:
+            import boto3
+            from botocore.config import Config as BotoConfig
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.cfg.endpoint,
+                aws_access_key_id=self.cfg.access_key,
+                aws_secret_access_key=self.cfg.secret_key,
+                config=BotoConfig(signature_version="s3"),
+                use_ssl=self.cfg.use_ssl,
+            )
+        return self._client
 
     def _ensure_bucket(self) -> None:
+        """Create the bucket if needed; checked once, before the first write."""
+        if self._bucket_ready:
+            return
+        self._bucket_ready = True
         try:
             self._s3.head_bucket(Bucket=self.cfg.bucket)
         except Exception:
@@ -69,45 +616,27 @@ class StorageService:
         return f"{now:%Y/%m/%d}/{sha}{ext}"
 
     @staticmethod
-    def _thumb_key(sha: str, ext: str) -> str:
+    def _thumb_key(sha: str, name: str, ext: str) -> str:
         now = datetime.now(timezone.utc)
-        return f"{now:%Y/%m/%d}/{sha}_thumb{ext}"
+        return f"{now:%Y/%m/%d}/{sha}_{name}{ext}"
 
     def _guess_mime(self, ext: str) -> str:
         return MIME_MAP.get(ext.lower(), "application/octet-stream")
 
     # ── thumbnail generation ────────────────────────────────────
 
-    def make_thumbnail(self, data: bytes, ext: str) -> tuple[bytes, int, int] | None:
-        """Create a thumbnail if the image is larger than thumb_max.
-
-        Returns (thumb_bytes, width, height) or None if already small enough
-        or if thumbnail generation fails (e.g. for video files).
-        """
-        if ext.lower() in (".webm", ".pdf", ".svg"):
-            return None
-        try:
-            img = Image.open(io.BytesIO(data))
-            if img.width <= self.thumb_max and img.height <= self.thumb_max:
-                return None
-            img.thumbnail((self.thumb_max, self.thumb_max), Image.Resampling.LANCZOS)
-            buf = io.BytesIO()
-            fmt = "JPEG" if ext.lower() in (".jpg", ".jpeg") else "PNG"
-            img.save(buf, format=fmt)
-            return buf.getvalue(), img.width, img.height
-        except Exception as exc:
-            logger.warning("Thumbnail generation failed: %s", exc)
-            return None
+    def make_thumbnails(self, data: bytes, ext: str) -> list[Thumbnail]:
+        """Render the configured thumbnail variants (empty for videos etc.)."""
+        return make_thumbnails(
+            data, ext, self.thumbnails, optimize=self.optimize, progressive=self.progressive
+        )
 
     # ── image dimensions ────────────────────────────────────────
 
     @staticmethod
-    def get_dimensions(data: bytes) -> tuple[int, int] | None:
-        try:
-            img = Image.open(io.BytesIO(data))
-            return img.width, img.height
-        except Exception:
-            return None
+    def get_dimensions(data: bytes, ext: str = "") -> tuple[int, int] | None:
+        info = media_info(data, ext)
+        return (info.width, info.height) if info and info.width and info.height else None
 
     # ── upload ───────────────────────────────────────────────────
 
@@ -118,19 +647,19 @@ class StorageService:
         *,
         generate_thumb: bool = True,
     ) -> dict:
-        """Upload original image (and optional thumbnail) to S3.
+        """Upload original image (and optional thumbnails) to S3.
 
         Returns a dict with keys matching `media_objects` columns:
             hash_sha256, mime_type, file_size, width, height,
             storage_key, thumb_key, media_url, thumb_url
+        plus ``duration``/``codec`` for videos (see probe_media) and
+        ``thumbnails``, one dict per stored variant (see _thumb_info).
         """
         sha = self.sha256(data)
+        self._ensure_bucket()
         mime = self._guess_mime(ext)
         storage_key = self._storage_key(sha, ext)
-        thumb_key: str | None = None
-        thumb_url: str | None = None
-        tn_w: int | None = None
-        tn_h: int | None = None
+        thumbnails: list[dict] = []
 
         # Upload original
         self._s3.put_object(
@@ -141,40 +670,86 @@ class StorageService:
         )
         media_url = f"{self.cfg.endpoint}/{self.cfg.bucket}/{storage_key}"
 
-        dims = self.get_dimensions(data)
-        w = dims[0] if dims else None
-        h = dims[1] if dims else None
+        info = media_info(data, ext) or MediaInfo()
 
-        # Thumbnail
+        # Thumbnails
         if generate_thumb:
-            thumb_result = self.make_thumbnail(data, ext)
-            if thumb_result:
-                thumb_data, tn_w, tn_h = thumb_result
-                thumb_ext = ".jpg" if ext.lower() in (".jpg", ".jpeg") else ".png"
-                thumb_key = self._thumb_key(sha, thumb_ext)
-                thumb_mime = self._guess_mime(thumb_ext)
-                self._s3.put_object(
-                    Bucket=self.cfg.bucket,
-                    Key=thumb_key,
-                    Body=thumb_data,
-                    ContentType=thumb_mime,
-                )
-                thumb_url = f"{self.cfg.endpoint}/{self.cfg.bucket}/{thumb_key}"
+            thumbnails = self.upload_thumbnails(sha, self.make_thumbnails(data, ext))
 
         return {
             "hash_sha256": sha,
             "mime_type": mime,
             "file_size": len(data),
-            "width": w,
-            "height": h,
+            "width": info.width,
+            "height": info.height,
+            "duration": info.duration,
+            "codec": info.codec,
             "storage_key": storage_key,
-            "thumb_key": thumb_key,
             "media_url": media_url,
-            "thumb_url": thumb_url,
-            "tn_w": tn_w,
-            "tn_h": tn_h,
+            **_legacy_thumb(thumbnails),
+            "thumbnails": thumbnails,
         }
 
+    def upload_thumbnails(self, sha: str, thumbs: Sequence[Thumbnail]) -> list[dict]:
+        """Store rendered thumbnail variants; returns their _thumb_info dicts."""
+        stored: list[dict] = []
+        self._ensure_bucket()
+        for thumb in thumbs:
+            key = self._thumb_key(sha, thumb.name, thumb.ext)
+            self._s3.put_object(
+                Bucket=self.cfg.bucket,
+                Key=key,
+                Body=thumb.data,
+                ContentType=thumb.mime_type,
+            )
+            stored.append(_thumb_info(thumb, key, f"{self.cfg.endpoint}/{self.cfg.bucket}/{key}"))
+        return stored
+
+    def read(self, key: str) -> bytes:
+        """Fetch a stored object's bytes."""
+        return self._s3.get_object(Bucket=self.cfg.bucket, Key=key)["Body"].read()
+
+    def hash_object(self, key: str) -> str:
+        """SHA-256 of a stored object, streamed rather than read into memory."""
+        digest = hashlib.sha256()
+        for chunk in self._s3.get_object(Bucket=self.cfg.bucket, Key=key)["Body"].iter_chunks(1 << 20):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def _scan(self, prefix: str) -> list[StoredObject]:
+        entries: list[StoredObject] = []
+        paginator = self._s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.cfg.bucket, Prefix=prefix, Delimiter="/"):
+            for cp in page.get("CommonPrefixes", ()):
+                entries.append(StoredObject(cp["Prefix"], is_dir=True))
+            for obj in page.get("Contents", ()):
+                entries.append(StoredObject(obj["Key"], obj["Size"], obj["LastModified"].timestamp()))
+        return entries
+
+    def iter_objects(self, *, workers: int = 8) -> Iterator[StoredObject]:
+        """Every object in the bucket, sorted by key (paginated, concurrent listing)."""
+        return _walk_sorted(self._scan, workers)
+
+    def object_exists(self, key: str) -> bool:
+        try:
+            self._s3.head_object(Bucket=self.cfg.bucket, Key=key)
+        except self._s3.exceptions.ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def delete(self, keys: Sequence[str]) -> None:
+        """Delete objects, up to 1000 per request."""
+        for i in range(0, len(keys), 1000):
+            batch = keys[i:i + 1000]
+            resp = self._s3.delete_objects(
+                Bucket=self.cfg.bucket,
+                Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+            )
+            for err in resp.get("Errors", ()):
+                logger.warning("Could not delete %s: %s", err.get("Key"), err.get("Message"))
+
     def exists(self, sha256_hash: str) -> bool:
         """Check if a file with this hash already exists in the bucket (any date prefix)."""
         # We rely on the database dedup instead of scanning S3
@@ -187,9 +762,18 @@ class StorageService:
 class DiskStorageService:
     """Save images and thumbnails to local disk, mirroring the S3 key layout."""
 
-    def __init__(self, cfg: DiskConfig | None = None, thumb_max: int = 250) -> None:
+    def __init__(
+        self,
+        cfg: DiskConfig | None = None,
+        thumbnails: Sequence[ThumbnailSpec] | None = None,
+        *,
+        optimize: bool = True,
+        progressive: bool = True,
+    ) -> None:
         self.cfg = cfg or DiskConfig.from_env()
-        self.thumb_max = thumb_max
+        self.thumbnails = tuple(thumbnails) if thumbnails is not None else ThumbnailSpec.parse_list(DEFAULT_THUMBNAILS)
+        self.optimize = optimize
+        self.progressive = progressive
         self._base = Path(self.cfg.base_path)
         self._base.mkdir(parents=True, exist_ok=True)
         logger.info("Disk storage: %s", self._base)
@@ -206,38 +790,24 @@ class DiskStorageService:
         return f"{now:%Y/%m/%d}/{sha}{ext}"
 
     @staticmethod
-    def _thumb_key(sha: str, ext: str) -> str:
+    def _thumb_key(sha: str, name: str, ext: str) -> str:
         now = datetime.now(timezone.utc)
-        return f"{now:%Y/%m/%d}/{sha}_thumb{ext}"
+        return f"{now:%Y/%m/%d}/{sha}_{name}{ext}"
 
     def _guess_mime(self, ext: str) -> str:
         return MIME_MAP.get(ext.lower(), "application/octet-stream")
 
     # ── thumbnail generation ────────────────────────────────────
 
-    def make_thumbnail(self, data: bytes, ext: str) -> tuple[bytes, int, int] | None:
-        if ext.lower() in (".webm", ".pdf", ".svg"):
-            return None
-        try:
-            img = Image.open(io.BytesIO(data))
-            if img.width <= self.thumb_max and img.height <= self.thumb_max:
-                return None
-            img.thumbnail((self.thumb_max, self.thumb_max), Image.Resampling.LANCZOS)
-            buf = io.BytesIO()
-            fmt = "JPEG" if ext.lower() in (".jpg", ".jpeg") else "PNG"
-            img.save(buf, format=fmt)
-            return buf.getvalue(), img.width, img.height
-        except Exception as exc:
-            logger.warning("Thumbnail generation failed: %s", exc)
-            return None
+    def make_thumbnails(self, data: bytes, ext: str) -> list[Thumbnail]:
+        return make_thumbnails(
+            data, ext, self.thumbnails, optimize=self.optimize, progressive=self.progressive
+        )
 
     @staticmethod
-    def get_dimensions(data: bytes) -> tuple[int, int] | None:
-        try:
-            img = Image.open(io.BytesIO(data))
-            return img.width, img.height
-        except Exception:
-            return None
+    def get_dimensions(data: bytes, ext: str = "") -> tuple[int, int] | None:
+        info = media_info(data, ext)
+        return (info.width, info.height) if info and info.width and info.height else None
 
     # ── upload to disk ──────────────────────────────────────────
 
@@ -255,10 +825,7 @@ class DiskStorageService:
         sha = self.sha256(data)
         mime = self._guess_mime(ext)
         storage_key = self._storage_key(sha, ext)
-        thumb_key: str | None = None
-        thumb_url: str | None = None
-        tn_w: int | None = None
-        tn_h: int | None = None
+        thumbnails: list[dict] = []
 
         # Write original
         dest = self._base / storage_key
@@ -266,35 +833,73 @@ class DiskStorageService:
         dest.write_bytes(data)
         media_url = f"{self.cfg.url_prefix}/{storage_key}"
 
-        dims = self.get_dimensions(data)
-        w = dims[0] if dims else None
-        h = dims[1] if dims else None
+        info = media_info(data, ext) or MediaInfo()
 
-        # Thumbnail
+        # Thumbnails
         if generate_thumb:
-            thumb_result = self.make_thumbnail(data, ext)
-            if thumb_result:
-                thumb_data, tn_w, tn_h = thumb_result
-                thumb_ext = ".jpg" if ext.lower() in (".jpg", ".jpeg") else ".png"
-                thumb_key = self._thumb_key(sha, thumb_ext)
-                tdest = self._base / thumb_key
-                tdest.parent.mkdir(parents=True, exist_ok=True)
-                tdest.write_bytes(thumb_data)
-                thumb_url = f"{self.cfg.url_prefix}/{thumb_key}"
+            thumbnails = self.upload_thumbnails(sha, self.make_thumbnails(data, ext))
 
         return {
             "hash_sha256": sha,
             "mime_type": mime,
             "file_size": len(data),
-            "width": w,
-            "height": h,
+            "width": info.width,
+            "height": info.height,
+            "duration": info.duration,
+            "codec": info.codec,
             "storage_key": storage_key,
-            "thumb_key": thumb_key,
             "media_url": media_url,
-            "thumb_url": thumb_url,
-            "tn_w": tn_w,
-            "tn_h": tn_h,
+            **_legacy_thumb(thumbnails),
+            "thumbnails": thumbnails,
         }
 
+    def upload_thumbnails(self, sha: str, thumbs: Sequence[Thumbnail]) -> list[dict]:
+        """Write rendered thumbnail variants; returns their _thumb_info dicts."""
+        stored: list[dict] = []
+        for thumb in thumbs:
+            key = self._thumb_key(sha, thumb.name, thumb.ext)
+            dest = self._base / key
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.write_bytes(thumb.data)
+            stored.append(_thumb_info(thumb, key, f"{self.cfg.url_prefix}/{key}"))
+        return stored
+
+    def read(self, key: str) -> bytes:
+        """Read a stored file's bytes."""
+        return (self._base / key).read_bytes()
+
+    def hash_object(self, key: str) -> str:
+        """SHA-256 of a stored file, streamed rather than read into memory."""
+        digest = hashlib.sha256()
+        with open(self._base / key, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _scan(self, prefix: str) -> list[StoredObject]:
+        entries: list[StoredObject] = []
+        with os.scandir(self._base / prefix) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.append(StoredObject(f"{prefix}{entry.name}/", is_dir=True))
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    entries.append(StoredObject(prefix + entry.name, st.st_size, st.st_mtime))
+        return entries
+
+    def iter_objects(self, *, workers: int = 8) -> Iterator[StoredObject]:
+        """Every file under base_path, sorted by key (parallel directory walk)."""
+        return _walk_sorted(self._scan, workers)
+
+    def object_exists(self, key: str) -> bool:
+        return (self._base / key).is_file()
+
+    def delete(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            try:
+                (self._base / key).unlink()
+            except FileNotFoundError:
+                pass
+
     def close(self) -> None:
         pass
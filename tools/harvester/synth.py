@@ -0,0 +1,365 @@
+"""Synthetic data – fill boards with realistic fake threads for load testing.
+
+Everything is derived from a seed: the same seed, boards and parameters
+produce the same threads, posts, quote links and media assignments.  The
+shapes follow what a real board looks like:
+
+- replies per thread are log-normal (most threads die young, a few hit the
+  bump limit) and reply gaps are exponential over a log-normal lifetime
+- every OP and about ``image_ratio`` of replies carry a file, up to the
+  image limit; files come from a shared pool picked with a power-law skew,
+  so popular images are reposted across threads like real reaction images
+- post lengths are log-normal in words, with greentext lines, sage replies
+  and ``>>`` quotes that mostly target recent posts
+
+Work is split into chunks of threads with disjoint time windows and post
+number ranges, generated in a process pool, and written with COPY, one
+transaction per chunk.  Post numbers increase with time on each board.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+
+from .comment import backlink_map
+from .config import DatabaseConfig
+from .db import Database
+
+if TYPE_CHECKING:
+    from .harvester import Harvester
+
+logger = logging.getLogger("harvester.synth")
+
+BUMP_LIMIT = 300
+IMAGE_LIMIT = 150
+
+THREAD_COLUMNS = ("id", "board_id", "created_at", "updated_at", "bumped_at", "reply_count", "image_count")
+POST_COLUMNS = (
+    "thread_id", "board_post_no", "created_at", "updated_at", "content", "content_html",
+    "is_op", "author_name", "email", "subject", "media_id", "media_url", "thumb_url",
+    "media_filename", "media_size", "media_dimensions", "media_hash", "metadata",
+)
+
+_WORDS = tuple("""
+    the be to of and a in that have i it for not on with he as you do at this but his by from they
+    we say her she or an will my one all would there their what so up out if about who get which go
+    me when make can like time no just him know take people into year your good some could them see
+    other than then now look only come its over think also back after use two how our work first
+    well way even new want because any these give day most us thread anon post image board based
+    cope source kek lol literally actually unironically imagine newfag oldfag bump sage lurk moar
+    fren pic related checked rolled retard opinion discarded seethe mald ngmi wagmi comfy kino
+""".split())
+_SIZES = ((320, 240), (400, 400), (480, 360), (500, 375), (600, 450), (640, 480), (720, 540), (800, 600))
+
+
+@dataclass(frozen=True)
+class SynthParams:
+    seed: int = 0
+    threads: int = 1000            # per board
+    start: datetime = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    days: float = 30.0             # thread creation times are spread over this window
+    replies_median: float = 25.0
+    image_ratio: float = 0.25      # share of replies with a file
+    quote_ratio: float = 0.45      # share of replies quoting earlier posts
+    chunk: int = 500               # threads per task and transaction
+
+
+@dataclass(frozen=True, slots=True)
+class PoolMedia:
+    """A media_objects row that synthetic posts can attach."""
+    media_id: str
+    url: str
+    thumb_url: str | None
+    ext: str
+    size: int
+    dimensions: str
+    md5: str                       # base64, as 4chan reports it in posts.media_hash
+    thumbnails: list[dict] | None  # posts.metadata["thumbnails"]
+
+
+@dataclass(frozen=True, slots=True)
+class _Task:
+    board_slug: str
+    board_id: int
+    chunk: int
+    threads: int
+    first_no: int
+    t0: float
+    t1: float
+
+
+def _task_rng(seed: int, board_slug: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{board_slug}:{chunk}")
+
+
+def _reply_counts(rng: random.Random, n: int, median: float) -> list[int]:
+    """Replies per thread; drawn first from a task's RNG so the planner can size it."""
+    mu = math.log(median)
+    return [min(int(rng.lognormvariate(mu, 1.1)), BUMP_LIMIT) for _ in range(n)]
+
+
+def _comment(rng: random.Random, quotes: list[int]) -> tuple[str, str]:
+    """(content, content_html) in the form comment.parse_comment() produces."""
+    text = [f">>{q}" for q in quotes]
+    html = [f'<a href="#p{q}" class="quotelink">&gt;&gt;{q}</a>' for q in quotes]
+    words = min(max(int(rng.lognormvariate(2.3, 0.9)), 1), 300)
+    while words > 0:
+        k = min(words, rng.randint(4, 18))
+        words -= k
+        line = " ".join(rng.choices(_WORDS, k=k))
+        if rng.random() < 0.12:
+            text.append(">" + line)
+            html.append(f'<span class="quote">&gt;{line}</span>')
+        else:
+            text.append(line)
+            html.append(line)
+    return "\n".join(text), "<br>".join(html)
+
+
+def _ts(t: float) -> datetime:
+    return datetime.fromtimestamp(t, tz=timezone.utc)
+
+
+# ── worker process ───────────────────────────────────────────────
+
+_worker: dict[str, Any] = {}
+
+
+def _init_worker(db_cfg: DatabaseConfig, pool: list[PoolMedia], params: SynthParams) -> None:
+    db = Database(db_cfg)
+    db.set_synchronous_commit(False)
+    _worker.update(db=db, pool=pool, params=params)
+
+
+def _run_task(task: _Task) -> tuple[int, int, int]:
+    """Generate and COPY one chunk of threads; returns (threads, posts, images)."""
+    db: Database = _worker["db"]
+    threads, posts, images = _generate(task, _worker["params"], _worker["pool"])
+    db.copy_rows("threads", THREAD_COLUMNS, threads)
+    db.copy_rows("posts", POST_COLUMNS, posts)
+    db.link_op_posts([t[0] for t in threads])
+    db.commit()
+    return len(threads), len(posts), images
+
+
+def _generate(task: _Task, params: SynthParams, pool: list[PoolMedia]) -> tuple[list[tuple], list[tuple], int]:
+    rng = _task_rng(params.seed, task.board_slug, task.chunk)
+    counts = _reply_counts(rng, task.threads, params.replies_median)
+
+    # Post times per thread, then numbers in global time order
+    times: list[list[float]] = []
+    for replies in counts:
+        created = task.t0 + rng.random() * (task.t1 - task.t0)
+        life = rng.lognormvariate(math.log(6 * 3600), 1.0)
+        ts = [created]
+        for _ in range(replies):
+            ts.append(ts[-1] + rng.expovariate(replies / life))
+        times.append(ts)
+    order = sorted((t, ti, pos) for ti, ts in enumerate(times) for pos, t in enumerate(ts))
+    nums: list[list[int]] = [[0] * len(ts) for ts in times]
+    for i, (_, ti, pos) in enumerate(order):
+        nums[ti][pos] = task.first_no + i
+
+    thread_rows: list[tuple] = []
+    post_rows: list[tuple] = []
+    image_total = 0
+    for ti, ts in enumerate(times):
+        tnums = nums[ti]
+        op_no = tnums[0]
+        specs = []
+        images = 0
+        bumped = ts[0]
+        for pos, no in enumerate(tnums):
+            quotes: list[int] = []
+            if pos and rng.random() < params.quote_ratio:
+                for _ in range(2 if rng.random() < 0.2 else 1):
+                    target = tnums[max(pos - 1 - int(rng.expovariate(0.4)), 0)]
+                    if target not in quotes:
+                        quotes.append(target)
+            media = None
+            if pool and (pos == 0 or (images < IMAGE_LIMIT and rng.random() < params.image_ratio)):
+                media = pool[int(len(pool) * rng.random() ** 3)]
+                images += 1
+            sage = pos > 0 and rng.random() < 0.04
+            if not sage:
+                bumped = ts[pos]
+            subject = " ".join(rng.choices(_WORDS, k=rng.randint(2, 6))).capitalize() if pos == 0 and rng.random() < 0.6 else None
+            content, html = _comment(rng, quotes)
+            specs.append((no, ts[pos], quotes, media, sage, subject, content, html))
+
+        backlinks = backlink_map({s[0]: s[2] for s in specs})
+        for no, t, quotes, media, sage, subject, content, html in specs:
+            metadata: dict = {"quotes": quotes, "backlinks": backlinks.get(no, [])}
+            if media and media.thumbnails:
+                metadata["thumbnails"] = media.thumbnails
+            created = _ts(t)
+            post_rows.append((
+                op_no, no, created, created, content, html,
+                no == op_no, "Anonymous", "sage" if sage else None, subject,
+                media.media_id if media else None,
+                media.url if media else None,
+                media.thumb_url if media else None,
+                f"{int(t * 1000)}{media.ext}" if media else None,
+                media.size if media else None,
+                media.dimensions if media else None,
+                media.md5 if media else None,
+                json.dumps(metadata),
+            ))
+        thread_rows.append((op_no, task.board_id, _ts(ts[0]), _ts(ts[-1]), _ts(bumped), len(ts) - 1, images))
+        image_total += images
+    return thread_rows, post_rows, image_total
+
+
+# ── driver ───────────────────────────────────────────────────────
+
+
+def _placeholder(rng: random.Random, width: int, height: int, ext: str) -> bytes:
+    """A small image: flat background plus a few rectangles (compresses to a few KB)."""
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(2, 6)):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = rng.randint(x0, width), rng.randint(y0, height)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    if ext == ".png":
+        img.save(buf, format="PNG", optimize=True)
+    else:
+        img.save(buf, format="JPEG", quality=60)
+    return buf.getvalue()
+
+
+class Synthesizer:
+    """Seed boards with synthetic threads through a Harvester's database and storage.
+
+    With *placeholders*, the media pool is real: small generated images
+    are stored (thumbnails included) like harvested files.  Without, pool
+    rows point at ``synth/`` keys that hold no objects, which is enough for
+    page and API load tests but shows up as missing in ``reconcile``.
+    """
+
+    def __init__(
+        self,
+        harvester: Harvester,
+        params: SynthParams,
+        *,
+        media_pool: int = 1000,
+        placeholders: bool = False,
+        workers: int | None = None,
+    ) -> None:
+        if placeholders and harvester.storage is None:
+            raise ValueError("placeholder media needs a storage backend (images are disabled)")
+        self.h = harvester
+        self.params = params
+        self.media_pool = media_pool
+        self.placeholders = placeholders
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = {"boards": 0, "threads": 0, "posts": 0, "images": 0, "media": 0}
+
+    def run(self, boards: list[str]) -> dict:
+        """Generate *params.threads* threads on every board; returns the stats dict."""
+        db = self.h.db
+        pool = self._build_pool()
+        board_ids = {slug: db.ensure_board(slug) for slug in boards}
+        tasks = self._plan(boards, board_ids, db.max_post_no() + 1)
+        total = sum(t.threads for t in tasks)
+        done = 0
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(db.cfg, pool, self.params),
+        ) as executor:
+            for future in as_completed([executor.submit(_run_task, t) for t in tasks]):
+                threads, posts, images = future.result()
+                done += threads
+                self.stats["threads"] += threads
+                self.stats["posts"] += posts
+                self.stats["images"] += images
+                logger.info("Synth: %d/%d threads", done, total)
+        for task in tasks:
+            db.advance_post_counter(task.board_id, task.first_no + self._post_count(task) - 1)
+        db.commit()
+        self.stats["boards"] = len(boards)
+        return self.stats
+
+    def _post_count(self, task: _Task) -> int:
+        rng = _task_rng(self.params.seed, task.board_slug, task.chunk)
+        return sum(_reply_counts(rng, task.threads, self.params.replies_median)) + task.threads
+
+    def _plan(self, boards: list[str], board_ids: dict[str, int], first_no: int) -> list[_Task]:
+        """Split boards into chunks with disjoint time windows and post number ranges."""
+        p = self.params
+        t0 = p.start.timestamp()
+        chunks = max(math.ceil(p.threads / p.chunk), 1)
+        window = p.days * 86400 / chunks
+        tasks = []
+        for slug in boards:
+            remaining = p.threads
+            for c in range(chunks):
+                n = min(p.chunk, remaining)
+                remaining -= n
+                task = _Task(slug, board_ids[slug], c, n, first_no, t0 + c * window, t0 + (c + 1) * window)
+                first_no += self._post_count(task)
+                tasks.append(task)
+        return tasks
+
+    def _build_pool(self) -> list[PoolMedia]:
+        """Create (or find again) the shared media pool."""
+        h, db = self.h, self.h.db
+        rng = random.Random(f"{self.params.seed}:media")
+        pool: list[PoolMedia] = []
+        for i in range(self.media_pool):
+            width, height = rng.choice(_SIZES)
+            ext = ".png" if rng.random() < 0.2 else ".jpg"
+            mime = "image/png" if ext == ".png" else "image/jpeg"
+            if self.placeholders:
+                assert h.storage is not None
+                data = _placeholder(rng, width, height, ext)
+                existing = db.media_hash_exists(h.storage.sha256(data))
+                if existing:
+                    info = {
+                        "hash_sha256": existing["hash_sha256"], "file_size": existing["file_size"],
+                        "media_url": f"{h._url_prefix}/{existing['storage_key']}",
+                        "thumb_url": f"{h._url_prefix}/{existing['thumb_key']}" if existing["thumb_key"] else None,
+                    }
+                    media_id, thumbs = existing["id"], db.media_thumbnails(existing["id"])
+                else:
+                    info = h.storage.upload(data, ext, generate_thumb=h.cfg.generate_thumbnails)
+                    media_id = db.insert_media_object(
+                        hash_sha256=info["hash_sha256"], mime_type=mime, file_size=info["file_size"],
+                        width=width, height=height, storage_key=info["storage_key"],
+                        thumb_key=info["thumb_key"], original_filename=f"synth{i}{ext}",
+                    )
+                    thumbs = info["thumbnails"]
+                    db.insert_media_thumbnails(media_id, thumbs)
+                sha, size = info["hash_sha256"], info["file_size"]
+                url, thumb_url, refs = info["media_url"], info["thumb_url"], h._thumbnail_refs(thumbs)
+                md5 = hashlib.md5(data).digest()
+            else:
+                sha = hashlib.sha256(f"{self.params.seed}:media:{i}".encode()).hexdigest()
+                size = rng.randint(20_000, 3_000_000)
+                key = f"synth/{sha}{ext}"
+                media_id = db.insert_media_object(
+                    hash_sha256=sha, mime_type=mime, file_size=size, width=width, height=height,
+                    storage_key=key, original_filename=f"synth{i}{ext}",
+                )
+                url, thumb_url, refs = f"{h._url_prefix}/{key}", None, None
+                md5 = hashlib.md5(sha.encode()).digest()
+            pool.append(PoolMedia(
+                str(media_id), url, thumb_url, ext, size, f"{width}x{height}",
+                base64.b64encode(md5).decode(), refs,
+            ))
+        db.commit()
+        self.stats["media"] = len(pool)
+        return pool